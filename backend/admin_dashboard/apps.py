@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AdminDashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'admin_dashboard'
+
+    def ready(self):
+        # Stored image reference counts must see every save and delete,
+        # including those from management commands
+        from . import media  # noqa: F401
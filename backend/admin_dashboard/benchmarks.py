@@ -0,0 +1,513 @@
+"""
+Benchmarks run by `python manage.py benchmark <name>... | all`.
+
+Each benchmark receives a `report(label, **values)` callback and builds its
+own fixtures. Benchmarks only measure; the behaviour they exercise is
+checked by the test suite (admin_dashboard/tests.py). The management command wraps every run in a transaction that
+is rolled back, so nothing is left behind in the database. Benchmarks that
+need several connections to see their fixtures (e.g. the connection pool
+benchmark) are registered with transactional=False and clean up after
+themselves.
+"""
+import asyncio
+import io
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.jwt_auth import CachedJWTAuthentication, user_cache
+from authentication.models import FCMToken
+from . import push as push_module
+from .dbpool import pool_stats
+from .models import Category, Deal, Order, OrderItem, Product, ProductImage, PushOutbox, Review, User, UserOrderCounter
+from .orders import order_history, serialize_order
+from .product_cache import product_cache_key
+from .push import FakeTransport, dispatcher, enqueue_push, set_transport
+from .realtime import OrderEventHub
+from .renderers import ORJSONParser, ORJSONRenderer
+from .serializers import OrderSerializer
+from .stats import compute_stats, get_stats
+
+BENCHMARKS = {}
+
+
+def benchmark(name, transactional=True):
+    def register(func):
+        func.transactional = transactional
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def timed_get(client, url, **extra):
+    """GET url and return (response, elapsed_ms, query_count)"""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = client.get(url, **extra)
+        elapsed = (time.perf_counter() - start) * 1000
+    return response, elapsed, len(queries)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(int(round(fraction * len(ordered))) - 1, 0)]
+
+
+def create_products(count, categories=5, prefix='Bench product'):
+    cats = [Category.objects.create(name=f'Bench category {i}') for i in range(categories)]
+    Product.objects.bulk_create([
+        Product(
+            title=f'{prefix} {i}',
+            price=Decimal('100.00') + i,
+            description=f'Description for {prefix.lower()} {i}',
+            category=cats[i % categories],
+            stock_quantity=100,
+        )
+        for i in range(count)
+    ], batch_size=1000)
+    return cats
+
+
+@benchmark('catalog')
+def catalog(report, sizes=(10, 100, 1000)):
+    """product_list_api query count and latency as the catalog grows"""
+    client = Client()
+    created = 0
+    for size in sizes:
+        create_products(size - created, prefix=f'Catalog {size}')
+        created = size
+        _, full_ms, full_queries = timed_get(client, '/api/products/')
+        _, page_ms, page_queries = timed_get(client, '/api/products/?limit=20')
+        report(
+            f'catalog size={size}',
+            full_queries=full_queries,
+            full_ms=round(full_ms, 1),
+            page_queries=page_queries,
+            page_ms=round(page_ms, 1),
+        )
+
+
+@benchmark('order_numbering')
+def order_numbering(report, existing_orders=(10, 1000, 5000), new_orders=50):
+    """Cost of numbering a new order for users with many existing orders"""
+    for count in existing_orders:
+        user = User.objects.create_user(username=f'bench-orders-{count}', email=f'bench-orders-{count}@example.com')
+        Order.objects.bulk_create([
+            Order(user=user, amount=Decimal('10.00'), user_order_number=n)
+            for n in range(1, count + 1)
+        ], batch_size=1000)
+        UserOrderCounter.objects.create(user=user, last_number=count)
+
+        # The old scheme: COUNT(*) over all of the user's orders per insert
+        start = time.perf_counter()
+        for _ in range(new_orders):
+            Order.objects.filter(user=user).count()
+        count_ms = (time.perf_counter() - start) * 1000 / new_orders
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(new_orders):
+                with transaction.atomic():
+                    UserOrderCounter.next_number(user)
+            counter_ms = (time.perf_counter() - start) * 1000 / new_orders
+
+        report(
+            f'user with {count} orders',
+            count_ms=round(count_ms, 3),
+            counter_ms=round(counter_ms, 3),
+            queries_per_order=len(queries) // new_orders,
+        )
+
+
+class UnregisteredError(Exception):
+    """Stands in for firebase_admin.messaging.UnregisteredError"""
+
+
+@benchmark('push')
+def push(report, tokens=1200, dead_tokens=200, notifications=20):
+    """Outbox batching, dedupe and dead token pruning against the fake FCM transport"""
+    transport = FakeTransport()
+    previous = push_module._transport
+    set_transport(transport)
+    try:
+        user = User.objects.create_user(username='bench-push', email='bench-push@example.com')
+        FCMToken.objects.bulk_create([FCMToken(user=user, token=f'bench-token-{i}') for i in range(tokens)])
+        transport.failing_tokens = {f'bench-token-{i}': UnregisteredError() for i in range(dead_tokens)}
+
+        fan_out = []
+        start = time.perf_counter()
+        for i in range(notifications):
+            enqueue_push(user, 'Bench', f'Notification {i}', dedupe_key=f'bench:{i}')
+            # Same event queued twice, as the order and notification signals do
+            enqueue_push(user, 'Bench', f'Notification {i}', dedupe_key=f'bench:{i}')
+            sent_before = sum(len(call['tokens']) for call in transport.sent)
+            dispatcher.dispatch_due()
+            fan_out.append(sum(len(call['tokens']) for call in transport.sent) - sent_before)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        report(
+            f'{notifications} notifications x {tokens} tokens ({dead_tokens} dead)',
+            queued=PushOutbox.objects.filter(user=user).count(),
+            multicasts=len(transport.sent),
+            largest_multicast=max(len(call['tokens']) for call in transport.sent),
+            first_fan_out=fan_out[0],
+            last_fan_out=fan_out[-1],
+            dispatch_ms=round(elapsed, 1),
+        )
+    finally:
+        set_transport(previous)
+
+
+@benchmark('order_stream', transactional=False)
+def order_stream(report, waiters=1000):
+    """Wake-up latency of parked order status long polls"""
+    hub = OrderEventHub()
+    cursor = hub.cursor()
+
+    async def park_all(ready):
+        tasks = [asyncio.ensure_future(hub.wait(user_id, cursor, 30)) for user_id in range(waiters)]
+        while hub.waiter_count() < waiters:
+            await asyncio.sleep(0.01)
+        ready.set()
+        return await asyncio.gather(*tasks)
+
+    ready = threading.Event()
+    results = []
+    loop_thread = threading.Thread(target=lambda: results.extend(asyncio.run(park_all(ready))))
+    loop_thread.start()
+    ready.wait()
+
+    # Publish from this thread, as the Order post_save handler does from request threads
+    start = time.perf_counter()
+    for user_id in range(waiters):
+        hub.publish(user_id, {'id': str(user_id), 'status': 'shipped'})
+    loop_thread.join()
+    elapsed = (time.perf_counter() - start) * 1000
+
+    woken = sum(1 for batch in results if len(batch.events) == 1)
+    report(f'{waiters} parked polls', woken=woken, wake_all_ms=round(elapsed, 1),
+           per_event_us=round(elapsed * 1000 / waiters, 1))
+
+
+@benchmark('stats')
+def stats(report, orders=1_000_000, batch_size=10_000):
+    """Dashboard statistics: per-model COUNTs + Python revenue sum vs one cached query"""
+    statuses = [value for value, _ in Order.STATUS_CHOICES]
+    for start in range(0, orders, batch_size):
+        Order.objects.bulk_create([
+            Order(amount=Decimal(10 + i % 90), status=statuses[i % len(statuses)])
+            for i in range(start, min(start + batch_size, orders))
+        ], batch_size=batch_size)
+
+    with CaptureQueriesContext(connection) as queries:
+        begin = time.perf_counter()
+        {
+            'total_users': User.objects.count(),
+            'total_categories': Category.objects.count(),
+            'total_products': Product.objects.count(),
+            'total_deals': Deal.objects.count(),
+            'total_orders': Order.objects.count(),
+            'completed_orders': Order.objects.filter(status='delivered').count(),
+            'pending_orders': Order.objects.filter(status='pending').count(),
+            'total_revenue': sum(order.amount for order in Order.objects.all()),
+        }
+        legacy_ms = (time.perf_counter() - begin) * 1000
+    legacy_queries = len(queries)
+
+    with CaptureQueriesContext(connection) as queries:
+        begin = time.perf_counter()
+        compute_stats()
+        query_ms = (time.perf_counter() - begin) * 1000
+    stats_queries = len(queries)
+
+    get_stats()
+    begin = time.perf_counter()
+    for _ in range(100):
+        get_stats()
+    cached_us = (time.perf_counter() - begin) * 1e6 / 100
+
+    report(
+        f'{orders} orders',
+        legacy_queries=legacy_queries,
+        legacy_ms=round(legacy_ms, 1),
+        stats_queries=stats_queries,
+        stats_ms=round(query_ms, 1),
+        cached_us=round(cached_us, 1),
+    )
+
+
+@benchmark('product_detail')
+def product_detail(report, images=8, reviews=50, requests=200):
+    """product_detail_api queries and latency, with and without the product cache"""
+    create_products(1, categories=1, prefix='Detail')
+    product = Product.objects.latest('id')
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image=f'products/gallery/bench_{i}.jpg', is_primary=i == 0)
+        for i in range(images)
+    ])
+    users = User.objects.bulk_create([
+        User(username=f'detail_bench_{i}', email=f'detail_bench_{i}@example.com') for i in range(reviews)
+    ])
+    Review.objects.bulk_create([
+        Review(product=product, user=user, rating=1 + i % 5, comment='Bench review') for i, user in enumerate(users)
+    ])
+    Product.rebuild_ratings(Product.objects.filter(id=product.id))
+
+    client = Client()
+    url = f'/api/products/{product.id}/details/'
+    key = product_cache_key(product.id)
+    for label, cached in [('uncached', False), ('cached', True)]:
+        cache.delete(key)
+        client.get(url)
+        timings, query_counts = [], set()
+        for _ in range(requests):
+            if not cached:
+                cache.delete(key)
+            _, elapsed, queries = timed_get(client, url)
+            timings.append(elapsed)
+            query_counts.add(queries)
+        report(
+            label,
+            queries=max(query_counts),
+            p50_ms=round(percentile(timings, 0.5), 2),
+            p99_ms=round(percentile(timings, 0.99), 2),
+        )
+
+
+@benchmark('order_history')
+def order_history_benchmark(report, sizes=(1, 10, 100), items_per_order=3):
+    """Order history queries and serialization time as a buyer's order count grows"""
+    create_products(items_per_order, categories=1, prefix='History')
+    products = list(Product.objects.filter(title__startswith='History').order_by('id'))
+    user = User.objects.create_user(username='bench-history', email='bench-history@example.com')
+    client = Client()
+    client.force_login(user)
+
+    created = 0
+    for size in sizes:
+        orders = Order.objects.bulk_create([
+            Order(user=user, amount=Decimal('30.00'), user_order_number=n)
+            for n in range(created + 1, size + 1)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product_id=str(product.id), product_ref=product, title=product.title,
+                quantity=1, price=product.price, image_url='https://example.com/item.jpg',
+            )
+            for order in orders for product in products
+        ])
+        created = size
+
+        legacy_orders = Order.objects.filter(user=user).order_by('-date_time')
+        with CaptureQueriesContext(connection) as legacy_captured:
+            start = time.perf_counter()
+            OrderSerializer(legacy_orders, many=True).data
+            legacy_ms = (time.perf_counter() - start) * 1000
+
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            for order in order_history(legacy_orders):
+                serialize_order(order)
+            read_ms = (time.perf_counter() - start) * 1000
+
+        _, list_ms, list_queries = timed_get(client, '/api/orders/list/')
+        _, page_ms, page_queries = timed_get(client, '/api/orders/list/?limit=20')
+        report(
+            f'user with {size} orders',
+            serializer_queries=len(legacy_captured),
+            serializer_ms=round(legacy_ms, 1),
+            read_model_queries=len(captured),
+            read_model_ms=round(read_ms, 1),
+            http_queries=list_queries,
+            http_ms=round(list_ms, 1),
+            page_queries=page_queries,
+            page_ms=round(page_ms, 1),
+        )
+
+
+@benchmark('json')
+def json_rendering(report, products=10_000, rounds=5):
+    """Rendering and parsing a 10k product payload with DRF's json module and with orjson"""
+    now = timezone.now()
+    rows = [
+        Product(
+            id=i, title=f'JSON product {i}', price=Decimal('19.99') + i, description='Description ' * 10,
+            image=f'products/json_{i}.jpg', stock_quantity=i % 50, created_at=now - timedelta(minutes=i),
+        )
+        for i in range(1, products + 1)
+    ]
+
+    def legacy_payload():
+        # What views did for DRF's encoder: convert every value by hand
+        return {'products': [{
+            'id': product.id,
+            'title': product.title,
+            'price': float(product.price),
+            'description': product.description,
+            'image_url': product.image.url if product.image else None,
+            'stock_quantity': product.stock_quantity,
+            'created_at': product.created_at.isoformat(),
+        } for product in rows]}
+
+    def native_payload():
+        return {'products': [{
+            'id': product.id,
+            'title': product.title,
+            'price': product.price,
+            'description': product.description,
+            'image_url': product.image,
+            'stock_quantity': product.stock_quantity,
+            'created_at': product.created_at,
+        } for product in rows]}
+
+    def best(func):
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            result = func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return result, min(timings)
+
+    def compare(label, drf, fast, **values):
+        drf_result, drf_ms = best(drf)
+        fast_result, fast_ms = best(fast)
+        report(
+            f'{label} {products} products',
+            json_ms=round(drf_ms, 1),
+            orjson_ms=round(fast_ms, 1),
+            speedup=round(drf_ms / fast_ms, 1),
+            **values,
+        )
+        return drf_result, fast_result
+
+    legacy = legacy_payload()
+    drf_bytes, _ = compare(
+        'render', lambda: JSONRenderer().render(legacy), lambda: ORJSONRenderer().render(legacy),
+        kb=len(JSONRenderer().render(legacy)) // 1024,
+    )
+    compare(
+        'build and render',
+        lambda: JSONRenderer().render(legacy_payload()),
+        lambda: ORJSONRenderer().render(native_payload()),
+    )
+    compare(
+        'parse', lambda: JSONParser().parse(io.BytesIO(drf_bytes)), lambda: ORJSONParser().parse(io.BytesIO(drf_bytes)),
+    )
+
+
+@benchmark('db_pool', transactional=False)
+def db_pool(report, threads=8, requests_per_thread=250):
+    """Requests per second on a one-query endpoint with and without connection reuse (PostgreSQL only)"""
+    if connection.vendor != 'postgresql':
+        report('skipped', reason=f'needs PostgreSQL, the database is {connection.vendor}')
+        return
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    # Every thread's connection shares this dict, so changing it switches modes
+    settings_dict = connection.settings_dict
+    original = {key: settings_dict[key] for key in ['CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'OPTIONS']}
+    options = {key: value for key, value in original['OPTIONS'].items() if key != 'pool'}
+    modes = [
+        ('new connection per request', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': options}),
+        ('persistent connections', {'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': options}),
+    ]
+    if is_psycopg3 and find_spec('psycopg_pool'):
+        pool = {'min_size': threads, 'max_size': threads}
+        modes.append(('pool', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True, 'OPTIONS': {**options, 'pool': pool}}))
+    else:
+        report('pool skipped', reason='needs psycopg 3 and psycopg_pool')
+
+    user = User.objects.create_user(username='bench-db-pool', email='bench-db-pool@example.com')
+    # bulk_create sends no post_save, so the push thread stays asleep while pools are swapped
+    order, = Order.objects.bulk_create([Order(user=user, amount=Decimal('10.00'), user_order_number=1)])
+    url = f'/dashboard/api/orders/status/{order.id}/'
+    connection.close()
+
+    def worker(barrier, timings, failures):
+        client = Client()
+        barrier.wait()
+        try:
+            for _ in range(requests_per_thread):
+                start = time.perf_counter()
+                # The test client skips the handler's connection housekeeping
+                close_old_connections()
+                response = client.get(url)
+                close_old_connections()
+                timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+        finally:
+            connection.close()
+
+    try:
+        for label, values in modes:
+            connection.close_pool()
+            settings_dict.update(values)
+            timings, failures = [], []
+            barrier = threading.Barrier(threads + 1)
+            workers = [threading.Thread(target=worker, args=(barrier, timings, failures)) for _ in range(threads)]
+            for thread in workers:
+                thread.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            extra = {}
+            if 'pool' in values['OPTIONS']:
+                stats = pool_stats()
+                extra = {'avg_wait_ms': stats['avg_wait_ms'], 'connections': stats['connections_num']}
+            report(
+                label,
+                req_s=round(len(timings) / elapsed),
+                p50_ms=round(percentile(timings, 0.5), 2),
+                p99_ms=round(percentile(timings, 0.99), 2),
+                failed=len(failures),
+                **extra,
+            )
+    finally:
+        connection.close_pool()
+        settings_dict.update(original)
+        connection.close()
+        user.delete()
+
+
+@benchmark('auth')
+def auth(report, requests=1000):
+    """Queries and time per JWT-authenticated request, with and without the user cache"""
+    user = User.objects.create_user(username='bench-auth', email='bench-auth@example.com')
+    header = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+    request = RequestFactory().get('/api/orders/status-updates/', **header)
+    user_cache.clear()
+
+    for authentication in [JWTAuthentication, CachedJWTAuthentication]:
+        authenticator = authentication()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(requests):
+                authenticator.authenticate(request)
+            elapsed = time.perf_counter() - start
+        report(
+            authentication.__name__,
+            queries=len(queries),
+            us_per_request=round(elapsed * 1_000_000 / requests, 1),
+        )
+
+    client = Client()
+    client.get('/api/orders/status-updates/', **header)
+    _, _, polling_queries = timed_get(client, '/api/orders/status-updates/', **header)
+    report('order_status_updates poll', queries=polling_queries)
@@ -0,0 +1,98 @@
+"""
+Cart sync.
+
+The app sends its whole cart on every change. Instead of replacing the
+stored cart, sync_cart() diffs it against the current CartItem rows. It
+then writes only what changed: one upsert for new and changed lines and
+one DELETE for removed lines, in a single transaction.
+
+Reading a cart joins each line to its product through CartItem.product_ref;
+load_cart_products() fetches any lines that are not linked yet in one
+batch instead of one query per line.
+"""
+from collections import Counter
+
+from django.db import transaction
+
+from .models import Cart, CartItem, Product, link_products
+
+
+class CartDiff:
+    def __init__(self, inserted, updated, removed):
+        self.inserted = inserted  # {product_id: quantity}
+        self.updated = updated    # {product_id: quantity}
+        self.removed = removed    # [product_id]
+
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.removed)
+
+
+def normalize_items(items):
+    """
+    Turn the app's [{'product_id', 'quantity'}] into {product_id: quantity}.
+
+    Product ids are compared as strings (CartItem.product_id is a
+    CharField). Duplicate lines are merged, and lines with a quantity of
+    zero or less are dropped.
+    """
+    quantities = Counter()
+    for item in items:
+        quantities[str(item['product_id'])] += int(item['quantity'])
+    return {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+
+
+def diff_cart(current, desired):
+    """Compare {product_id: quantity} maps and return a CartDiff"""
+    inserted = {pid: qty for pid, qty in desired.items() if pid not in current}
+    updated = {pid: qty for pid, qty in desired.items() if pid in current and current[pid] != qty}
+    removed = [pid for pid in current if pid not in desired]
+    return CartDiff(inserted, updated, removed)
+
+
+def sync_cart(user, items):
+    """Make user's cart match items; returns the applied CartDiff"""
+    desired = normalize_items(items)
+    with transaction.atomic():
+        # Lock the cart row so concurrent syncs of the same cart serialize
+        cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+        current = dict(cart.items.values_list('product_id', 'quantity'))
+        diff = diff_cart(current, desired)
+
+        upserts = {**diff.inserted, **diff.updated}
+        if upserts:
+            lines = [CartItem(cart=cart, product_id=pid, quantity=qty) for pid, qty in upserts.items()]
+            link_products(lines)
+            CartItem.objects.bulk_create(
+                lines,
+                update_conflicts=True,
+                unique_fields=['cart', 'product_id'],
+                # Also links existing lines that predate product_ref
+                update_fields=['quantity', 'product_ref'],
+            )
+        if diff.removed:
+            cart.items.filter(product_id__in=diff.removed).delete()
+    return diff
+
+
+def load_cart_products(items):
+    """
+    Map each CartItem's product_id to its Product.
+
+    Lines fetched with select_related('product_ref') cost nothing; the
+    rest are loaded with a single id__in query. Lines whose product no
+    longer exists are left out.
+    """
+    products = {}
+    unlinked = []
+    for item in items:
+        if item.product_ref_id is not None:
+            products[item.product_id] = item.product_ref
+        elif str(item.product_id).isdigit():
+            unlinked.append(item)
+    if unlinked:
+        found = Product.objects.in_bulk({int(item.product_id) for item in unlinked})
+        for item in unlinked:
+            product = found.get(int(item.product_id))
+            if product is not None:
+                products[item.product_id] = product
+    return products
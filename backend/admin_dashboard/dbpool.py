@@ -0,0 +1,48 @@
+"""
+Database connection reuse.
+
+settings.py gives every web worker process a psycopg_pool connection pool
+(DATABASE_POOL) when psycopg 3 and psycopg_pool are installed. Without
+them, each thread keeps its connection for DATABASE_CONN_MAX_AGE seconds.
+Either way, CONN_HEALTH_CHECKS makes Django check a reused connection
+before handing it out, so a connection dropped by Postgres or a proxy
+costs a reconnect instead of a failed request.
+
+pool_stats() reports the pool's size and how long requests waited for a
+connection. A high wait time or a growing requests_waiting count means
+max_size is too small for the worker's threads.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# psycopg_pool only reports counters that are not zero
+POOL_COUNTERS = [
+    'requests_num', 'requests_queued', 'requests_wait_ms', 'requests_errors',
+    'usage_ms', 'connections_num', 'connections_ms', 'connections_errors', 'connections_lost', 'returns_bad',
+]
+
+
+def connection_pool(alias=DEFAULT_DB_ALIAS):
+    """The psycopg_pool ConnectionPool of a database, or None if it is not pooled"""
+    return getattr(connections[alias], 'pool', None)
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS):
+    settings_dict = connections[alias].settings_dict
+    pool = connection_pool(alias)
+    if pool is None:
+        return {
+            'pooled': False,
+            'conn_max_age': settings_dict['CONN_MAX_AGE'],
+            'health_checks': settings_dict['CONN_HEALTH_CHECKS'],
+        }
+
+    stats = pool.get_stats()
+    result = {'pooled': True, 'health_checks': settings_dict['CONN_HEALTH_CHECKS']}
+    for key in ['pool_min', 'pool_max', 'pool_size', 'pool_available', 'requests_waiting']:
+        result[key] = stats.get(key, 0)
+    for key in POOL_COUNTERS:
+        result[key] = stats.get(key, 0)
+    requests = result['requests_num']
+    result['avg_wait_ms'] = round(result['requests_wait_ms'] / requests, 3) if requests else None
+    result['avg_usage_ms'] = round(result['usage_ms'] / requests, 3) if requests else None
+    return result
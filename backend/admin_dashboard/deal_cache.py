@@ -0,0 +1,172 @@
+"""
+Cache for /api/deals/active/.
+
+The set of active deals only changes at a deal's start_date or end_date,
+or when an admin edits a deal, product or category. ActiveDealCache keeps
+every deal that is active or pending in an index sorted by start_date. It
+answers "which deals are running at t" and "when does that set change
+next", and keeps the rendered response bytes until that next boundary.
+
+Image URLs in the response are absolute. They are built from
+settings.DEAL_CACHE_BASE_URL if set, so every request shares one cached
+response; otherwise responses are cached per scheme and host, for at most
+DEAL_CACHE_MAX_HOSTS hosts (the oldest is dropped first). Stock quantities in the payload also change through conditional UPDATEs
+that send no signals, so a cached response is also dropped after
+DEAL_CACHE_MAX_AGE seconds.
+"""
+import threading
+from bisect import bisect_right
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Category, Deal, Product
+from .replicas import primary_reads
+from .renderers import dumps
+
+# end_date is inclusive, so a deal stops matching just after it
+AFTER = timedelta(microseconds=1)
+
+
+def serialize_deal(deal):
+    """Deal payload without the host-dependent image URL"""
+    product = deal.product
+    return {
+        'id': str(deal.id),
+        'discount_percentage': deal.discount_percentage,
+        'discount_price': deal.discount_price,
+        'start_date': deal.start_date,
+        'end_date': deal.end_date,
+        'product': {
+            'id': str(product.id),
+            'title': product.title,
+            'price': product.price,
+            'description': product.description,
+            'image_url': product.image.url if product.image else None,
+            'category': {
+                'id': product.category.id,
+                'name': product.category.name,
+                'icon': product.category.icon
+            },
+            'stock_quantity': product.stock_quantity,
+            'is_new': product.is_new,
+            'is_on_sale': True,
+            'sale_price': deal.discount_price,
+        }
+    }
+
+
+class DealIntervals:
+    """Active deals sorted by start_date, for point-in-time lookups"""
+
+    def __init__(self, deals):
+        self.deals = sorted(deals, key=lambda deal: deal.start_date)
+        self.starts = [deal.start_date for deal in self.deals]
+
+    def at(self, moment):
+        """Return (deals running at moment, moment the result next changes)"""
+        started = bisect_right(self.starts, moment)
+        running = [deal for deal in self.deals[:started] if deal.end_date >= moment]
+        boundaries = [deal.end_date + AFTER for deal in running]
+        if started < len(self.starts):
+            boundaries.append(self.starts[started])
+        return running, min(boundaries, default=None)
+
+
+class ActiveDealCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._intervals = None
+        self._loaded_at = None
+        self._payloads = {}
+        # base URL -> (bytes, valid_from, valid_until)
+        self._responses = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._intervals = None
+            self._payloads = {}
+            self._responses = {}
+            self.invalidations += 1
+
+    def _load(self, now):
+        with primary_reads():
+            deals = list(
+                Deal.objects.filter(is_active=True, end_date__gte=now)
+                .select_related('product', 'product__category')
+            )
+        self._intervals = DealIntervals(deals)
+        self._payloads = {deal.id: serialize_deal(deal) for deal in deals}
+
+    def _render(self, base, deals):
+        data = []
+        for deal in deals:
+            payload = dict(self._payloads[deal.id])
+            product = dict(payload['product'])
+            if product['image_url']:
+                product['image_url'] = urljoin(base, product['image_url'])
+            payload['product'] = product
+            data.append(payload)
+        return dumps({'deals': data})
+
+    def get(self, request, now=None):
+        """Return (response bytes, hit) for the deals active now"""
+        now = now or timezone.now()
+        base = getattr(settings, 'DEAL_CACHE_BASE_URL', None) or request.build_absolute_uri('/')
+        max_age = timedelta(seconds=getattr(settings, 'DEAL_CACHE_MAX_AGE', 60))
+        with self._lock:
+            cached = self._responses.get(base)
+            if cached:
+                content, valid_from, valid_until = cached
+                if valid_from <= now < valid_until:
+                    self.hits += 1
+                    return content, True
+
+            self.misses += 1
+            if self._intervals is None or not self._loaded_at <= now < self._loaded_at + max_age:
+                self._load(now)
+                self._loaded_at = now
+                self._responses = {}
+            running, boundary = self._intervals.at(now)
+            content = self._render(base, running)
+            valid_until = self._loaded_at + max_age
+            if boundary:
+                valid_until = min(valid_until, boundary)
+            # Hosts come from the request, so keep only the most recent few
+            self._responses.pop(base, None)
+            self._responses[base] = (content, now, valid_until)
+            while len(self._responses) > getattr(settings, 'DEAL_CACHE_MAX_HOSTS', 8):
+                del self._responses[next(iter(self._responses))]
+            return content, False
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'cached_hosts': len(self._responses),
+            }
+
+
+deal_cache = ActiveDealCache()
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_deal_cache(sender, **kwargs):
+    transaction.on_commit(deal_cache.invalidate)
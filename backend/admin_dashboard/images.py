@@ -0,0 +1,198 @@
+"""
+Resized image derivatives.
+
+Uploads (Product.image, ProductImage.image, User.profile_image) are often
+4K originals. For each upload a WebP and a JPEG are generated at every
+width in IMAGE_DERIVATIVE_WIDTHS, bounding the longer side. They are
+stored next to the original under derivatives/<original name>/<width>.<ext>.
+The model's *_derivatives JSONField records the stored names together with
+the original they were made from:
+
+    {'source': 'products/2025/05/05/a.jpg',
+     'sizes': {'160': {'webp': '...', 'jpeg': '...'}, ...}}
+
+A post_save handler notices a new upload and, once the transaction
+commits, hands the resizing to a process pool of IMAGE_DERIVATIVE_WORKERS
+processes. With 0 workers it runs inline. Until the derivatives are
+recorded, or if they were made from a different original,
+thumbnail_urls() returns nothing and clients use the original. Rows
+sharing a content-addressed upload (see storage.py) share its derivatives,
+so they are rendered once.
+`manage.py generate_image_derivatives` backfills existing media.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+
+from .models import Product, ProductImage, User
+from .storage import is_content_name
+from .thumbnails import render_derivatives
+
+FORMATS = ('webp', 'jpeg')
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+# model -> (image field, derivatives field)
+IMAGE_FIELDS = {
+    Product: ('image', 'image_derivatives'),
+    ProductImage: ('image', 'image_derivatives'),
+    User: ('profile_image', 'profile_image_derivatives'),
+}
+
+
+def derivative_widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (160, 480, 1080)))
+
+
+def derivative_name(source, width, fmt):
+    root = source.rsplit('.', 1)[0]
+    return f'derivatives/{root}/{width}.{EXTENSIONS[fmt]}'
+
+
+def thumbnail_urls(file, derivatives, request=None):
+    """
+    {width: {format: url}} for the derivatives of file, or {} if they do
+    not exist (yet). URLs are absolute when a request is given.
+    """
+    if not file or not derivatives or derivatives.get('source') != file.name:
+        return {}
+    url = request.build_absolute_uri if request else (lambda path: path)
+    return {
+        width: {fmt: url(default_storage.url(name)) for fmt, name in formats.items()}
+        for width, formats in derivatives.get('sizes', {}).items()
+    }
+
+
+def store_derivatives(model, pk, source, rendered):
+    """Save rendered derivatives and record them, unless the upload changed meanwhile"""
+    sizes = {}
+    for width, encoded in sorted(rendered.items()):
+        sizes[str(width)] = {}
+        for fmt, content in encoded.items():
+            name = derivative_name(source, width, fmt)
+            # Replace rather than let the storage pick a new name
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            sizes[str(width)][fmt] = default_storage.save(name, ContentFile(content))
+    return record_derivatives(model, pk, source, {'source': source, 'sizes': sizes})
+
+
+def record_derivatives(model, pk, source, derivatives):
+    field, derivatives_field = IMAGE_FIELDS[model]
+    previous = model.objects.filter(pk=pk).values_list(derivatives_field, flat=True).first() or {}
+    updated = model.objects.filter(pk=pk, **{field: source}).update(**{derivatives_field: derivatives})
+
+    # Derivatives of the upload this one replaced. Content-addressed uploads
+    # can be shared; theirs are deleted with the file (see media.py).
+    if updated and not is_content_name(previous.get('source')):
+        current = {name for formats in derivatives['sizes'].values() for name in formats.values()}
+        for formats in previous.get('sizes', {}).values():
+            for name in formats.values():
+                if name not in current:
+                    default_storage.delete(name)
+
+    # queryset.update() sends no signals; product_cache imports the serializers, which import this module
+    from .product_cache import invalidate_products
+    if updated and model is Product:
+        invalidate_products([pk])
+    elif updated and model is ProductImage:
+        invalidate_products(model.objects.filter(pk=pk).values_list('product_id', flat=True))
+    return updated
+
+
+def delete_derivatives(source):
+    for width in derivative_widths():
+        for fmt in FORMATS:
+            name = derivative_name(source, width, fmt)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+
+
+def shared_derivatives(source):
+    """Derivatives another row already has for the same content-addressed file"""
+    if not is_content_name(source):
+        return None
+    for model, (field, derivatives_field) in IMAGE_FIELDS.items():
+        derivatives = (
+            model.objects.filter(**{f'{derivatives_field}__source': source})
+            .values_list(derivatives_field, flat=True).first()
+        )
+        if derivatives:
+            return derivatives
+    return None
+
+
+def read_source(source):
+    with default_storage.open(source, 'rb') as f:
+        return f.read()
+
+
+class DerivativeWorker:
+    """Renders derivatives in a process pool and stores them from this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self, workers):
+        with self._lock:
+            if self._pool is None:
+                # spawn: forked children would share the parent's DB connections and locks
+                self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def submit(self, model, pk, source):
+        shared = shared_derivatives(source)
+        if shared:
+            return record_derivatives(model, pk, source, shared)
+
+        workers = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+        try:
+            data = read_source(source)
+        except OSError as e:
+            print(f"Cannot read {source} for derivatives: {str(e)}")
+            return None
+        if not workers:
+            return store_derivatives(model, pk, source, render_derivatives(data, derivative_widths(), FORMATS))
+
+        future = self._get_pool(workers).submit(render_derivatives, data, derivative_widths(), FORMATS)
+        future.add_done_callback(lambda done: self._store(model, pk, source, done))
+        return future
+
+    def _store(self, model, pk, source, future):
+        try:
+            store_derivatives(model, pk, source, future.result())
+        except Exception as e:
+            print(f"Error generating derivatives for {source}: {str(e)}")
+        finally:
+            close_old_connections()
+
+
+derivative_worker = DerivativeWorker()
+
+
+def needs_derivatives(instance):
+    field, derivatives_field = IMAGE_FIELDS[type(instance)]
+    file = getattr(instance, field)
+    derivatives = getattr(instance, derivatives_field) or {}
+    return bool(file) and derivatives.get('source') != file.name
+
+
+def schedule_derivatives(sender, instance, **kwargs):
+    """post_save: generate derivatives for a new upload after commit"""
+    field, derivatives_field = IMAGE_FIELDS[sender]
+    file = getattr(instance, field)
+    if needs_derivatives(instance):
+        source = file.name
+        transaction.on_commit(lambda: derivative_worker.submit(sender, instance.pk, source))
+    elif not file and getattr(instance, derivatives_field):
+        sender.objects.filter(pk=instance.pk).update(**{derivatives_field: {}})
+
+
+for model in IMAGE_FIELDS:
+    post_save.connect(schedule_derivatives, sender=model, dispatch_uid=f'derivatives_{model.__name__}')
@@ -0,0 +1,77 @@
+"""
+Stock reservation for orders.
+
+Stock is decremented with one conditional UPDATE per product
+(`SET stock_quantity = stock_quantity - n WHERE stock_quantity >= n`), so
+concurrent checkouts can never oversell or overwrite each other's counts.
+Callers are expected to run these helpers inside transaction.atomic() so
+that a failed reservation rolls back everything done before it.
+Cached product details of the affected products are dropped on commit.
+"""
+from collections import Counter
+
+from django.db.models import F
+
+from .models import Product
+from .product_cache import invalidate_products
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Insufficient stock for product(s): {', '.join(map(str, product_ids))}")
+
+
+def quantities_by_product(items):
+    """Sum quantities per integer product id, skipping ids that are not numeric"""
+    quantities = Counter()
+    for item in items:
+        try:
+            product_id = int(item['product_id'])
+        except (TypeError, ValueError):
+            print(f"Skipping stock update for non-numeric product ID {item['product_id']}")
+            continue
+        quantities[product_id] += int(item['quantity'])
+    return quantities
+
+
+def reserve_stock(quantities):
+    """
+    Decrement stock for {product_id: quantity}.
+
+    Products that do not exist are skipped (as before), but if any existing
+    product does not have enough stock InsufficientStock is raised; the
+    caller's transaction must then be rolled back.
+    """
+    failed = []
+    # Update rows in a stable order so concurrent reservations lock
+    # products in the same sequence and cannot deadlock
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        if quantity <= 0:
+            continue
+        updated = Product.objects.filter(id=product_id, stock_quantity__gte=quantity).update(
+            stock_quantity=F('stock_quantity') - quantity
+        )
+        if not updated:
+            failed.append(product_id)
+
+    if failed:
+        existing = sorted(Product.objects.filter(id__in=failed).values_list('id', flat=True))
+        missing = set(failed) - set(existing)
+        for product_id in missing:
+            print(f"Product with ID {product_id} not found when updating stock")
+        if existing:
+            raise InsufficientStock(existing)
+    invalidate_products(quantities)
+
+
+def release_stock(quantities):
+    """Return previously reserved stock for {product_id: quantity}"""
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        if quantity <= 0:
+            continue
+        if not Product.objects.filter(id=product_id).update(stock_quantity=F('stock_quantity') + quantity):
+            print(f"Product with ID {product_id} not found when restoring stock")
+    invalidate_products(quantities)
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from admin_dashboard.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against the current database (fixtures are removed afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='+', help=f'Benchmarks to run, or "all". Available: {", ".join(BENCHMARKS)}')
+        parser.add_argument(
+            '--yes-i-know', action='store_true',
+            help='Run even though DEBUG is off (benchmarks write fixtures to the configured database)',
+        )
+
+    def handle(self, *args, **options):
+        # Some benchmarks commit their fixtures and load the database heavily
+        if not settings.DEBUG and not options['yes_i_know']:
+            raise CommandError(
+                f'Refusing to benchmark {connection.settings_dict["NAME"]} with DEBUG off; '
+                f'pass --yes-i-know if this is not a production database'
+            )
+        names = list(BENCHMARKS) if options['names'] == ['all'] else options['names']
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmarks: {", ".join(unknown)}')
+
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'[{name}] {BENCHMARKS[name].__doc__}'))
+            if BENCHMARKS[name].transactional:
+                with transaction.atomic():
+                    BENCHMARKS[name](self.report)
+                    transaction.set_rollback(True)
+            else:
+                BENCHMARKS[name](self.report)
+
+    def report(self, label, **values):
+        details = '  '.join(f'{key}={value}' for key, value in values.items())
+        self.stdout.write(f'  {label:<32} {details}')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.push import compact_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete quarantined (and, if FCM_TOKEN_STALE_DAYS is set, stale) FCM tokens'
+
+    def handle(self, *args, **options):
+        deleted = compact_tokens()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} FCM tokens'))
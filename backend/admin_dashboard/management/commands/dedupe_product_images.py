@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.media import COUNTED_FIELDS, rebuild_counts
+from admin_dashboard.storage import is_content_name, product_image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Move product images with upload names to content-addressed storage, merging identical files, '
+        'and recount references'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be merged')
+
+    def handle(self, *args, **options):
+        storage = product_image_storage()
+        dry_run = options['dry_run']
+        moved = 0
+        legacy = {}  # upload name -> size
+        content = {}  # content name -> size
+
+        for model, field in COUNTED_FIELDS.items():
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            for instance in rows.iterator():
+                file = getattr(instance, field)
+                name = file.name
+                if is_content_name(name):
+                    continue
+                if not storage.exists(name):
+                    self.stderr.write(f'{model.__name__} {instance.pk}: {name} is missing')
+                    continue
+                with storage.open(name, 'rb') as f:
+                    content_name = storage.content_name(name, f) if dry_run else storage.save(name, f)
+                legacy[name] = content[content_name] = storage.size(name)
+                moved += 1
+                if not dry_run:
+                    # post_save counts the reference and schedules thumbnails
+                    file.name = content_name
+                    instance.save(update_fields=[field])
+
+        if not dry_run:
+            for name in legacy:
+                if not any(model.objects.filter(**{field: name}).exists() for model, field in COUNTED_FIELDS.items()):
+                    storage.delete(name)
+            # Also repairs counts of rows saved while the signal handlers were not connected
+            rebuild_counts()
+
+        saved = sum(legacy.values()) - sum(content.values())
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {moved} images in {len(legacy)} files to {len(content)} content-addressed files, '
+            f'saving {saved / 1024 / 1024:.1f} MB'
+        ))
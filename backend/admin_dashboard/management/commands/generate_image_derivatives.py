@@ -0,0 +1,64 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.images import FORMATS, IMAGE_FIELDS, derivative_widths, read_source, store_derivatives
+from admin_dashboard.thumbnails import render_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails (image derivatives) for existing uploads that do not have them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Also regenerate up-to-date derivatives')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Worker processes (default: IMAGE_DERIVATIVE_WORKERS, at least 1)'
+        )
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, (field, derivatives_field) in IMAGE_FIELDS.items():
+            rows = (
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .values_list('pk', field, derivatives_field)
+            )
+            for pk, source, derivatives in rows.iterator():
+                if options['force'] or (derivatives or {}).get('source') != source:
+                    jobs.append((model, pk, source))
+
+        workers = options['workers'] or max(getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2), 1)
+        self.stdout.write(f'Generating derivatives for {len(jobs)} images with {workers} workers')
+
+        generated = failed = 0
+        pending = {}
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            for model, pk, source in jobs:
+                try:
+                    data = read_source(source)
+                except OSError as e:
+                    self.stderr.write(f'{model.__name__} {pk}: cannot read {source}: {e}')
+                    failed += 1
+                    continue
+                pending[pool.submit(render_derivatives, data, derivative_widths(), FORMATS)] = (model, pk, source)
+                # Only a few originals are held in memory at a time
+                while len(pending) >= workers * 2:
+                    generated, failed = self._collect(pending, generated, failed)
+            while pending:
+                generated, failed = self._collect(pending, generated, failed)
+
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives for {generated} images, {failed} failed'))
+
+    def _collect(self, pending, generated, failed):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            model, pk, source = pending.pop(future)
+            try:
+                store_derivatives(model, pk, source, future.result())
+                generated += 1
+            except Exception as e:
+                self.stderr.write(f'{model.__name__} {pk}: {source}: {e}')
+                failed += 1
+        return generated, failed
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.rating_sum/rating_count from approved reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help='Only rebuild these products (default: all)')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(id__in=options['product_ids'])
+        updated = Product.rebuild_ratings(products)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products'))
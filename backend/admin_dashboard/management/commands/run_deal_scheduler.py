@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.tasks import deal_scheduler, update_deal_statuses
+
+
+class Command(BaseCommand):
+    help = 'Apply deal start/end boundaries as they pass (use with DEAL_SCHEDULER = "command")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Apply the boundaries that have passed and exit')
+        parser.add_argument('--max-sleep', type=float, default=None, help='Longest wait between runs, in seconds')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            boundary = update_deal_statuses()
+            self.stdout.write(self.style.SUCCESS(f'Deal statuses updated; next boundary: {boundary or "none"}'))
+            return
+
+        self.stdout.write('Deal scheduler started')
+        deal_scheduler.run_forever(max_sleep=options['max_sleep'])
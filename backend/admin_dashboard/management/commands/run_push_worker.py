@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from admin_dashboard.push import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued FCM push notifications (use with PUSH_WORKER = "command")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due notifications and exit')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds between outbox polls')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            handled = 0
+            while True:
+                count = dispatcher.dispatch_due()
+                if not count:
+                    break
+                handled += count
+            self.stdout.write(self.style.SUCCESS(f'Dispatched {handled} notification(s)'))
+            return
+
+        self.stdout.write('Push worker started')
+        dispatcher.run_forever(poll_interval=options['poll_interval'])
@@ -0,0 +1,89 @@
+"""
+Reference counting for content-addressed product images.
+
+Several Product/ProductImage rows can point at the same stored file (see
+storage.py). Each row that starts using a content-addressed name
+increments its MediaBlob.ref_count. A row that drops the name (new
+upload, cleared image, deletion) decrements it. Once the transaction
+commits, a blob whose count reached zero is deleted together with its
+file and thumbnails. Files with legacy upload names are not counted and
+are deleted by the storage as before.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+
+from .images import delete_derivatives
+from .models import MediaBlob, Product, ProductImage
+from .storage import CONTENT_PREFIX, is_content_name
+
+COUNTED_FIELDS = {Product: 'image', ProductImage: 'image'}
+
+
+def _storage():
+    return Product._meta.get_field('image').storage
+
+
+def acquire(name):
+    if not is_content_name(name):
+        return
+    blob, created = MediaBlob.objects.get_or_create(
+        name=name, defaults={'size': _storage().size(name) if _storage().exists(name) else 0}
+    )
+    MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release(name):
+    if not is_content_name(name):
+        return
+    MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: purge_if_unused(name))
+
+
+def purge_if_unused(name):
+    """Delete the blob, its file and its thumbnails if nothing references it any more"""
+    deleted, _ = MediaBlob.objects.filter(name=name, ref_count=0).delete()
+    if deleted:
+        _storage().purge(name)
+        delete_derivatives(name)
+    return bool(deleted)
+
+
+def rebuild_counts():
+    """Recompute every MediaBlob.ref_count from the rows, then purge unused blobs"""
+    references = {}
+    for model, field in COUNTED_FIELDS.items():
+        rows = (
+            model.objects.filter(**{f'{field}__startswith': CONTENT_PREFIX + '/'})
+            .order_by().values(field).annotate(count=Count('pk'))
+        )
+        for row in rows:
+            references[row[field]] = references.get(row[field], 0) + row['count']
+    for name in references:
+        MediaBlob.objects.get_or_create(name=name, defaults={'size': _storage().size(name) if _storage().exists(name) else 0})
+    for blob in MediaBlob.objects.all():
+        count = references.get(blob.name, 0)
+        if blob.ref_count != count:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=count)
+        if not count:
+            purge_if_unused(blob.name)
+    return len(references)
+
+
+def count_references(sender, instance, created, **kwargs):
+    field = COUNTED_FIELDS[sender]
+    if created:
+        acquire(getattr(instance, field).name)
+    elif instance.tracker.has_changed(field):
+        previous = instance.tracker.previous(field)
+        release(getattr(previous, 'name', previous))
+        acquire(getattr(instance, field).name)
+
+
+def release_reference(sender, instance, **kwargs):
+    release(getattr(instance, COUNTED_FIELDS[sender]).name)
+
+
+for model in COUNTED_FIELDS:
+    post_save.connect(count_references, sender=model, dispatch_uid=f'media_{model.__name__}_save')
+    post_delete.connect(release_reference, sender=model, dispatch_uid=f'media_{model.__name__}_delete')
@@ -1,5 +1,8 @@
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.deprecation import MiddlewareMixin
+
+from .replicas import pin_to_primary, replicas
 
 class AdminAccessMiddleware:
     def __init__(self, get_response):
@@ -11,4 +14,16 @@ class AdminAccessMiddleware:
                 return redirect('admin_login')
             if not request.user.is_staff:
                 return redirect('admin_dashboard:dashboard')
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+class ReplicaStickinessMiddleware(MiddlewareMixin):
+    """Pin users who send a write request to the primary database (see replicas.py)"""
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def process_response(self, request, response):
+        if request.method not in self.SAFE_METHODS and replicas():
+            # DRF copies the user it authenticated (e.g. from a JWT) onto the request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                pin_to_primary(user.id)
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # The GIN/tsvector index only exists on PostgreSQL; other backends use
+    # the in-process fallback in admin_dashboard.search.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_search_idx ON admin_dashboard_product USING GIN (("
+        "setweight(to_tsvector('english'::regconfig, COALESCE(title, '')), 'A') || "
+        "setweight(to_tsvector('english'::regconfig, COALESCE(description, '')), 'B')"
+        "))"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS product_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_dashboard', '0022_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_order_numbers(apps, schema_editor):
+    """
+    Renumber the orders of users whose numbers collided (the old COUNT(*)+1
+    scheme reused numbers after deletions) and seed each user's counter.
+    """
+    Order = apps.get_model('admin_dashboard', 'Order')
+    UserOrderCounter = apps.get_model('admin_dashboard', 'UserOrderCounter')
+
+    orders_by_user = {}
+    for order in Order.objects.filter(user__isnull=False).order_by('user_id', 'id').only('id', 'user_id', 'user_order_number'):
+        orders_by_user.setdefault(order.user_id, []).append(order)
+
+    renumbered = []
+    counters = []
+    for user_id, orders in orders_by_user.items():
+        numbers = [order.user_order_number for order in orders]
+        if None in numbers or len(set(numbers)) != len(numbers):
+            for number, order in enumerate(orders, start=1):
+                if order.user_order_number != number:
+                    order.user_order_number = number
+                    renumbered.append(order)
+            last_number = len(orders)
+        else:
+            last_number = max(numbers)
+        counters.append(UserOrderCounter(user_id=user_id, last_number=last_number))
+
+    Order.objects.bulk_update(renumbered, ['user_order_number'], batch_size=1000)
+    UserOrderCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_dashboard', '0024_product_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserOrderCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_order_numbers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+# Trigram indexes for the admin order search. The expressions must match
+# what `KeyTextTransform(...)__icontains` compiles to on PostgreSQL:
+# UPPER((delivery_info ->> 'key')::text) LIKE UPPER('%term%')
+TRIGRAM_INDEXES = {
+    'order_delivery_name_trgm': 'name',
+    'order_delivery_phone_trgm': 'phone_number',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Other backends fall back to a sequential scan
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, key in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON admin_dashboard_order "
+            f"USING GIN ((UPPER((delivery_info ->> '{key}')::text)) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_dashboard', '0028_delta_sync'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-date_time', '-id'], name='order_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', '-date_time', '-id'], name='order_status_date_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_existing_items(apps, schema_editor):
+    # One UPDATE per distinct product id, so it stays cheap for large tables
+    Product = apps.get_model('admin_dashboard', 'Product')
+    for model_name in ['CartItem', 'OrderItem']:
+        model = apps.get_model('admin_dashboard', model_name)
+        unlinked = model.objects.filter(product_ref__isnull=True)
+        values = unlinked.order_by().values_list('product_id', flat=True).distinct()
+        numeric = {value: int(value) for value in values if value.isdigit()}
+        existing = set(Product.objects.filter(id__in=numeric.values()).values_list('id', flat=True))
+        for value, product_id in numeric.items():
+            if product_id in existing:
+                unlinked.filter(product_id=value).update(product_ref_id=product_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin_dashboard', '0029_order_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='product_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='admin_dashboard.product'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='admin_dashboard.product'),
+        ),
+        migrations.RunPython(link_existing_items, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,17 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from model_utils.models import TimeStampedModel
 from model_utils import FieldTracker
-from django.db.models.signals import post_save
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .storage import product_image_storage
+
 User = get_user_model()
 
 class Category(models.Model):
@@ -31,14 +36,29 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     description = models.TextField()
-    image = models.ImageField(upload_to='products/%Y/%m/%d/', null=True, blank=True)
+    # Stored by content hash, see storage.py
+    image = models.ImageField(upload_to='products/%Y/%m/%d/', storage=product_image_storage, null=True, blank=True)
+    # Resized copies of image, see images.py
+    image_derivatives = models.JSONField(default=dict, blank=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     is_new = models.BooleanField(default=False)
     is_on_sale = models.BooleanField(default=False)
     stock_quantity = models.PositiveIntegerField(default=0)
+    # Denormalized totals over approved reviews, kept in sync by the Review
+    # signal handlers below and rebuilt by `manage.py rebuild_ratings`
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    tracker = FieldTracker(fields=['image'])
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog (product_list_api)
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -64,20 +84,42 @@ class Product(models.Model):
 
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / reviews.count()
+        if self.rating_count:
+            return self.rating_sum / self.rating_count
         return 0
     
     @property
     def review_count(self):
-        return self.reviews.count()
+        return self.rating_count
+
+    @classmethod
+    def adjust_rating(cls, product_id, rating_delta, count_delta):
+        """Atomically apply a delta to a product's rating aggregates"""
+        if rating_delta or count_delta:
+            cls.objects.filter(id=product_id).update(
+                rating_sum=models.F('rating_sum') + rating_delta,
+                rating_count=models.F('rating_count') + count_delta,
+            )
+
+    @classmethod
+    def rebuild_ratings(cls, queryset=None):
+        """Recompute rating aggregates from approved reviews in a single UPDATE"""
+        approved = Review.objects.filter(product=models.OuterRef('pk'), is_approved=True).order_by().values('product')
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.update(
+            rating_sum=Coalesce(models.Subquery(approved.annotate(total=models.Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(models.Subquery(approved.annotate(total=models.Count('id')).values('total')), 0),
+        )
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='products/gallery/%Y/%m/%d/', null=True, blank=True)
+    image = models.ImageField(upload_to='products/gallery/%Y/%m/%d/', storage=product_image_storage, null=True, blank=True)
+    # Resized copies of image, see images.py
+    image_derivatives = models.JSONField(default=dict, blank=True)
     is_primary = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    tracker = FieldTracker(fields=['image'])
     
     class Meta:
         ordering = ['-is_primary', 'created_at']
@@ -153,25 +195,82 @@ class Order(models.Model):
     delivery_info = models.JSONField(default=dict)
     items_data = models.JSONField(default=list)
     user_order_number = models.PositiveIntegerField(null=True, blank=True)
+    # Drives `?since=` delta sync (see admin_dashboard/sync.py)
+    updated_at = models.DateTimeField(auto_now=True)
     
     # Add the tracker
     tracker = FieldTracker(fields=['status'])
     
     class Meta:
         ordering = ['id']  # Change to ascending order
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'user_order_number'], name='unique_user_order_number'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='order_user_updated_idx'),
+            # Admin order list: newest first, optionally by status
+            models.Index(fields=['-date_time', '-id'], name='order_date_id_idx'),
+            models.Index(fields=['status', '-date_time', '-id'], name='order_status_date_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         # If this is a new order and has a user
         if not self.id and self.user:
-            # Get the count of existing orders for this user
-            user_order_count = Order.objects.filter(user=self.user).count()
-            # Assign the next number in sequence (1-based)
-            self.user_order_number = user_order_count + 1
+            # Take the next number from the user's counter row in the same
+            # transaction as the insert, so a failed insert does not use up
+            # a number and concurrent orders cannot get the same one
+            with transaction.atomic():
+                self.user_order_number = UserOrderCounter.next_number(self.user)
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
+class OrderTombstone(models.Model):
+    """Records deleted orders so delta sync can tell clients to drop them"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='order_tombstones')
+    order_id = models.IntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='order_tombstone_user_idx'),
+            models.Index(fields=['deleted_at'], name='order_tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} deleted at {self.deleted_at}"
+
+class MediaBlob(models.Model):
+    """A content-addressed image file and how many rows reference it (see media.py)"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+class UserOrderCounter(models.Model):
+    """Last user_order_number handed out to each user"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='order_counter')
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} - {self.last_number}"
+
+    @classmethod
+    def next_number(cls, user):
+        """Increment and return the user's counter; must be called inside a transaction"""
+        counter, _ = cls.objects.select_for_update().get_or_create(user=user)
+        counter.last_number += 1
+        counter.save(update_fields=['last_number'])
+        return counter.last_number
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product_id = models.CharField(max_length=100)
+    # Indexed FK mirroring product_id; see link_products()
+    product_ref = models.ForeignKey(Product, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
     title = models.CharField(max_length=255)
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -180,6 +279,10 @@ class OrderItem(models.Model):
     class Meta:
         ordering = ['id']
 
+    def save(self, *args, **kwargs):
+        link_products([self])
+        super().save(*args, **kwargs)
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
         ('ORDER_STATUS', 'Order Status Update'),
@@ -193,6 +296,8 @@ class Notification(models.Model):
     order_id = models.IntegerField(null=True, blank=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Drives `?since=` delta sync (see admin_dashboard/sync.py)
+    updated_at = models.DateTimeField(auto_now=True)
     notification_type = models.CharField(
         max_length=20,
         choices=NOTIFICATION_TYPES,
@@ -201,6 +306,46 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='notification_user_updated_idx'),
+        ]
+
+class PushOutbox(models.Model):
+    """
+    A push notification waiting to be delivered through FCM.
+
+    Rows are written in the request's transaction and delivered later by
+    admin_dashboard.push.PushDispatcher, so requests never wait on FCM.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='push_outbox')
+    # Identical events (e.g. the order post_save and the ORDER_STATUS
+    # Notification for the same status change) share a key and are sent
+    # once; the key is cleared when the row is delivered or gives up
+    dedupe_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    data = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='push_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} -> {self.user_id} ({self.status})"
 
 class Review(models.Model):
     RATING_CHOICES = [(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5')]
@@ -213,9 +358,16 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     reported = models.BooleanField(default=False)  # New field to track reported reviews
     report_reason = models.TextField(blank=True, null=True)  # Optional reason for report
+
+    tracker = FieldTracker(fields=['rating', 'is_approved'])
     
     class Meta:
         unique_together = ('product', 'user')  # One review per product per user
+        indexes = [
+            # Review pages per product (see reviews.py): newest first, and by rating
+            models.Index(fields=['product', 'is_approved', '-created_at'], name='review_product_recent_idx'),
+            models.Index(fields=['product', 'is_approved', '-rating', '-created_at'], name='review_product_rating_idx'),
+        ]
         
     def __str__(self):
         return f"{self.user.username}'s review on {self.product.title}"
@@ -242,6 +394,8 @@ class Cart(models.Model):
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product_id = models.CharField(max_length=100)
+    # Indexed FK mirroring product_id; see link_products()
+    product_ref = models.ForeignKey(Product, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
     quantity = models.PositiveIntegerField(default=1)
     
     class Meta:
@@ -250,6 +404,33 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x Product {self.product_id} in {self.cart}"
 
+    def save(self, *args, **kwargs):
+        link_products([self])
+        super().save(*args, **kwargs)
+
+
+def link_products(items):
+    """
+    Set product_ref on CartItems/OrderItems from their product_id string,
+    with one query for the whole batch. Call it before bulk_create(), which
+    skips save().
+
+    product_id predates product_ref and is still what the app sends, so
+    both are kept. Ids that are not numeric or name no existing product
+    leave product_ref empty. Once every row is linked (migration 0030
+    backfills existing ones), product_id can be dropped and product_ref
+    renamed to product.
+    """
+    pending = {}
+    for item in items:
+        if item.product_ref_id is None and str(item.product_id).isdigit():
+            pending.setdefault(int(item.product_id), []).append(item)
+    if not pending:
+        return
+    for product_id in Product.objects.filter(id__in=pending).values_list('id', flat=True):
+        for item in pending[product_id]:
+            item.product_ref_id = product_id
+
 @receiver(post_save, sender=Order)
 def order_post_save(sender, instance, created, **kwargs):
     """Send notification when order status changes"""
@@ -261,3 +442,28 @@ def order_post_save(sender, instance, created, **kwargs):
         send_order_status_notification(instance)
     else:
         print(f"Order {instance.id} status did not change")
+
+@receiver(post_delete, sender=Order)
+def order_post_delete(sender, instance, **kwargs):
+    """Leave a tombstone for delta sync and expire old ones"""
+    if instance.user_id:
+        OrderTombstone.objects.create(user_id=instance.user_id, order_id=instance.id)
+    retention = timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30))
+    OrderTombstone.objects.filter(deleted_at__lt=timezone.now() - retention).delete()
+
+@receiver(post_save, sender=Review)
+def review_post_save(sender, instance, created, **kwargs):
+    """Keep Product.rating_sum/rating_count in step with approved reviews"""
+    was_approved = False if created else instance.tracker.previous('is_approved')
+    old_rating = int(instance.tracker.previous('rating') or 0) if was_approved else 0
+    new_rating = int(instance.rating) if instance.is_approved else 0
+    Product.adjust_rating(
+        instance.product_id,
+        new_rating - old_rating,
+        int(bool(instance.is_approved)) - int(bool(was_approved)),
+    )
+
+@receiver(post_delete, sender=Review)
+def review_post_delete(sender, instance, **kwargs):
+    if instance.is_approved:
+        Product.adjust_rating(instance.product_id, -int(instance.rating), -1)
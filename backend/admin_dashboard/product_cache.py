@@ -0,0 +1,89 @@
+"""
+Product detail responses.
+
+build_product_detail() serializes a product with ProductSerializer from
+two queries: the product and its prefetched images. The rating fields come
+from the denormalized rating_sum/rating_count columns, so no reviews are
+read. The payload is cached per product with relative image URLs, which are
+made absolute per request, so one entry serves every host. The same goes
+for the thumbnail URLs (see images.py).
+
+Product, ProductImage and Review writes, stock reservations and the deal
+scheduler's sale price updates drop a product's entry once they commit.
+That only reaches every web process through a shared cache backend (see
+CACHES in settings.py); with a per-process cache such as LocMemCache, other
+workers serve the old entry for up to PRODUCT_CACHE_TIMEOUT seconds.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product, ProductImage, Review
+from .replicas import primary_reads
+from .serializers import ProductSerializer
+
+
+def product_cache_key(product_id):
+    return f'admin_dashboard:product:{product_id}'
+
+
+def build_product_detail(product_id):
+    """Serialize a product with relative image URLs, or None if it does not exist"""
+    product = Product.objects.prefetch_related('images').filter(id=product_id).first()
+    if product is None:
+        return None
+    data = ProductSerializer(product).data
+    return {**data, 'images': [dict(image) for image in data['images']]}
+
+
+def absolute_urls(data, request):
+    def absolute(url):
+        return request.build_absolute_uri(url) if url else url
+
+    def absolute_thumbnails(thumbnails):
+        return {width: {fmt: absolute(url) for fmt, url in formats.items()} for width, formats in thumbnails.items()}
+
+    return {
+        **data,
+        'image_url': absolute(data['image_url']),
+        'thumbnails': absolute_thumbnails(data['thumbnails']),
+        'images': [
+            {**image, 'image_url': absolute(image['image_url']), 'thumbnails': absolute_thumbnails(image['thumbnails'])}
+            for image in data['images']
+        ],
+    }
+
+
+def get_product_detail(product_id, request):
+    """Cached product detail payload for request's host, or None if the product does not exist"""
+    key = product_cache_key(product_id)
+    data = cache.get(key)
+    if data is None:
+        with primary_reads():
+            data = build_product_detail(product_id)
+        if data is None:
+            return None
+        cache.set(key, data, getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300))
+    return absolute_urls(data, request)
+
+
+def invalidate_products(product_ids):
+    keys = [product_cache_key(product_id) for product_id in product_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    invalidate_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_of(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
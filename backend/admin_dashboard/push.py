@@ -0,0 +1,376 @@
+"""
+Asynchronous FCM push delivery.
+
+Views and signal handlers call enqueue_push(), which only writes a
+PushOutbox row. After the surrounding transaction commits, a
+PushDispatcher drains the outbox in the background. Depending on
+settings.PUSH_WORKER it runs as a daemon thread started by the WSGI/ASGI
+application ('thread', the default) or in `manage.py run_push_worker`
+('command').
+
+The dispatcher merges due messages with identical content into multicasts
+of at most PUSH_BATCH_SIZE tokens and retries failed sends with exponential
+backoff. The transport is pluggable (settings.PUSH_TRANSPORT), so tests and
+benchmarks can use FakeTransport instead of Firebase.
+
+Per-token results feed back into FCMToken. Tokens FCM reports as
+unregistered are deleted straight away. Transient failures are counted,
+and a token that fails FCM_TOKEN_MAX_FAILURES times in a row is
+quarantined, i.e. skipped when sending. compact_tokens(), run periodically
+by the dispatcher and by `manage.py compact_fcm_tokens`, deletes
+quarantined tokens that were not re-registered in time.
+"""
+import json
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from authentication.models import FCMToken
+from .models import PushOutbox
+
+# FCM rejects multicasts with more than 500 tokens
+MAX_MULTICAST_TOKENS = 500
+
+
+# firebase_admin.messaging errors meaning the token will never work again.
+# Matched by class name so this module doesn't need firebase_admin.
+DEAD_TOKEN_ERRORS = {'UnregisteredError', 'SenderIdMismatchError'}
+
+
+def get_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_dead_token_error(error, payload_accepted):
+    """
+    True if error means the token should be dropped.
+
+    INVALID_ARGUMENT is returned both for malformed tokens and for bad
+    payloads, so it only condemns the token if FCM accepted the same
+    payload for another token in the multicast.
+    """
+    name = type(error).__name__
+    if name in DEAD_TOKEN_ERRORS:
+        return True
+    return name == 'InvalidArgumentError' and payload_accepted
+
+
+def record_token_results(tokens, results):
+    """
+    Update FCMToken health from one multicast's per-token results.
+
+    Dead tokens are deleted, other failures are counted (quarantining the
+    token after FCM_TOKEN_MAX_FAILURES in a row) and a delivery resets the
+    count. Returns (deleted, quarantined).
+    """
+    payload_accepted = any(error is None for error in results)
+    delivered, dead, failing = [], [], []
+    for token, error in zip(tokens, results):
+        if error is None:
+            delivered.append(token)
+        elif is_dead_token_error(error, payload_accepted):
+            dead.append(token)
+        else:
+            failing.append(token)
+
+    deleted = quarantined = 0
+    if dead:
+        deleted, _ = FCMToken.objects.filter(token__in=dead).delete()
+        print(f"Removed {deleted} dead FCM token(s)")
+    if failing:
+        FCMToken.objects.filter(token__in=failing).update(
+            failure_count=F('failure_count') + 1, last_failure_at=timezone.now()
+        )
+        quarantined = FCMToken.objects.filter(
+            token__in=failing, is_active=True,
+            failure_count__gte=get_setting('FCM_TOKEN_MAX_FAILURES', 5),
+        ).update(is_active=False)
+        if quarantined:
+            print(f"Quarantined {quarantined} failing FCM token(s)")
+    if delivered:
+        FCMToken.objects.filter(token__in=delivered, failure_count__gt=0).update(
+            failure_count=0, last_failure_at=None
+        )
+    return deleted, quarantined
+
+
+def compact_tokens(now=None):
+    """
+    Delete quarantined tokens older than FCM_TOKEN_QUARANTINE_DAYS, and, if
+    FCM_TOKEN_STALE_DAYS is set, tokens the app hasn't re-registered for
+    that long. Returns the number of tokens deleted.
+    """
+    now = now or timezone.now()
+    condition = Q(
+        is_active=False,
+        last_failure_at__lt=now - timedelta(days=get_setting('FCM_TOKEN_QUARANTINE_DAYS', 7)),
+    )
+    stale_days = get_setting('FCM_TOKEN_STALE_DAYS', None)
+    if stale_days:
+        condition |= Q(updated_at__lt=now - timedelta(days=stale_days))
+    deleted, _ = FCMToken.objects.filter(condition).delete()
+    return deleted
+
+
+class FirebaseTransport:
+    """Sends multicasts through firebase_admin.messaging"""
+
+    def send_multicast(self, tokens, title, body, data):
+        """Return one entry per token: None on success, otherwise the exception"""
+        from firebase_admin import messaging
+
+        message = messaging.MulticastMessage(
+            tokens=list(tokens),
+            notification=messaging.Notification(title=title, body=body),
+            data={key: str(value) for key, value in data.items()},
+            android=messaging.AndroidConfig(
+                priority='high',
+                notification=messaging.AndroidNotification(
+                    icon='ic_notification',
+                    color='#2196F3',
+                    channel_id='order_updates',
+                ),
+            ),
+            apns=messaging.APNSConfig(
+                payload=messaging.APNSPayload(
+                    aps=messaging.Aps(
+                        badge=1,
+                        sound='default',
+                    ),
+                ),
+            ),
+        )
+        # send_multicast was removed in newer firebase_admin releases
+        send = getattr(messaging, 'send_each_for_multicast', None) or messaging.send_multicast
+        response = send(message)
+        return [None if resp.success else resp.exception for resp in response.responses]
+
+
+class FakeTransport:
+    """
+    In-memory transport for tests and benchmarks.
+
+    Records every multicast in `sent`. Tokens listed in `failing_tokens`
+    map to the exception returned for them; `raise_error` makes the whole
+    call fail, as a network error would.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.failing_tokens = {}
+        self.raise_error = None
+
+    def send_multicast(self, tokens, title, body, data):
+        if self.raise_error:
+            raise self.raise_error
+        self.sent.append({'tokens': list(tokens), 'title': title, 'body': body, 'data': data})
+        return [self.failing_tokens.get(token) for token in tokens]
+
+
+_transport = None
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        _transport = import_string(get_setting('PUSH_TRANSPORT', 'admin_dashboard.push.FirebaseTransport'))()
+    return _transport
+
+
+def set_transport(transport):
+    """Swap the transport, e.g. for a FakeTransport in tests"""
+    global _transport
+    _transport = transport
+
+
+def enqueue_push(user, title, body, data=None, dedupe_key=None):
+    """
+    Queue a push notification for user.
+
+    Returns the PushOutbox row, or None if a row with the same dedupe_key
+    already exists.
+    """
+    if user is None:
+        return None
+    try:
+        with transaction.atomic():
+            entry = PushOutbox.objects.create(
+                user=user,
+                title=title,
+                body=body,
+                data=data or {},
+                dedupe_key=dedupe_key,
+            )
+    except IntegrityError:
+        print(f"Skipping duplicate push notification {dedupe_key}")
+        return None
+    transaction.on_commit(dispatcher.wake)
+    return entry
+
+
+class PushDispatcher:
+    """Drains PushOutbox; see the module docstring"""
+
+    # How long a claimed row is hidden from other workers while it is sent
+    LEASE = timedelta(seconds=60)
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_compaction = None
+
+    def wake(self):
+        if get_setting('PUSH_WORKER', 'thread') == 'thread':
+            self.start()
+        self._wakeup.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='push-dispatcher', daemon=True)
+                self._thread.start()
+
+    def run_forever(self, poll_interval=None):
+        poll_interval = poll_interval or get_setting('PUSH_POLL_INTERVAL', 30)
+        while True:
+            self._wakeup.wait(poll_interval)
+            self._wakeup.clear()
+            try:
+                while self.dispatch_due():
+                    pass
+                self.compact_if_due()
+            except Exception as e:
+                print(f"Error dispatching push notifications: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def compact_if_due(self):
+        """Run compact_tokens() at most every PUSH_TOKEN_COMPACT_INTERVAL seconds"""
+        now = timezone.now()
+        interval = timedelta(seconds=get_setting('PUSH_TOKEN_COMPACT_INTERVAL', 6 * 60 * 60))
+        if self._last_compaction and now - self._last_compaction < interval:
+            return 0
+        self._last_compaction = now
+        deleted = compact_tokens(now)
+        if deleted:
+            print(f"Compacted {deleted} FCM token(s)")
+        return deleted
+
+    def claim_due(self, limit):
+        """Lease up to limit due rows to this worker and return them"""
+        now = timezone.now()
+        with transaction.atomic():
+            entries = list(
+                PushOutbox.objects.select_for_update(skip_locked=True)
+                .filter(status='pending', next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:limit]
+            )
+            if entries:
+                PushOutbox.objects.filter(id__in=[entry.id for entry in entries]).update(
+                    next_attempt_at=now + self.LEASE
+                )
+        return entries
+
+    def dispatch_due(self, limit=None):
+        """Send one batch of due notifications; returns the number of rows handled"""
+        batch_size = get_setting('PUSH_BATCH_SIZE', MAX_MULTICAST_TOKENS)
+        entries = self.claim_due(limit or batch_size)
+        if not entries:
+            return 0
+
+        tokens_by_user = {}
+        for user_id, token in FCMToken.objects.filter(
+            user_id__in={entry.user_id for entry in entries}, is_active=True
+        ).values_list('user_id', 'token'):
+            tokens_by_user.setdefault(user_id, []).append(token)
+
+        # Entries with identical content share multicasts
+        groups = {}
+        for entry in entries:
+            key = (entry.title, entry.body, json.dumps(entry.data, sort_keys=True))
+            groups.setdefault(key, []).append(entry)
+
+        for (title, body, _), group in groups.items():
+            self._send_group(title, body, group[0].data, group, tokens_by_user, min(batch_size, MAX_MULTICAST_TOKENS))
+        return len(entries)
+
+    def _send_group(self, title, body, data, entries, tokens_by_user, batch_size):
+        targets = []
+        with_tokens = []
+        no_tokens = []
+        for entry in entries:
+            tokens = tokens_by_user.get(entry.user_id, [])
+            if tokens:
+                targets.extend((entry, token) for token in tokens)
+                with_tokens.append(entry)
+            else:
+                no_tokens.append(entry)
+
+        if no_tokens:
+            # Nothing to deliver to; don't keep retrying
+            print(f"No FCM tokens found for {len(no_tokens)} queued notification(s)")
+            self._mark_sent(no_tokens)
+
+        delivered = set()
+        errors = {}
+        for start in range(0, len(targets), batch_size):
+            chunk = targets[start:start + batch_size]
+            try:
+                results = get_transport().send_multicast([token for _, token in chunk], title, body, data)
+            except Exception as e:
+                print(f"Error sending FCM multicast: {str(e)}")
+                for entry, _ in chunk:
+                    errors.setdefault(entry.id, str(e))
+                continue
+            payload_accepted = any(error is None for error in results)
+            for (entry, token), error in zip(chunk, results):
+                if error is None:
+                    delivered.add(entry.id)
+                    continue
+                print(f"Failed to send message to token {token[:10]}...: {error}")
+                if not is_dead_token_error(error, payload_accepted):
+                    errors.setdefault(entry.id, str(error))
+            record_token_results([token for _, token in chunk], results)
+
+        # An entry counts as sent once any of its devices got it. Entries that
+        # reached none and failed transiently for at least one device (or
+        # whose multicast failed as a whole) are retried; entries whose
+        # tokens were all dead have nothing left to deliver to.
+        self._mark_sent([entry for entry in with_tokens if entry.id in delivered or entry.id not in errors])
+        self._schedule_retry([entry for entry in with_tokens if entry.id not in delivered and entry.id in errors], errors)
+
+    def _mark_sent(self, entries):
+        if entries:
+            # Dedupe keys only guard notifications still in flight; releasing
+            # them lets the same event (e.g. a status set again later) be sent anew
+            PushOutbox.objects.filter(id__in=[entry.id for entry in entries]).update(
+                status='sent', sent_at=timezone.now(), last_error='', dedupe_key=None
+            )
+
+    def _schedule_retry(self, entries, errors):
+        max_attempts = get_setting('PUSH_MAX_ATTEMPTS', 5)
+        base_delay = get_setting('PUSH_RETRY_BASE_SECONDS', 30)
+        now = timezone.now()
+        for entry in entries:
+            attempts = entry.attempts + 1
+            if attempts >= max_attempts:
+                fields = {'status': 'failed', 'dedupe_key': None}
+            else:
+                fields = {'next_attempt_at': now + timedelta(seconds=base_delay * 2 ** (attempts - 1))}
+            PushOutbox.objects.filter(id=entry.id).update(attempts=attempts, last_error=errors[entry.id], **fields)
+
+
+dispatcher = PushDispatcher()
+
+
+def start_push_dispatcher():
+    """Called by the WSGI/ASGI application when PUSH_WORKER = 'thread'"""
+    if get_setting('PUSH_WORKER', 'thread') == 'thread':
+        # Starts the thread and sends what earlier processes left pending
+        dispatcher.wake()
@@ -0,0 +1,246 @@
+"""
+Pub/sub for order status changes.
+
+The long-poll endpoint (order_status_stream) parks one asyncio future per
+waiting request in order_events and is woken as soon as an event for its
+user arrives, instead of the app re-fetching every order on a timer.
+
+Status changes are usually saved by another process than the one holding
+the parked poll (e.g. an admin view on a WSGI worker). On PostgreSQL the
+Order post_save handler therefore sends a NOTIFY on ORDER_STATUS_CHANNEL,
+which the database delivers when the transaction commits, and an
+OrderStatusListener thread in every process serving the stream relays
+each one into its own hub. On other databases (or without psycopg 3) the
+handler publishes into the local hub once the transaction commits, which
+is only complete with a single process, e.g. runserver.
+
+Cursors look like "<epoch>:<seq>". The epoch is random per process, so a
+client whose cursor came from another process (or from before a restart,
+or from before the listener lost its connection) is told to resync with
+a fetch of /api/orders/status-updates/.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from importlib.util import find_spec
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Order
+
+# Events kept per user for clients that are briefly between polls
+EVENTS_PER_USER = 50
+# Users whose recent events are kept; the least recently active are dropped
+MAX_USERS = 10000
+# NOTIFY channel carrying "<user_id>:<order_id>" for every status change
+ORDER_STATUS_CHANNEL = 'order_status'
+# Seconds between attempts to reconnect a listener that lost its connection
+LISTENER_RETRY_DELAY = 5
+
+
+def serialize_order_status(order):
+    return {
+        'id': str(order.id),
+        'user_order_number': order.user_order_number,
+        'amount': order.amount,
+        'date_time': order.date_time,
+        'status': order.status,
+        'delivery_info': order.delivery_info,
+    }
+
+
+class EventBatch:
+    def __init__(self, cursor, events, resync=False):
+        self.cursor = cursor
+        self.events = events
+        self.resync = resync
+
+
+class OrderEventHub:
+    def __init__(self, events_per_user=EVENTS_PER_USER, max_users=MAX_USERS):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.events_per_user = events_per_user
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._seq = 0
+        # user_id -> deque of (seq, payload), least recently active first
+        self._events = OrderedDict()
+        # Highest seq per user that was dropped from its buffer, and the
+        # highest seq of any user dropped altogether
+        self._evicted = {}
+        self._floor = 0
+        # user_id -> {(loop, future)}
+        self._waiters = {}
+
+    def cursor(self, seq=None):
+        return f'{self.epoch}:{self._seq if seq is None else seq}'
+
+    def parse_cursor(self, cursor):
+        """Return the seq for a cursor from this process, or None"""
+        epoch, _, seq = (cursor or '').partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if seq <= self._seq else None
+
+    def publish(self, user_id, payload):
+        with self._lock:
+            self._seq += 1
+            events = self._events.pop(user_id, None)
+            if events is None:
+                events = deque(maxlen=self.events_per_user)
+            elif len(events) == events.maxlen:
+                self._evicted[user_id] = events[0][0]
+            events.append((self._seq, payload))
+            self._events[user_id] = events
+            while len(self._events) > self.max_users:
+                dropped_id, dropped = self._events.popitem(last=False)
+                self._evicted.pop(dropped_id, None)
+                self._floor = max(self._floor, dropped[-1][0])
+            waiters = self._waiters.pop(user_id, ())
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _collect(self, user_id, since):
+        seq = self.parse_cursor(since)
+        if seq is None:
+            return EventBatch(self.cursor(), [], resync=True)
+        events = self._events.get(user_id)
+        if events is None:
+            # Nothing buffered: either nothing happened or the user was dropped
+            return EventBatch(self.cursor(), [], resync=seq < self._floor)
+        if seq < self._evicted.get(user_id, 0):
+            return EventBatch(self.cursor(), [], resync=True)
+        fresh = [{'seq': s, 'order': payload} for s, payload in events if s > seq]
+        return EventBatch(self.cursor(), fresh)
+
+    def poll(self, user_id, since):
+        with self._lock:
+            return self._collect(user_id, since)
+
+    async def wait(self, user_id, since, timeout):
+        """Return events after since, waiting up to timeout seconds for one"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._lock:
+            batch = self._collect(user_id, since)
+            if batch.events or batch.resync:
+                return batch
+            self._waiters.setdefault(user_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(user_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._waiters[user_id]
+        return self.poll(user_id, since)
+
+    def waiter_count(self):
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiters.values())
+
+    def reset(self):
+        """Forget all events and make every client resync, e.g. after events may have been lost"""
+        with self._lock:
+            self.epoch = uuid.uuid4().hex[:8]
+            self._seq = 0
+            self._events.clear()
+            self._evicted.clear()
+            self._floor = 0
+            waiters = [waiter for user_waiters in self._waiters.values() for waiter in user_waiters]
+            self._waiters = {}
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+order_events = OrderEventHub()
+
+
+def notifies_across_processes():
+    """True if status changes are fanned out with PostgreSQL NOTIFY"""
+    return connections[DEFAULT_DB_ALIAS].vendor == 'postgresql' and find_spec('psycopg') is not None
+
+
+class OrderStatusListener:
+    """LISTENs on ORDER_STATUS_CHANNEL and publishes each change into a hub"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='order-status-listener', daemon=True)
+                self._thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                self.listen()
+            except Exception as e:
+                print(f"Order status listener disconnected: {str(e)}")
+            # Changes committed while the listener was down were missed
+            self.hub.reset()
+            time.sleep(LISTENER_RETRY_DELAY)
+
+    def listen(self):
+        import psycopg
+
+        # A connection of its own: it stays open, so it must not come from the pool
+        params = connections[DEFAULT_DB_ALIAS].get_connection_params()
+        with psycopg.connect(**params, autocommit=True) as listen_connection:
+            listen_connection.execute(f'LISTEN {ORDER_STATUS_CHANNEL}')
+            for notify in listen_connection.notifies():
+                user_id, _, order_id = notify.payload.partition(':')
+                self.relay(int(user_id), int(order_id))
+
+    def relay(self, user_id, order_id):
+        try:
+            order = Order.objects.filter(id=order_id).first()
+        finally:
+            # Hand the connection back instead of holding it between changes
+            connections[DEFAULT_DB_ALIAS].close()
+        if order is not None:
+            self.hub.publish(user_id, serialize_order_status(order))
+
+
+order_status_listener = OrderStatusListener(order_events)
+
+
+def start_order_status_listener():
+    """Called by the ASGI application and the stream view; a no-op without NOTIFY support"""
+    if notifies_across_processes():
+        order_status_listener.start()
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status(sender, instance, created, **kwargs):
+    if instance.user_id is None or not instance.tracker.has_changed('status'):
+        return
+    user_id = instance.user_id
+    if notifies_across_processes():
+        # Delivered to every listener when the transaction commits, dropped on rollback
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [ORDER_STATUS_CHANNEL, f'{user_id}:{instance.id}'])
+        return
+    payload = serialize_order_status(instance)
+    transaction.on_commit(lambda: order_events.publish(user_id, payload))
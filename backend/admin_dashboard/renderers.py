@@ -0,0 +1,72 @@
+"""
+orjson-backed JSON rendering and parsing for the API.
+
+ORJSONRenderer and ORJSONParser replace DRF's JSONRenderer and JSONParser
+project-wide (see REST_FRAMEWORK in settings.py), and ORJSONResponse
+replaces JsonResponse in plain Django views. orjson encodes dicts, lists,
+strings, numbers, datetimes and UUIDs natively. default() adds Decimal (as
+a float, like DRF's encoder), image and file fields (as their URL) and
+hands anything else to DRF's encoder, so views can return model values
+without converting each row by hand. The output matches JSONRenderer's:
+compact separators, UTF-8, 'Z' for UTC datetimes. Data orjson cannot
+encode at all, such as integers over 64 bits, is rendered by JSONRenderer.
+"""
+from decimal import Decimal
+
+import orjson
+from django.db.models.fields.files import FieldFile
+from django.http import HttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+_encoder = JSONEncoder()
+
+
+def default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, FieldFile):
+        return obj.url if obj else None
+    return _encoder.default(obj)
+
+
+def dumps(data, indent=False):
+    """Encode data as JSON bytes"""
+    content = orjson.dumps(data, default=default, option=OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+    # Keep JSONRenderer's escaping so the output stays a strict JavaScript subset
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        try:
+            return dumps(data, indent=bool(indent))
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class ORJSONResponse(HttpResponse):
+    """JsonResponse encoded with dumps()"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,178 @@
+"""
+Read replicas.
+
+DATABASE_REPLICAS in settings.py lists database aliases that replicate
+'default'. Views decorated with @replica_reads read from one of them;
+every other read, and every write, goes to 'default' (ReplicaRouter in
+DATABASE_ROUTERS).
+
+A replica lags behind the primary, so:
+- A user who sent a write request is pinned to 'default' for
+  REPLICA_STICKY_SECONDS and reads their own writes (see
+  ReplicaStickinessMiddleware). Pins live in the cache, which must be
+  shared by all web processes when there are several.
+- ReplicaMonitor measures each replica's lag at most every
+  REPLICA_LAG_CHECK_INTERVAL seconds. A replica more than REPLICA_MAX_LAG
+  seconds behind, or one that cannot be reached, is skipped until a later
+  check finds it caught up. Without a usable replica, reads go to 'default'.
+- Caches that are invalidated on write are refilled from 'default'
+  (primary_reads()). Otherwise a lagging replica could put the data from
+  before a write back into the cache for its whole timeout.
+"""
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Alias @replica_reads chose for the current request, None for the primary
+_read_alias = contextvars.ContextVar('replica_read_alias', default=None)
+
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind the primary; raises if it cannot be reached"""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor != 'postgresql':
+            # Other backends report no replication state, only whether they answer
+            cursor.execute('SELECT 1')
+            return 0.0
+        cursor.execute(POSTGRES_LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+class ReplicaMonitor:
+    def __init__(self, probe=replica_lag):
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._status = {}  # alias -> (checked at, lag in seconds or None if unreachable)
+        self.fallbacks = 0
+
+    def lag(self, alias):
+        """Last measured lag of alias (None if unreachable), measured again once it is stale"""
+        now = time.monotonic()
+        with self._lock:
+            checked_at, lag = self._status.get(alias, (None, None))
+            if checked_at is not None and now - checked_at < getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 1):
+                return lag
+            # Concurrent requests keep the previous result while this one checks
+            self._status[alias] = (now, lag)
+        try:
+            lag = self.probe(alias)
+        except Exception as e:
+            print(f"Replica {alias} is unavailable: {str(e)}")
+            lag = None
+        with self._lock:
+            self._status[alias] = (now, lag)
+        return lag
+
+    def choose(self):
+        """A replica alias to read from, or None to read from the primary"""
+        aliases = replicas()
+        if not aliases:
+            return None
+        random.shuffle(aliases)
+        max_lag = getattr(settings, 'REPLICA_MAX_LAG', 5)
+        for alias in aliases:
+            lag = self.lag(alias)
+            if lag is not None and lag <= max_lag:
+                return alias
+        with self._lock:
+            self.fallbacks += 1
+        return None
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+            self.fallbacks = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'replicas': {alias: lag for alias, (_, lag) in self._status.items()},
+                'fallbacks': self.fallbacks,
+            }
+
+
+monitor = ReplicaMonitor()
+
+
+def pin_cache_key(user_id):
+    return f'admin_dashboard:replica_pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_cache_key(user_id), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 10))
+
+
+def is_pinned(user_id):
+    return cache.get(pin_cache_key(user_id)) is not None
+
+
+def replica_reads(view):
+    """Serve the view's reads from a replica unless the user wrote recently"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = None
+        if replicas():
+            user = getattr(request, 'user', None)
+            if user is None or not user.is_authenticated or not is_pinned(user.id):
+                alias = monitor.choose()
+        token = _read_alias.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside a @replica_reads view"""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        # Reads inside a transaction on the primary must see its writes
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,106 @@
+"""
+Paginated product reviews.
+
+Reviews are read with their users joined in, one page at a time, in one
+of REVIEW_SORTS. Pages use keyset cursors over the sort columns plus id,
+so deep pages cost the same as the first one. Review's indexes on
+(product, is_approved, -created_at) and (product, is_approved, -rating,
+-created_at) serve newest and highest directly. For lowest, the rating
+index is read backwards and each rating is re-sorted by date.
+
+The 1-5 star histogram is one GROUP BY over approved reviews, cached per
+product until a review of that product is saved or deleted.
+"""
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Review
+from .pagination import InvalidCursor, keyset_paginate
+from .replicas import primary_reads
+
+# sort -> rating direction (None: newest first, ties broken by id)
+REVIEW_SORTS = {
+    'newest': None,
+    'highest': '-rating',
+    'lowest': 'rating',
+}
+
+
+def approved_reviews(product_id):
+    return Review.objects.filter(product_id=product_id, is_approved=True).select_related('user')
+
+
+def encode_rating_cursor(review):
+    raw = f"{review.rating}|{review.created_at.isoformat()}|{review.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_rating_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rating, timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return int(rating), datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f'Invalid cursor: {cursor}')
+
+
+def paginate_reviews(queryset, sort, cursor, limit):
+    """Return (reviews, next_cursor) for one page in the given sort"""
+    if sort not in REVIEW_SORTS:
+        raise ValueError(f"Unknown sort: {sort}. Use one of: {', '.join(REVIEW_SORTS)}")
+    rating_order = REVIEW_SORTS[sort]
+    if rating_order is None:
+        return keyset_paginate(queryset, cursor, limit)
+
+    # Within a rating, newest first
+    queryset = queryset.order_by(rating_order, '-created_at', '-id')
+    if cursor:
+        rating, timestamp, pk = decode_rating_cursor(cursor)
+        past_rating = Q(rating__lt=rating) if rating_order == '-rating' else Q(rating__gt=rating)
+        queryset = queryset.filter(
+            past_rating |
+            Q(rating=rating, created_at__lt=timestamp) |
+            Q(rating=rating, created_at=timestamp, id__lt=pk)
+        )
+
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rating_cursor(rows[-1])
+    return rows, next_cursor
+
+
+def histogram_cache_key(product_id):
+    return f'admin_dashboard:review_histogram:{product_id}'
+
+
+def rating_histogram(product_id):
+    """{'1': count, ..., '5': count} over a product's approved reviews (cached)"""
+    key = histogram_cache_key(product_id)
+    histogram = cache.get(key)
+    if histogram is None:
+        histogram = {str(rating): 0 for rating, _ in Review.RATING_CHOICES}
+        with primary_reads():
+            counts = list(
+                Review.objects.filter(product_id=product_id, is_approved=True)
+                .order_by().values('rating').annotate(count=Count('id'))
+            )
+        for row in counts:
+            histogram[str(row['rating'])] = row['count']
+        cache.set(key, histogram, getattr(settings, 'REVIEW_HISTOGRAM_CACHE_TIMEOUT', 3600))
+    return histogram
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_histogram(sender, instance, **kwargs):
+    key = histogram_cache_key(instance.product_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,245 @@
+"""
+Product full-text search.
+
+Every query term must match the product's title, description or
+category name, as a prefix (for type-ahead).
+
+On PostgreSQL the search runs in the database against a weighted tsvector
+of title (A) and description (B), backed by the product_search_idx GIN
+index (see migration 0023). A term also matches every product of a
+category whose name matches it; categories are few, so their names are
+matched without an index, and the category name counts with weight C in
+the rank. Other backends, e.g. the SQLite databases used in test runs,
+fall back to an in-process inverted index that is rebuilt lazily after
+any product or category write.
+
+Stop words ("for", "the", ...) can never match, so they are dropped from
+the query rather than making it match nothing.
+"""
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Product
+
+SEARCH_CONFIG = 'english'
+TITLE_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+CATEGORY_WEIGHT = 0.2
+
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+# PostgreSQL's english (Snowball) stop words, for the fallback index
+STOP_WORDS = frozenset('''
+    i me my myself we our ours ourselves you your yours yourself yourselves
+    he him his himself she her hers herself it its itself they them their
+    theirs themselves what which who whom this that these those am is are was
+    were be been being have has had having do does did doing a an the and but
+    if or because as until while of at by for with about against between into
+    through during before after above below to from up down in out on off over
+    under again further then once here there when where why how all any both
+    each few more most other some such no nor not only own same so than too
+    very s t can will just don should now
+'''.split())
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def product_search_vector():
+    """Must stay identical to the expression indexed by product_search_idx"""
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def product_rank_vector():
+    """product_search_vector() plus the category name, for ranking matches"""
+    from django.contrib.postgres.search import SearchVector
+
+    return product_search_vector() + SearchVector('category__name', weight='C', config=SEARCH_CONFIG)
+
+
+class SearchResult:
+    def __init__(self, products, total, facets):
+        self.products = products
+        self.total = total
+        self.facets = facets
+
+
+class InvertedIndex:
+    """
+    Minimal in-memory inverted index over product title, description and
+    category name.
+
+    Every query term is treated as a prefix (for type-ahead) and all terms
+    must match. Results are ranked by a weighted tf-idf score.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._tokens = []
+        self._categories = {}
+        self._created = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+
+    def _build(self):
+        postings = defaultdict(Counter)
+        categories = {}
+        created = {}
+        rows = Product.objects.values_list(
+            'id', 'title', 'description', 'category__name', 'category_id', 'created_at'
+        )
+        for pk, title, description, category_name, category_id, created_at in rows.iterator():
+            for token in tokenize(title):
+                postings[token][pk] += TITLE_WEIGHT
+            for token in tokenize(description):
+                postings[token][pk] += DESCRIPTION_WEIGHT
+            for token in tokenize(category_name):
+                postings[token][pk] += CATEGORY_WEIGHT
+            categories[pk] = category_id
+            created[pk] = created_at
+        self._postings = dict(postings)
+        self._tokens = sorted(postings)
+        self._categories = categories
+        self._created = created
+
+    def _expand(self, term):
+        """All indexed tokens that start with term"""
+        start = bisect_left(self._tokens, term)
+        for token in self._tokens[start:]:
+            if not token.startswith(term):
+                break
+            yield token
+
+    def search(self, terms):
+        """
+        Return ({product_id: score}, {product_id: category_id},
+        {product_id: created_at}) for the products matching every term.
+        """
+        with self._lock:
+            if self._postings is None:
+                self._build()
+            postings, categories, created = self._postings, self._categories, self._created
+
+            total_docs = max(len(categories), 1)
+            scores = None
+            for term in terms:
+                term_scores = Counter()
+                for token in self._expand(term):
+                    docs = postings[token]
+                    idf = math.log(1 + total_docs / len(docs))
+                    for pk, tf in docs.items():
+                        term_scores[pk] += tf * idf
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = Counter({pk: scores[pk] + s for pk, s in term_scores.items() if pk in scores})
+                if not scores:
+                    break
+        return scores or {}, categories, created
+
+
+_index = InvertedIndex()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_search_index(sender, **kwargs):
+    _index.invalidate()
+
+
+def _searchable_terms_postgres(terms):
+    """terms without those the search config reduces to an empty tsquery (stop words)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT term FROM unnest(%s::text[]) WITH ORDINALITY AS t(term, n) "
+            "WHERE numnode(to_tsquery(%s::regconfig, term || ':*')) > 0 ORDER BY n",
+            [terms, SEARCH_CONFIG],
+        )
+        return [term for term, in cursor.fetchall()]
+
+
+def _search_postgres(terms, category_id, offset, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    terms = _searchable_terms_postgres(terms)
+    if not terms:
+        return SearchResult([], 0, [])
+    matches = Product.objects.annotate(search=product_search_vector())
+    for term in terms:
+        term_query = SearchQuery(f'{term}:*', search_type='raw', config=SEARCH_CONFIG)
+        categories = (
+            Category.objects.annotate(search=SearchVector('name', config=SEARCH_CONFIG))
+            .filter(search=term_query)
+            .values('id')
+        )
+        matches = matches.filter(Q(search=term_query) | Q(category__in=categories))
+    query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+
+    facets = list(
+        matches.order_by()
+        .values('category_id', 'category__name')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'category__name')
+    )
+    facets = [{'id': f['category_id'], 'name': f['category__name'], 'count': f['count']} for f in facets]
+
+    if category_id:
+        matches = matches.filter(category_id=category_id)
+    total = matches.count()
+    products = list(
+        matches.annotate(rank=SearchRank(product_rank_vector(), query))
+        .select_related('category')
+        .order_by('-rank', '-created_at', '-id')[offset:offset + limit]
+    )
+    return SearchResult(products, total, facets)
+
+
+def _search_fallback(terms, category_id, offset, limit):
+    terms = [term for term in terms if term not in STOP_WORDS]
+    if not terms:
+        return SearchResult([], 0, [])
+    scores, categories, created = _index.search(terms)
+
+    counts = Counter(categories[pk] for pk in scores)
+    names = dict(Category.objects.filter(id__in=counts).values_list('id', 'name'))
+    facets = sorted(
+        ({'id': cid, 'name': names.get(cid), 'count': n} for cid, n in counts.items()),
+        key=lambda f: (-f['count'], f['name'] or '')
+    )
+
+    if category_id:
+        scores = {pk: s for pk, s in scores.items() if str(categories[pk]) == str(category_id)}
+    ranked = sorted(scores, key=lambda pk: (-scores[pk], -created[pk].timestamp(), -pk))
+    page_ids = ranked[offset:offset + limit]
+    by_id = Product.objects.select_related('category').in_bulk(page_ids)
+    products = [by_id[pk] for pk in page_ids if pk in by_id]
+    return SearchResult(products, len(ranked), facets)
+
+
+def search_products(query, category_id=None, offset=0, limit=20):
+    """Ranked, prefix-matching product search with category facets"""
+    terms = tokenize(query)
+    if not terms:
+        return SearchResult([], 0, [])
+    if connection.vendor == 'postgresql':
+        return _search_postgres(terms, category_id, offset, limit)
+    return _search_fallback(terms, category_id, offset, limit)
@@ -1,11 +1,21 @@
 from rest_framework import serializers
 from .models import Order, OrderItem, Notification, Review, Product, ProductImage
 from django.conf import settings
+from .images import thumbnail_urls
 
 class OrderItemSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+    
     class Meta:
         model = OrderItem
-        fields = ['product_id', 'title', 'quantity', 'price', 'image_url']
+        fields = ['product_id', 'title', 'quantity', 'price', 'image_url', 'thumbnails']
+    
+    def get_thumbnails(self, obj):
+        # Prefetch items__product_ref to avoid a query per item
+        product = obj.product_ref if obj.product_ref_id else None
+        if product is None:
+            return {}
+        return thumbnail_urls(product.image, product.image_derivatives, self.context.get('request'))
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
@@ -32,10 +42,12 @@ class ReviewSerializer(serializers.ModelSerializer):
     user_name = serializers.SerializerMethodField()
     user_id = serializers.SerializerMethodField()
     profile_image_url = serializers.SerializerMethodField()
+    profile_image_thumbnails = serializers.SerializerMethodField()
     
     class Meta:
         model = Review
-        fields = ['id', 'rating', 'comment', 'created_at', 'user_name', 'user_id', 'profile_image_url', 'is_approved']
+        fields = ['id', 'rating', 'comment', 'created_at', 'user_name', 'user_id', 'profile_image_url',
+                  'profile_image_thumbnails', 'is_approved']
         
     def get_user_name(self, obj):
         return f"{obj.user.first_name} {obj.user.last_name}"
@@ -47,13 +59,17 @@ class ReviewSerializer(serializers.ModelSerializer):
         if obj.user.profile_image:
             return obj.user.profile_image.url
         return None
+    
+    def get_profile_image_thumbnails(self, obj):
+        return thumbnail_urls(obj.user.profile_image, obj.user.profile_image_derivatives)
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image_url', 'is_primary']
+        fields = ['id', 'image_url', 'thumbnails', 'is_primary']
         
     def get_image_url(self, obj):
         if obj.image:
@@ -62,16 +78,20 @@ class ProductImageSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.image.url)
             return obj.image.url
         return None
+    
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj.image, obj.image_derivatives, self.context.get('request'))
 
 class ProductSerializer(serializers.ModelSerializer):
     average_rating = serializers.FloatField(read_only=True)
     review_count = serializers.IntegerField(read_only=True)
     image_url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
     images = ProductImageSerializer(many=True, read_only=True)
     
     class Meta:
         model = Product
-        fields = ['id', 'title', 'price', 'sale_price', 'description', 'image_url', 
+        fields = ['id', 'title', 'price', 'sale_price', 'description', 'image_url', 'thumbnails',
                   'category', 'is_new', 'is_on_sale', 'average_rating', 'review_count', 
                   'images', 'stock_quantity']  # Ensure stock_quantity is included
                   
@@ -82,6 +102,9 @@ class ProductSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.image.url)
             return obj.image.url
         return None
+    
+    def get_thumbnails(self, obj):
+        return thumbnail_urls(obj.image, obj.image_derivatives, self.context.get('request'))
 
 # Remove WishlistSerializer class
 
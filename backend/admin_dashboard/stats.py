@@ -0,0 +1,87 @@
+"""
+Dashboard statistics.
+
+get_stats() returns the object counts, the order status breakdown and the
+revenue from a single UNION ALL query: one row per small table and one
+per order status. The result is cached under STATS_CACHE_KEY. Writes to
+the counted models clear it once their transaction commits, and
+STATS_CACHE_TIMEOUT bounds staleness from writes that bypass signals
+(queryset.update()) or from other processes when the cache is
+process-local.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Count, DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+
+from .models import Category, Deal, Order, Product, User
+
+STATS_CACHE_KEY = 'admin_dashboard:stats'
+COUNTED_MODELS = {
+    'users': User,
+    'categories': Category,
+    'products': Product,
+    'deals': Deal,
+}
+ZERO = Decimal('0.00')
+
+
+def _stats_query():
+    amount = DecimalField(max_digits=14, decimal_places=2)
+    queries = [
+        model.objects.order_by().annotate(key=Value(key, output_field=CharField()))
+        .values('key')
+        .annotate(count=Count('id'), revenue=Value(ZERO, output_field=amount))
+        for key, model in COUNTED_MODELS.items()
+    ]
+    by_status = (
+        Order.objects.order_by().values('status')
+        .annotate(count=Count('id'), revenue=Coalesce(Sum('amount'), Value(ZERO), output_field=amount))
+    )
+    return queries[0].union(*queries[1:], by_status, all=True)
+
+
+def compute_stats():
+    """Read the statistics from the database (one query)"""
+    counts = {key: 0 for key in COUNTED_MODELS}
+    orders_by_status = {value: 0 for value, _ in Order.STATUS_CHOICES}
+    revenue = ZERO
+    for row in _stats_query():
+        # Rows of the union are named after the first query's columns
+        key, count, amount = row['key'], row['count'], row['revenue']
+        if key in COUNTED_MODELS:
+            counts[key] = count
+        else:
+            orders_by_status[key] = orders_by_status.get(key, 0) + count
+            revenue += amount or ZERO
+    return {
+        'total_users': counts['users'],
+        'total_categories': counts['categories'],
+        'total_products': counts['products'],
+        'total_deals': counts['deals'],
+        'total_orders': sum(orders_by_status.values()),
+        'orders_by_status': orders_by_status,
+        'total_revenue': revenue,
+    }
+
+
+def get_stats():
+    """Cached compute_stats()"""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_stats()
+        cache.set(STATS_CACHE_KEY, stats, getattr(settings, 'STATS_CACHE_TIMEOUT', 300))
+    return stats
+
+
+def invalidate_stats(sender=None, **kwargs):
+    transaction.on_commit(lambda: cache.delete(STATS_CACHE_KEY))
+
+
+for model in [Order, *COUNTED_MODELS.values()]:
+    post_save.connect(invalidate_stats, sender=model, dispatch_uid=f'stats_{model.__name__}_save')
+    post_delete.connect(invalidate_stats, sender=model, dispatch_uid=f'stats_{model.__name__}_delete')
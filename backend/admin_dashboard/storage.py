@@ -0,0 +1,67 @@
+"""
+Content-addressed storage for product images.
+
+ContentHashStorage names every upload after the SHA-256 of its bytes
+(products/content/ab/ab12...ef.jpg) instead of its upload name. Uploading
+the same image again, for another product or as a gallery image, reuses
+the stored file instead of writing a copy. Because a name always refers
+to the same bytes, its URL can be cached forever (see
+serve_content_media in views.py).
+
+One file can back several rows, so delete() does not remove anything.
+MediaBlob counts the references and purge() removes the file once the
+last one is gone (see media.py).
+
+This module must not import models: migrations reference
+product_image_storage().
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_PREFIX = 'products/content'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_content_name(name):
+    return bool(name) and name.startswith(CONTENT_PREFIX + '/')
+
+
+class ContentHashStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        if extension == '.jpeg':
+            extension = '.jpg'
+        return f'{CONTENT_PREFIX}/{digest[:2]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        saved = self._save(name, content)
+        if saved != name:
+            # Another upload of the same bytes won the race
+            super().delete(saved)
+        return name
+
+    def delete(self, name):
+        """Shared files are removed by purge() when no row references them"""
+        if not is_content_name(name):
+            super().delete(name)
+
+    def purge(self, name):
+        super().delete(name)
+
+
+def product_image_storage():
+    return ContentHashStorage()
@@ -1,38 +1,126 @@
+"""
+Deal scheduling.
+
+update_deal_statuses() applies every deal boundary that has passed with a
+handful of set-based UPDATEs and returns the next start_date/end_date at
+which something will change. DealScheduler sleeps until exactly that
+moment (or until a deal is saved or deleted) instead of polling. With
+settings.DEAL_SCHEDULER = 'thread' it runs as a daemon thread started by
+the WSGI/ASGI application; with 'command' it runs in
+`manage.py run_deal_scheduler`.
+"""
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, Min, OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
+
 from .models import Deal, Product
+from .product_cache import invalidate_products
 
-def update_deal_statuses():
-    now = timezone.now()
-    print(f"\nUpdating deal statuses at {now}")
-    
-    # Update expired deals
-    expired_deals = Deal.objects.filter(
-        is_active=True,
-        end_date__lte=now
-    )
-    print(f"Found {expired_deals.count()} expired deals")
-    for deal in expired_deals:
-        print(f"Deactivating expired deal for {deal.product.title}")
-        print(f"End date: {deal.end_date}")
-        deal.is_active = False
-        deal.save()
-        
-        # Reset product sale status
-        product = deal.product
-        product.is_on_sale = False
-        product.sale_price = None
-        product.save()
-
-    # Update started deals
-    active_deals = Deal.objects.filter(
-        is_active=True,
-        start_date__lte=now,
-        end_date__gt=now
+
+def running_deals(now):
+    return Deal.objects.filter(is_active=True, start_date__lte=now, end_date__gt=now)
+
+
+def update_deal_statuses(now=None):
+    """
+    Deactivate expired deals, clear the sale on their products and put
+    products with a running deal on sale at its price.
+
+    Returns the next boundary after now, or None if no deal is pending.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = Deal.objects.filter(is_active=True, end_date__lte=now)
+        expired_product_ids = list(expired.values_list('product_id', flat=True).distinct())
+        expired_count = expired.update(is_active=False)
+
+        # Products whose deal ended, unless another deal is still running for them
+        running = running_deals(now).filter(product=OuterRef('pk'))
+        cleared_ids = list(
+            Product.objects.filter(id__in=expired_product_ids)
+            .exclude(Exists(running))
+            .values_list('id', flat=True)
+        )
+        cleared = Product.objects.filter(id__in=cleared_ids).update(is_on_sale=False, sale_price=None)
+
+        # Products with a running deal get its price; with overlapping deals
+        # the cheapest wins. Rows that are already up to date are skipped.
+        best_price = Subquery(running.order_by('discount_price').values('discount_price')[:1])
+        started_ids = list(
+            Product.objects.annotate(deal_price=best_price)
+            .filter(deal_price__isnull=False)
+            .exclude(is_on_sale=True, sale_price=F('deal_price'))
+            .values_list('id', flat=True)
+        )
+        started = Product.objects.filter(id__in=started_ids).update(is_on_sale=True, sale_price=best_price)
+
+        # update() sends no post_save, so drop the cached detail pages here
+        invalidate_products(cleared_ids + started_ids)
+
+    if expired_count or cleared or started:
+        print(f"Deal statuses at {now}: {expired_count} deals expired, "
+              f"{cleared} products cleared, {started} products put on sale")
+    return next_deal_boundary(now)
+
+
+def next_deal_boundary(now):
+    boundaries = Deal.objects.filter(is_active=True).aggregate(
+        next_start=Min('start_date', filter=Q(start_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gt=now)),
     )
-    print(f"Found {active_deals.count()} active deals")
-    for deal in active_deals:
-        print(f"Updating active deal for {deal.product.title}")
-        product = deal.product
-        product.is_on_sale = True
-        product.sale_price = deal.discount_price
-        product.save()
+    return min((value for value in boundaries.values() if value), default=None)
+
+
+class DealScheduler:
+    """Runs update_deal_statuses() at each deal boundary; see the module docstring"""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='deal-scheduler', daemon=True)
+                self._thread.start()
+
+    def reschedule(self):
+        """Re-read the next boundary now, e.g. after a deal was edited"""
+        self._wakeup.set()
+
+    def run_forever(self, max_sleep=None):
+        # Other processes' deal edits are only noticed after max_sleep
+        max_sleep = max_sleep or getattr(settings, 'DEAL_SCHEDULER_MAX_SLEEP', 300)
+        while True:
+            self._wakeup.clear()
+            timeout = max_sleep
+            try:
+                boundary = update_deal_statuses()
+                if boundary:
+                    timeout = min(max((boundary - timezone.now()).total_seconds(), 0), max_sleep)
+            except Exception as e:
+                print(f"Error updating deal statuses: {str(e)}")
+            finally:
+                close_old_connections()
+            self._wakeup.wait(timeout)
+
+
+deal_scheduler = DealScheduler()
+
+
+def start_deal_scheduler():
+    """Called by the WSGI/ASGI application when DEAL_SCHEDULER = 'thread'"""
+    if getattr(settings, 'DEAL_SCHEDULER', 'thread') == 'thread':
+        deal_scheduler.start()
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+def reschedule_deals(sender, **kwargs):
+    transaction.on_commit(deal_scheduler.reschedule)
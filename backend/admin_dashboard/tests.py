@@ -1,3 +1,820 @@
-from django.test import TestCase
+import asyncio
+import io
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.models import FCMToken
+from . import push
+from .deal_cache import ActiveDealCache
+from .inventory import InsufficientStock, reserve_stock
+from .models import (
+    Category, Deal, Order, OrderItem, OrderTombstone, Product, ProductImage, PushOutbox, Review, User,
+    UserOrderCounter,
+)
+from .orders import order_history, serialize_order
+from .product_cache import product_cache_key
+from .pagination import InvalidCursor
+from .realtime import OrderEventHub
+from .renderers import ORJSONParser, ORJSONRenderer
+from .replicas import ReplicaRouter, monitor, pin_cache_key, replica_reads
+from .reviews import (
+    approved_reviews, decode_rating_cursor, encode_rating_cursor, histogram_cache_key, paginate_reviews,
+    rating_histogram,
+)
+from .search import search_products
+from .serializers import OrderSerializer
+from .stats import compute_stats
+from .tasks import next_deal_boundary, update_deal_statuses
+from .sync import sync_window
+
+
+class StockReservationTests(TransactionTestCase):
+    threads = 8
+    attempts_per_thread = 10
+    initial_stock = 50
+
+    def setUp(self):
+        category = Category.objects.create(name='Stock category')
+        self.product = Product.objects.create(
+            title='Stock product', price=Decimal('10.00'), description='',
+            category=category, stock_quantity=self.initial_stock,
+        )
+
+    def test_concurrent_reservations_never_oversell(self):
+        results = {'reserved': 0, 'rejected': 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.threads)
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.attempts_per_thread):
+                    while True:
+                        try:
+                            with transaction.atomic():
+                                reserve_stock({self.product.id: 1})
+                            outcome = 'reserved'
+                        except InsufficientStock:
+                            outcome = 'rejected'
+                        except OperationalError:
+                            # SQLite allows one writer at a time; retry on "database is locked"
+                            time.sleep(0.001)
+                            continue
+                        with lock:
+                            results[outcome] += 1
+                        break
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 0)
+        self.assertEqual(results['reserved'], self.initial_stock)
+        self.assertEqual(results['rejected'], self.threads * self.attempts_per_thread - self.initial_stock)
+
+    def test_failed_reservation_rolls_back_earlier_products(self):
+        category = Category.objects.create(name='Other category')
+        other = Product.objects.create(
+            title='Scarce product', price=Decimal('5.00'), description='',
+            category=category, stock_quantity=1,
+        )
+        with self.assertRaises(InsufficientStock) as raised:
+            with transaction.atomic():
+                reserve_stock({self.product.id: 2, other.id: 2})
+        self.assertEqual(raised.exception.product_ids, [other.id])
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, self.initial_stock)
+        self.assertEqual(other.stock_quantity, 1)
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='History category')
+        cls.products = [
+            Product.objects.create(
+                title=f'History product {i}', price=Decimal('10.00') + i, description='',
+                category=category, stock_quantity=10,
+            )
+            for i in range(3)
+        ]
+        cls.user = User.objects.create_user(username='history', email='history@example.com')
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                user=self.user, amount=Decimal('33.00'), delivery_info={'city': 'Rabat'},
+                items_data=[{'product_id': str(self.products[0].id), 'quantity': 1}],
+            )
+            for product in self.products:
+                OrderItem.objects.create(
+                    order=order, product_id=str(product.id), product_ref=product, title=product.title,
+                    quantity=2, price=product.price, image_url='https://example.com/item.jpg',
+                )
+            # Items of deleted products keep their snapshot but have no product_ref
+            OrderItem.objects.create(
+                order=order, product_id='999999', title='Deleted product',
+                quantity=1, price=Decimal('1.50'), image_url='https://example.com/gone.jpg',
+            )
+
+    def test_two_queries_however_many_orders(self):
+        for count in (1, 5):
+            self.create_orders(count)
+            orders = order_history(Order.objects.filter(user=self.user).order_by('-date_time'))
+            with self.assertNumQueries(2):
+                data = [serialize_order(order) for order in orders]
+            self.assertEqual(len(data), Order.objects.filter(user=self.user).count())
+
+    def test_matches_order_serializer(self):
+        self.create_orders(3)
+        orders = Order.objects.filter(user=self.user).order_by('-date_time')
+        expected = [dict(order) for order in OrderSerializer(orders, many=True).data]
+        data = [serialize_order(order) for order in order_history(orders)]
+        self.assertEqual(data, expected)
+        self.assertEqual(len(data[0]['items']), 4)
+
+    def test_list_api_query_count_does_not_grow(self):
+        client = Client()
+        client.force_login(self.user)
+        query_counts = set()
+        for count in (1, 5):
+            self.create_orders(count)
+            for url in ['/api/orders/list/', '/api/orders/list/?limit=3']:
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(client.get(url).status_code, 200)
+                query_counts.add((url, len(queries)))
+        self.assertEqual(len(query_counts), 2, sorted(query_counts))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_LAG_CHECK_INTERVAL=60)
+class ReplicaRoutingTests(TransactionTestCase):
+    # 'replica' mirrors the test database, so the two only differ by which
+    # connection a query goes through
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        category = Category.objects.create(name='Replica category')
+        self.product = Product.objects.create(
+            title='Replica product', price=Decimal('10.00'), description='',
+            category=category, stock_quantity=5,
+        )
+        self.products_url = f'/api/products/?category={category.id}'
+        self.user = User.objects.create_user(username='replica', email='replica@example.com')
+        self.buyer = Client()
+        self.buyer.force_login(self.user)
+        cache.clear()
+        probe = monitor.probe
+        monitor.probe = lambda alias: 0.0
+        monitor.reset()
+        self.addCleanup(setattr, monitor, 'probe', probe)
+        self.addCleanup(monitor.reset)
+
+    def read_from(self, client, url):
+        """'replica' or 'default', whichever the view read from"""
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Session and user lookups always go to the primary
+        return 'replica' if replica.captured_queries else 'default'
+
+    def test_decorated_views_read_from_replica(self):
+        self.assertEqual(self.read_from(Client(), self.products_url), 'replica')
+        self.assertEqual(self.read_from(self.buyer, '/api/orders/list/'), 'replica')
+
+    def test_writer_is_pinned_to_primary(self):
+        response = self.buyer.post(f'/api/wishlist/toggle/{self.product.id}/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.read_from(self.buyer, '/api/orders/list/'), 'default')
+        self.assertEqual(self.read_from(Client(), self.products_url), 'replica')
+
+        cache.delete(pin_cache_key(self.user.id))
+        self.assertEqual(self.read_from(self.buyer, '/api/orders/list/'), 'replica')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        monitor.probe = lambda alias: 60.0
+        self.assertEqual(self.read_from(Client(), self.products_url), 'default')
+        self.assertEqual(monitor.stats()['fallbacks'], 1)
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        def unreachable(alias):
+            raise OperationalError('connection refused')
+        monitor.probe = unreachable
+        self.assertEqual(self.read_from(Client(), self.products_url), 'default')
+        self.assertEqual(monitor.stats()['replicas'], {'replica': None})
+
+    def test_router(self):
+        router = ReplicaRouter()
+
+        @replica_reads
+        def view(request):
+            with transaction.atomic():
+                # Reads inside a transaction must see its writes
+                in_transaction = router.db_for_read(Product)
+            return router.db_for_read(Product), in_transaction
+
+        self.assertEqual(view(None), ('replica', None))
+        self.assertIsNone(router.db_for_read(Product))
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertIs(router.allow_migrate('replica', 'admin_dashboard'), False)
+        self.assertIsNone(router.allow_migrate('default', 'admin_dashboard'))
+
+
+@override_settings(PUSH_WORKER='command', PUSH_BATCH_SIZE=500, PUSH_MAX_ATTEMPTS=3, PUSH_RETRY_BASE_SECONDS=30)
+class PushDispatchTests(TestCase):
+    def setUp(self):
+        self.transport = push.FakeTransport()
+        self.addCleanup(push.set_transport, push._transport)
+        push.set_transport(self.transport)
+        self.dispatcher = push.PushDispatcher()
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'push{i}', email=f'push{i}@example.com')
+            FCMToken.objects.create(user=user, token=f'token-{i}-a')
+            FCMToken.objects.create(user=user, token=f'token-{i}-b')
+            self.users.append(user)
+
+    def test_dedupe_key_is_sent_once(self):
+        first = push.enqueue_push(self.users[0], 'Order', 'Shipped', dedupe_key='order:1:status:shipped')
+        self.assertIsNotNone(first)
+        self.assertIsNone(push.enqueue_push(self.users[0], 'Order', 'Shipped', dedupe_key='order:1:status:shipped'))
+
+        self.assertEqual(self.dispatcher.dispatch_due(), 1)
+        self.assertEqual(len(self.transport.sent), 1)
+        # Once delivered, the same event can be queued again
+        self.assertIsNotNone(push.enqueue_push(self.users[0], 'Order', 'Shipped', dedupe_key='order:1:status:shipped'))
+
+    def test_identical_messages_share_multicasts(self):
+        for user in self.users:
+            push.enqueue_push(user, 'Sale', 'Everything 10% off', data={'type': 'deal'})
+        push.enqueue_push(self.users[0], 'Order', 'Shipped')
+
+        self.assertEqual(self.dispatcher.dispatch_due(), 4)
+        sent = sorted(self.transport.sent, key=lambda message: message['title'])
+        self.assertEqual([message['title'] for message in sent], ['Order', 'Sale'])
+        self.assertEqual(sorted(sent[0]['tokens']), ['token-0-a', 'token-0-b'])
+        self.assertEqual(len(sent[1]['tokens']), 6)
+        self.assertEqual(PushOutbox.objects.filter(status='sent').count(), 4)
+
+    @override_settings(PUSH_BATCH_SIZE=4)
+    def test_multicasts_are_split_at_batch_size(self):
+        for user in self.users:
+            push.enqueue_push(user, 'Sale', 'Everything 10% off')
+        self.dispatcher.dispatch_due()
+        self.assertEqual([len(message['tokens']) for message in self.transport.sent], [4, 2])
+
+    def test_failed_send_is_retried_with_backoff(self):
+        entry = push.enqueue_push(self.users[0], 'Order', 'Shipped', dedupe_key='order:1:status:shipped')
+        self.transport.raise_error = ConnectionError('FCM unreachable')
+
+        for attempt, delay in [(1, 30), (2, 60)]:
+            before = timezone.now()
+            self.dispatcher.dispatch_due()
+            entry.refresh_from_db()
+            self.assertEqual((entry.status, entry.attempts, entry.last_error), ('pending', attempt, 'FCM unreachable'))
+            self.assertGreaterEqual(entry.next_attempt_at, before + timedelta(seconds=delay))
+            self.assertLess(entry.next_attempt_at, before + timedelta(seconds=delay + 5))
+            # Not due again until the backoff has passed
+            self.assertEqual(self.dispatcher.dispatch_due(), 0)
+            PushOutbox.objects.filter(id=entry.id).update(next_attempt_at=timezone.now())
+
+        self.dispatcher.dispatch_due()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts, entry.dedupe_key), ('failed', 3, None))
+
+    def test_transient_token_errors_are_retried(self):
+        retried = push.enqueue_push(self.users[0], 'Order', 'Shipped')
+        partly_delivered = push.enqueue_push(self.users[1], 'Order', 'Shipped')
+        all_dead = push.enqueue_push(self.users[2], 'Order', 'Shipped')
+        self.transport.failing_tokens = {
+            'token-0-a': UnavailableError('FCM unavailable'), 'token-0-b': UnregisteredError(),
+            'token-1-a': UnavailableError('FCM unavailable'),
+            'token-2-a': UnregisteredError(), 'token-2-b': UnregisteredError(),
+        }
+
+        self.assertEqual(self.dispatcher.dispatch_due(), 3)
+        for entry, expected in [
+            (retried, ('pending', 1, 'FCM unavailable')),
+            (partly_delivered, ('sent', 0, '')),
+            (all_dead, ('sent', 0, '')),
+        ]:
+            entry.refresh_from_db()
+            self.assertEqual((entry.status, entry.attempts, entry.last_error), expected)
+
+    def test_entries_without_tokens_are_not_retried(self):
+        user = User.objects.create_user(username='no-tokens', email='no-tokens@example.com')
+        entry = push.enqueue_push(user, 'Order', 'Shipped')
+        self.assertEqual(self.dispatcher.dispatch_due(), 1)
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'sent')
+        self.assertEqual(self.transport.sent, [])
+
+
+# Stand-ins for firebase_admin.messaging errors, which push.py matches by class name
+class UnregisteredError(Exception):
+    pass
+
+
+class InvalidArgumentError(Exception):
+    pass
+
+
+class UnavailableError(Exception):
+    pass
+
+
+@override_settings(PUSH_WORKER='command', FCM_TOKEN_MAX_FAILURES=2, FCM_TOKEN_QUARANTINE_DAYS=7, FCM_TOKEN_STALE_DAYS=None)
+class TokenHealthTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tokens', email='tokens@example.com')
+        for name in ['good', 'gone', 'flaky', 'malformed']:
+            FCMToken.objects.create(user=self.user, token=name)
+
+    def tokens(self):
+        return {
+            token.token: (token.failure_count, token.is_active)
+            for token in FCMToken.objects.filter(user=self.user)
+        }
+
+    def test_unregistered_tokens_are_deleted(self):
+        deleted, quarantined = push.record_token_results(
+            ['good', 'gone', 'flaky'], [None, UnregisteredError(), UnavailableError()]
+        )
+        self.assertEqual((deleted, quarantined), (1, 0))
+        self.assertEqual(self.tokens(), {'good': (0, True), 'flaky': (1, True), 'malformed': (0, True)})
+
+    def test_invalid_argument_only_condemns_token_if_payload_was_accepted(self):
+        push.record_token_results(['flaky', 'malformed'], [UnavailableError(), InvalidArgumentError()])
+        self.assertIn('malformed', self.tokens())
+
+        push.record_token_results(['good', 'malformed'], [None, InvalidArgumentError()])
+        self.assertNotIn('malformed', self.tokens())
+
+    def test_repeated_failures_quarantine_and_delivery_resets(self):
+        push.record_token_results(['flaky'], [UnavailableError()])
+        push.record_token_results(['good'], [None])
+        self.assertEqual(push.record_token_results(['flaky'], [UnavailableError()]), (0, 1))
+        self.assertEqual(self.tokens()['flaky'], (2, False))
+
+        FCMToken.objects.filter(token='flaky').update(is_active=True)
+        push.record_token_results(['flaky'], [None])
+        self.assertEqual(self.tokens()['flaky'], (0, True))
+
+    def test_dispatch_prunes_dead_tokens_and_skips_quarantined_ones(self):
+        transport = push.FakeTransport()
+        transport.failing_tokens = {'gone': UnregisteredError()}
+        self.addCleanup(push.set_transport, push._transport)
+        push.set_transport(transport)
+        FCMToken.objects.filter(token='flaky').update(is_active=False)
+
+        push.enqueue_push(self.user, 'Order', 'Shipped')
+        push.PushDispatcher().dispatch_due()
+        self.assertEqual(sorted(transport.sent[0]['tokens']), ['gone', 'good', 'malformed'])
+        self.assertNotIn('gone', self.tokens())
+
+    def test_compaction_deletes_old_quarantined_tokens(self):
+        now = timezone.now()
+        FCMToken.objects.filter(token='flaky').update(is_active=False, last_failure_at=now - timedelta(days=8))
+        FCMToken.objects.filter(token='malformed').update(is_active=False, last_failure_at=now - timedelta(days=1))
+        FCMToken.objects.filter(token='gone').update(updated_at=now - timedelta(days=100))
+
+        self.assertEqual(push.compact_tokens(now), 1)
+        self.assertEqual(set(self.tokens()), {'good', 'gone', 'malformed'})
+
+        with override_settings(FCM_TOKEN_STALE_DAYS=90):
+            self.assertEqual(push.compact_tokens(now), 1)
+        self.assertEqual(set(self.tokens()), {'good', 'malformed'})
+
+
+class SyncWindowTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sync', email='sync@example.com')
+        self.orders = [Order.objects.create(user=self.user, amount=Decimal('10.00')) for _ in range(2)]
+
+    def window(self, since):
+        return sync_window(
+            Order.objects.filter(user=self.user),
+            since,
+            tombstones=OrderTombstone.objects.filter(user=self.user),
+        )
+
+    def test_full_sync_etag_matches_unchanged_delta(self):
+        full = self.window(None)
+        delta = self.window(full.next_since)
+        self.assertTrue(full.full)
+        self.assertFalse(delta.full)
+        self.assertEqual(delta.etag, full.etag)
+
+        deleted_id = self.orders[0].id
+        self.orders[0].delete()
+        after = self.window(full.next_since)
+        self.assertNotEqual(after.etag, full.etag)
+        self.assertEqual(list(after.deleted.values_list('order_id', flat=True)), [deleted_id])
+        self.assertIsNone(self.window(None).deleted)
+
+    def test_status_updates_answer_304_for_current_etag(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.get('/api/orders/status-updates/')
+        self.assertEqual(response.status_code, 200)
+        next_since = response.json()['next_since']
+
+        response = client.get(
+            '/api/orders/status-updates/', {'since': next_since}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shoes = Category.objects.create(name='Running Shoes')
+        bags = Category.objects.create(name='Bags')
+        for title, description, category in [
+            ('Red Trainer', 'Light and breathable', shoes),
+            ('Blue Trainer', '', shoes),
+            ('Red Tote', 'Canvas bag with a pocket for shoes', bags),
+        ]:
+            Product.objects.create(
+                title=title, description=description, price=Decimal('20.00'),
+                category=category, stock_quantity=1,
+            )
+
+    def titles(self, query):
+        return sorted(product.title for product in search_products(query).products)
+
+    def test_terms_match_category_name(self):
+        self.assertEqual(self.titles('shoes'), ['Blue Trainer', 'Red Tote', 'Red Trainer'])
+        self.assertEqual(self.titles('red shoe'), ['Red Tote', 'Red Trainer'])
+        self.assertEqual(self.titles('blue run'), ['Blue Trainer'])
+        self.assertEqual(self.titles('bags trainer'), [])
+
+    def test_stop_words_are_ignored(self):
+        # 'for' appears in one description only, but is a stop word PostgreSQL never matches
+        self.assertEqual(self.titles('trainer for running'), ['Blue Trainer', 'Red Trainer'])
+        self.assertEqual(self.titles('the red shoes'), ['Red Tote', 'Red Trainer'])
+        self.assertEqual(self.titles('for the'), [])
+
+    def test_title_matches_rank_above_category_matches(self):
+        result = search_products('shoes')
+        self.assertEqual(result.products[0].title, 'Red Tote')
+        self.assertEqual({facet['name']: facet['count'] for facet in result.facets}, {'Running Shoes': 2, 'Bags': 1})
+
+    def test_renamed_category_is_searchable(self):
+        self.assertEqual(self.titles('luggage'), [])
+        category = Category.objects.get(name='Bags')
+        category.name = 'Luggage'
+        category.save()
+        self.assertEqual(self.titles('luggage'), ['Red Tote'])
+
+
+class OrderEventHubTests(TestCase):
+    def test_publish_wakes_waiter(self):
+        hub = OrderEventHub()
+        cursor = hub.cursor()
+
+        async def wait_and_publish():
+            waiting = asyncio.ensure_future(hub.wait(1, cursor, 5))
+            await asyncio.sleep(0)
+            hub.publish(2, {'id': 'other user'})
+            hub.publish(1, {'id': 'mine'})
+            return await waiting
+
+        batch = asyncio.run(wait_and_publish())
+        self.assertFalse(batch.resync)
+        self.assertEqual([event['order'] for event in batch.events], [{'id': 'mine'}])
+        self.assertEqual(hub.waiter_count(), 0)
+
+    def test_reset_makes_waiters_resync(self):
+        hub = OrderEventHub()
+        hub.publish(1, {'id': 'before'})
+        cursor = hub.cursor()
+
+        async def wait_and_reset():
+            waiting = asyncio.ensure_future(hub.wait(1, cursor, 5))
+            await asyncio.sleep(0)
+            hub.reset()
+            return await waiting
+
+        batch = asyncio.run(wait_and_reset())
+        self.assertTrue(batch.resync)
+        self.assertNotEqual(batch.cursor.split(':')[0], cursor.split(':')[0])
+
+    async def test_stream_without_since_returns_cursor(self):
+        user = await User.objects.acreate(username='stream', email='stream@example.com')
+        response = await self.async_client.get(
+            '/api/orders/status-stream/', headers={'Authorization': f'Bearer {AccessToken.for_user(user)}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['resync'])
+        self.assertEqual(data['events'], [])
+        self.assertTrue(data['cursor'])
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            title='Rated', description='', price=Decimal('10.00'),
+            category=Category.objects.create(name='Rated'), stock_quantity=1,
+        )
+        self.users = [
+            User.objects.create_user(username=f'rater{i}', email=f'rater{i}@example.com') for i in range(2)
+        ]
+
+    def aggregates(self):
+        self.product.refresh_from_db()
+        return self.product.rating_sum, self.product.rating_count
+
+    def test_aggregates_follow_approved_reviews(self):
+        review = Review.objects.create(product=self.product, user=self.users[0], rating=4, comment='Good')
+        Review.objects.create(product=self.product, user=self.users[1], rating=2, comment='Meh', is_approved=False)
+        self.assertEqual(self.aggregates(), (4, 1))
+
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.aggregates(), (5, 1))
+
+        review.is_approved = False
+        review.save()
+        self.assertEqual(self.aggregates(), (0, 0))
+        # Edits to unapproved reviews don't count
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.aggregates(), (0, 0))
+        review.is_approved = True
+        review.save()
+        self.assertEqual(self.aggregates(), (1, 1))
+
+        review.delete()
+        Review.objects.get(user=self.users[1]).delete()
+        self.assertEqual(self.aggregates(), (0, 0))
+
+    def test_deleting_a_review_twice_adjusts_once(self):
+        Review.objects.create(product=self.product, user=self.users[1], rating=3, comment='Fine')
+        review = Review.objects.create(product=self.product, user=self.users[0], rating=5, comment='Great')
+        client = Client()
+        header = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.users[0])}'}
+
+        statuses = [client.delete(f'/api/reviews/{review.id}/delete/', **header).status_code for _ in range(2)]
+        self.assertEqual(statuses, [200, 404])
+        self.assertEqual(self.aggregates(), (3, 1))
+
+
+class DealSchedulingTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+        self.product = Product.objects.create(
+            title='Deal', description='', price=Decimal('100.00'),
+            category=Category.objects.create(name='Deals'), stock_quantity=1,
+        )
+
+    def deal(self, percentage, start_hours, end_hours, is_active=True):
+        return Deal.objects.create(
+            product=self.product, discount_percentage=percentage, is_active=is_active,
+            start_date=self.at(start_hours), end_date=self.at(end_hours),
+        )
+
+    def at(self, hours):
+        return self.now + timedelta(hours=hours)
+
+    def sale(self):
+        self.product.refresh_from_db()
+        return self.product.is_on_sale, self.product.sale_price
+
+    def test_deal_starts_and_ends_on_schedule(self):
+        deal = self.deal(10, 1, 2)
+
+        self.assertEqual(update_deal_statuses(self.at(0)), self.at(1))
+        self.assertEqual(self.sale(), (False, None))
+
+        self.assertEqual(update_deal_statuses(self.at(1)), self.at(2))
+        self.assertEqual(self.sale(), (True, Decimal('90.00')))
+
+        self.assertIsNone(update_deal_statuses(self.at(2)))
+        self.assertEqual(self.sale(), (False, None))
+        deal.refresh_from_db()
+        self.assertFalse(deal.is_active)
+
+    def test_overlapping_deals_cheapest_wins(self):
+        self.deal(10, 0, 3)
+        self.deal(25, 1, 2)
+
+        for hours, expected in [
+            (0, (True, Decimal('90.00'))),
+            (1, (True, Decimal('75.00'))),
+            # The cheaper deal ended; the product falls back to the one still running
+            (2, (True, Decimal('90.00'))),
+            (3, (False, None)),
+        ]:
+            update_deal_statuses(self.at(hours))
+            self.assertEqual(self.sale(), expected, hours)
+
+    def test_next_deal_boundary(self):
+        self.assertIsNone(next_deal_boundary(self.now))
+        self.deal(10, 1, 5, is_active=False)
+        self.assertIsNone(next_deal_boundary(self.now))
+
+        self.deal(10, -1, 4)
+        self.deal(20, 2, 3)
+        for hours, expected in [(0, 2), (2, 3), (3, 4)]:
+            self.assertEqual(next_deal_boundary(self.at(hours)), self.at(expected), hours)
+        self.assertIsNone(next_deal_boundary(self.at(4)))
+
+
+class ReviewPagingTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            title='Reviewed', description='', price=Decimal('10.00'),
+            category=Category.objects.create(name='Reviewed'), stock_quantity=1,
+        )
+        cache.delete(histogram_cache_key(self.product.id))
+        # Ties on rating, and on rating and created_at, so paging relies on the id tie-break
+        day = timezone.now().replace(microsecond=0)
+        for i, (rating, days_ago) in enumerate([(5, 1), (5, 1), (3, 2), (3, 1), (3, 1), (1, 3), (1, 1)]):
+            user = User.objects.create_user(username=f'reviewer{i}', email=f'reviewer{i}@example.com')
+            review = Review.objects.create(product=self.product, user=user, rating=rating, comment='Text')
+            Review.objects.filter(id=review.id).update(created_at=day - timedelta(days=days_ago))
+        self.reviews = list(Review.objects.filter(product=self.product))
+
+    def pages(self, sort, limit):
+        ids, cursor = [], None
+        while True:
+            page, cursor = paginate_reviews(approved_reviews(self.product.id), sort, cursor, limit)
+            ids.extend(review.id for review in page)
+            if not cursor:
+                return ids
+
+    def test_rating_sorts_page_through_ties(self):
+        expected = {
+            'highest': sorted(self.reviews, key=lambda r: (-r.rating, -r.created_at.timestamp(), -r.id)),
+            # Lowest rating first, but still newest first within a rating
+            'lowest': sorted(self.reviews, key=lambda r: (r.rating, -r.created_at.timestamp(), -r.id)),
+        }
+        for sort, reviews in expected.items():
+            for limit in [1, 2, 3, 10]:
+                self.assertEqual(self.pages(sort, limit), [review.id for review in reviews], (sort, limit))
+
+    def test_rating_cursor_round_trip(self):
+        review = self.reviews[0]
+        self.assertEqual(decode_rating_cursor(encode_rating_cursor(review)), (review.rating, review.created_at, review.id))
+        for cursor in ['', 'not-a-cursor', 'MXwy']:
+            with self.assertRaises(InvalidCursor):
+                decode_rating_cursor(cursor)
+
+    def test_histogram_follows_approval_and_deletion(self):
+        self.assertEqual(rating_histogram(self.product.id), {'1': 2, '2': 0, '3': 3, '4': 0, '5': 2})
+
+        review = Review.objects.filter(product=self.product, rating=5).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            review.is_approved = False
+            review.save()
+        self.assertEqual(rating_histogram(self.product.id)['5'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.is_approved = True
+            review.save()
+        self.assertEqual(rating_histogram(self.product.id)['5'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.filter(product=self.product, rating=1).first().delete()
+        self.assertEqual(rating_histogram(self.product.id), {'1': 1, '2': 0, '3': 3, '4': 0, '5': 2})
+
+
+class ActiveDealCacheTests(TestCase):
+    def setUp(self):
+        self.cache = ActiveDealCache()
+        self.factory = RequestFactory()
+
+    def get(self, host):
+        return self.cache.get(self.factory.get('/api/deals/active/', HTTP_HOST=host))
+
+    @override_settings(DEAL_CACHE_MAX_HOSTS=2)
+    def test_responses_per_host_are_capped(self):
+        for host in ['a.example.com', 'b.example.com', 'c.example.com']:
+            self.assertFalse(self.get(host)[1])
+        self.assertEqual(self.cache.stats()['cached_hosts'], 2)
+        self.assertTrue(self.get('c.example.com')[1])
+        # The oldest host was dropped
+        self.assertFalse(self.get('a.example.com')[1])
+
+    @override_settings(DEAL_CACHE_BASE_URL='https://shop.example.com/')
+    def test_fixed_base_url_shares_one_response(self):
+        self.assertFalse(self.get('a.example.com')[1])
+        self.assertTrue(self.get('b.example.com')[1])
+        self.assertEqual(self.cache.stats()['cached_hosts'], 1)
+
+
+class CatalogTests(TestCase):
+    def test_product_list_query_count_does_not_grow(self):
+        categories = [Category.objects.create(name=f'Catalog {i}') for i in range(3)]
+        client = Client()
+        query_counts = set()
+        for count in (2, 10):
+            Product.objects.bulk_create([
+                Product(
+                    title=f'Catalog product {count}-{i}', price=Decimal('10.00'), description='',
+                    category=categories[i % 3], stock_quantity=1,
+                )
+                for i in range(count)
+            ])
+            for url in ['/api/products/', '/api/products/?limit=5']:
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(client.get(url).status_code, 200)
+                query_counts.add((url, len(queries)))
+        self.assertEqual(len(query_counts), 2, sorted(query_counts))
+
+
+class ProductDetailTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            title='Detail', price=Decimal('10.00'), description='',
+            category=Category.objects.create(name='Detail'), stock_quantity=1,
+        )
+        ProductImage.objects.bulk_create([
+            ProductImage(product=self.product, image=f'products/gallery/detail_{i}.jpg', is_primary=i == 0)
+            for i in range(3)
+        ])
+        for i in range(2):
+            user = User.objects.create_user(username=f'detail{i}', email=f'detail{i}@example.com')
+            Review.objects.create(product=self.product, user=user, rating=4, comment='Good')
+        self.url = f'/api/products/{self.product.id}/details/'
+        cache.delete(product_cache_key(self.product.id))
+        self.addCleanup(cache.delete, product_cache_key(self.product.id))
+
+    def test_two_queries_uncached_and_none_cached(self):
+        client = Client()
+        for expected_queries in (2, 0):
+            with self.assertNumQueries(expected_queries):
+                data = client.get(self.url).json()
+            self.assertEqual((len(data['images']), data['review_count']), (3, 2))
+
+
+class OrderNumberingTests(TestCase):
+    def test_counter_continues_without_gaps(self):
+        user = User.objects.create_user(username='numbered', email='numbered@example.com')
+        UserOrderCounter.objects.create(user=user, last_number=41)
+        numbers = []
+        for _ in range(3):
+            with transaction.atomic():
+                numbers.append(UserOrderCounter.next_number(user))
+        self.assertEqual(numbers, [42, 43, 44])
+
+
+class StatsTests(TestCase):
+    def test_one_query_matches_per_model_counts(self):
+        User.objects.create_user(username='stats', email='stats@example.com')
+        for i, status in enumerate(['pending', 'pending', 'delivered', 'shipped']):
+            Order.objects.create(amount=Decimal('10.25') + i, status=status)
+
+        with self.assertNumQueries(1):
+            stats = compute_stats()
+        self.assertEqual(stats['total_users'], User.objects.count())
+        self.assertEqual(stats['total_orders'], 4)
+        self.assertEqual(
+            (stats['orders_by_status']['pending'], stats['orders_by_status']['delivered']), (2, 1)
+        )
+        self.assertEqual(stats['total_revenue'], sum(order.amount for order in Order.objects.all()))
+
+
+class ORJSONTests(TestCase):
+    def test_renders_and_parses_like_drf(self):
+        now = timezone.now()
+        payload = {'products': [
+            {'id': 1, 'title': 'Caf\u00e9', 'price': 19.99, 'image_url': None, 'created_at': now.isoformat()},
+            {'id': 2, 'title': 'Quote "marks"', 'price': 5.0, 'image_url': '/media/x.jpg', 'created_at': now.isoformat()},
+        ]}
+        rendered = ORJSONRenderer().render(payload)
+        self.assertEqual(rendered, JSONRenderer().render(payload))
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(rendered)), JSONParser().parse(io.BytesIO(rendered)))
+
+    def test_native_values_render_like_converted_ones(self):
+        now = timezone.now()
+        native = {'price': Decimal('19.99'), 'created_at': now}
+        converted = {'price': float(native['price']), 'created_at': now.isoformat()}
+        # DRF writes 'Z' for UTC datetimes, isoformat() '+00:00'
+        self.assertEqual(
+            ORJSONRenderer().render(native), JSONRenderer().render(converted).replace(b'+00:00"', b'Z"')
+        )
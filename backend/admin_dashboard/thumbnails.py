@@ -0,0 +1,45 @@
+"""
+Image resizing for derivatives (see images.py).
+
+This module only depends on Pillow, so worker processes can import it
+without setting up Django.
+"""
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+QUALITY = {'webp': 80, 'jpeg': 82}
+
+
+def _encode(image, fmt):
+    output = BytesIO()
+    if fmt == 'jpeg':
+        image.convert('RGB').save(output, 'JPEG', quality=QUALITY['jpeg'], optimize=True, progressive=True)
+    else:
+        image.save(output, 'WEBP', quality=QUALITY['webp'], method=4)
+    return output.getvalue()
+
+
+def render_derivatives(data, widths, formats):
+    """
+    Resize the image in data so its longer side is each of widths and
+    encode it in each of formats. Returns {width: {format: bytes}}.
+
+    Widths at or above the original's longer side are skipped, since
+    upscaling only makes the file bigger.
+    """
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        longest = max(image.size)
+
+        results = {}
+        # Largest first, so each step shrinks the previous result
+        for width in sorted(widths, reverse=True):
+            if width >= longest:
+                continue
+            image = image.copy()
+            image.thumbnail((width, width), Image.LANCZOS)
+            results[width] = {fmt: _encode(image, fmt) for fmt in formats}
+        return results
@@ -24,7 +24,9 @@ urlpatterns = [
     path('deals/<int:deal_id>/toggle/', views.toggle_deal, name='toggle_deal'),
     path('deals/<int:deal_id>/delete/', views.delete_deal, name='delete_deal'),
     path('api/products/', views.product_list_api, name='product_list_api'),
+    path('api/products/search/', views.product_search_api, name='product_search_api'),
     path('api/deals/active/', views.active_deals_api, name='active_deals_api'),
+    path('api/deals/active/stats/', views.deal_cache_stats_api, name='deal_cache_stats_api'),
     path('api/orders/', views.order_list_api, name='order_list_api'),
     path('api/orders/<int:order_id>/', views.order_detail_api, name='order_detail_api'),
     path('orders/', views.order_list, name='order_list'),
@@ -49,6 +51,7 @@ urlpatterns = [
     path('api/wishlist/', views.get_wishlist, name='get_wishlist'),
     path('api/wishlist/toggle/<str:product_id>/', views.toggle_wishlist, name='toggle_wishlist'),
     path('api/wishlist/check/<str:product_id>/', views.check_wishlist, name='check_wishlist'),
+    path('api/wishlist/contains/', views.wishlist_contains, name='wishlist_contains'),
     path('test-fcm-notification/', views.test_fcm_notification, name='test_fcm_notification'),
 ]
 
@@ -3,19 +3,45 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import get_user_model
 from django.contrib import messages
-from .models import Category, Product, Deal, Order, OrderItem, Notification, Review, Wishlist, Cart, CartItem, ProductImage
+from .models import Category, Product, Deal, Order, OrderItem, OrderTombstone, Notification, Review, Wishlist, Cart, CartItem, ProductImage, link_products
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
 from .serializers import OrderSerializer, ReviewSerializer, ProductImageSerializer, ProductSerializer
-from django.http import JsonResponse, HttpResponse
+from .pagination import InvalidCursor, get_page_size, keyset_paginate
+from .search import search_products
+from .inventory import InsufficientStock, quantities_by_product, release_stock, reserve_stock
+from .push import enqueue_push, record_token_results
+from .realtime import order_events, serialize_order_status, start_order_status_listener
+from .sync import parse_since, sync_window
+from .stats import get_stats
+from .deal_cache import deal_cache
+from .dbpool import pool_stats
+from .replicas import replica_reads
+from .product_cache import get_product_detail
+from .reviews import approved_reviews, paginate_reviews, rating_histogram
+from .images import thumbnail_urls
+from .storage import CONTENT_PREFIX, IMMUTABLE_CACHE_CONTROL
+from .cart import load_cart_products, sync_cart
+from .renderers import ORJSONResponse
+from .orders import order_history, serialize_order
+from django.http import HttpResponse
 from django.views.decorators.http import require_http_methods
+from django.views.static import serve
 import json
 import logging
 import requests
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.fields.json import KeyTextTransform
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from authentication.jwt_auth import CachedJWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.middleware.csrf import get_token
@@ -61,19 +87,16 @@ def dashboard(request):
     print(f"User is_staff: {request.user.is_staff}")
     print(f"User is_active: {request.user.is_active}")
     
-    # Get statistics
-    total_users = User.objects.count()
-    total_categories = Category.objects.count()
-    total_products = Product.objects.count()
-    total_deals = Deal.objects.count()
-    total_orders = Order.objects.count()
+    # Get statistics (one cached query, see stats.py)
+    stats = get_stats()
     
     context = {
-        'total_users': total_users,
-        'total_categories': total_categories,
-        'total_products': total_products,
-        'total_deals': total_deals,
-        'total_orders': total_orders,
+        'total_users': stats['total_users'],
+        'total_categories': stats['total_categories'],
+        'total_products': stats['total_products'],
+        'total_deals': stats['total_deals'],
+        'total_orders': stats['total_orders'],
+        'orders_by_status': stats['orders_by_status'],
     }
     return render(request, 'admin_dashboard/dashboard.html', context)
 
@@ -121,13 +144,14 @@ def delete_category(request, category_id):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@replica_reads
 def category_list_api(request):
     categories = Category.objects.all().order_by('-created_at')
     data = [{
         'id': category.id,
         'name': category.name,
         'icon': category.name.lower(),  # Use the lowercase category name as the icon
-        'created_at': category.created_at.isoformat()
+        'created_at': category.created_at
     } for category in categories]
     return Response({'categories': data})
 
@@ -268,72 +292,136 @@ def delete_product(request, product_id):
         messages.success(request, f'Product "{product.title}" has been deleted.')
     return redirect('admin_dashboard:product_list')
 
+# Output key of product_list_api -> Product columns needed to build it
+PRODUCT_LIST_FIELDS = {
+    'id': ['id'],
+    'title': ['title'],
+    'price': ['price'],
+    'sale_price': ['sale_price'],
+    'description': ['description'],
+    'imageUrl': ['image'],
+    'thumbnails': ['image', 'image_derivatives'],
+    'category': ['category__id', 'category__name'],
+    'stock_quantity': ['stock_quantity'],
+    'is_new': ['is_new'],
+    'is_on_sale': ['is_on_sale'],
+}
+
+def serialize_product_list_item(product, fields):
+    """Build the product_list_api payload for one product, limited to fields"""
+    builders = {
+        'id': lambda: product.id,
+        'title': lambda: product.title,
+        'price': lambda: product.display_price(),
+        'sale_price': lambda: product.display_sale_price() if product.sale_price else None,
+        'description': lambda: product.description,
+        'imageUrl': lambda: product.image.url if product.image else None,
+        'thumbnails': lambda: thumbnail_urls(product.image, product.image_derivatives),
+        'category': lambda: {
+            'id': product.category.id,
+            'name': product.category.name,
+            'icon': product.category.icon
+        },
+        'stock_quantity': lambda: product.stock_quantity,
+        'is_new': lambda: product.is_new,
+        'is_on_sale': lambda: product.is_on_sale,
+    }
+    return {field: builders[field]() for field in fields}
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@replica_reads
 def product_list_api(request):
+    """
+    List products, newest first.
+
+    Optional query parameters:
+      category - only products in this category
+      fields   - comma separated subset of PRODUCT_LIST_FIELDS to return
+      limit    - page size; enables keyset pagination
+      cursor   - next_cursor value from a previous page
+    """
     category_id = request.GET.get('category')
-    
+
+    fields = list(PRODUCT_LIST_FIELDS)
+    if request.GET.get('fields'):
+        requested = [f.strip() for f in request.GET['fields'].split(',') if f.strip()]
+        unknown = [f for f in requested if f not in PRODUCT_LIST_FIELDS]
+        if unknown:
+            return Response(
+                {'error': f'Unknown fields: {", ".join(unknown)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        fields = requested
+
+    # created_at is always loaded because it is the keyset ordering column
+    columns = {'id', 'created_at'}
+    for field in fields:
+        columns.update(PRODUCT_LIST_FIELDS[field])
+
+    products = Product.objects.all()
     if category_id:
-        products = Product.objects.filter(category_id=category_id).order_by('-created_at')
-    else:
-        products = Product.objects.all().order_by('-created_at')
-    
-    data = [{
-        'id': product.id,
-        'title': product.title,
-        'price': product.display_price(),
-        'sale_price': product.display_sale_price() if product.sale_price else None,
-        'description': product.description,
-        'imageUrl': product.image.url if product.image else None,
-        'category': {
-            'id': product.category.id,
-            'name': product.category.name,
-            'icon': product.category.icon
-        },
-        'stock_quantity': product.stock_quantity,
-        'is_new': product.is_new,
-        'is_on_sale': product.is_on_sale,
-    } for product in products]
-    
+        products = products.filter(category_id=category_id)
+    if 'category' in fields:
+        products = products.select_related('category')
+    products = products.only(*columns)
+
+    cursor = request.GET.get('cursor')
+    if cursor or 'limit' in request.GET:
+        try:
+            page, next_cursor = keyset_paginate(products, cursor, get_page_size(request))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'products': [serialize_product_list_item(product, fields) for product in page],
+            'next_cursor': next_cursor,
+        })
+
+    products = products.order_by('-created_at', '-id')
+    data = [serialize_product_list_item(product, fields) for product in products]
     return Response({'products': data})
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_search_api(request):
+    """
+    Ranked full-text product search.
+
+    Query parameters:
+      q        - search terms, matched against title, description and category
+                 name; each term also matches as a prefix
+      category - restrict results to one category (facets are unaffected)
+      page     - 1-based page number
+      limit    - page size
+    """
+    query = request.GET.get('q', '').strip()
+    category_id = request.GET.get('category')
+    limit = get_page_size(request)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+
+    result = search_products(query, category_id=category_id, offset=(page - 1) * limit, limit=limit)
+    fields = list(PRODUCT_LIST_FIELDS)
+    return Response({
+        'query': query,
+        'count': result.total,
+        'page': page,
+        'next_page': page + 1 if page * limit < result.total else None,
+        'facets': {'category': result.facets},
+        'products': [serialize_product_list_item(product, fields) for product in result.products],
+    })
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def active_deals_api(request):
+    """Deals running now, served from deal_cache until the next deal boundary"""
     try:
-        current_time = timezone.now()
-        active_deals = Deal.objects.filter(
-            is_active=True,
-            start_date__lte=current_time,
-            end_date__gte=current_time
-        ).select_related('product', 'product__category')
-
-        data = {
-            'deals': [{
-                'id': str(deal.id),
-                'discount_percentage': deal.discount_percentage,
-                'discount_price': float(deal.discount_price),
-                'start_date': deal.start_date.isoformat(),
-                'end_date': deal.end_date.isoformat(),
-                'product': {
-                    'id': str(deal.product.id),
-                    'title': deal.product.title,
-                    'price': float(deal.product.price),
-                    'description': deal.product.description,
-                    'image_url': request.build_absolute_uri(deal.product.image.url) if deal.product.image else None,
-                    'category': {
-                        'id': deal.product.category.id,
-                        'name': deal.product.category.name,
-                        'icon': deal.product.category.icon
-                    },
-                    'stock_quantity': deal.product.stock_quantity,  # Add stock quantity to the product data
-                    'is_new': deal.product.is_new,
-                    'is_on_sale': True,
-                    'sale_price': float(deal.discount_price),
-                }
-            } for deal in active_deals]
-        }
-        return Response(data)
+        content, hit = deal_cache.get(request)
+        response = HttpResponse(content, content_type='application/json')
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
     except Exception as e:
         print(f"Error in active_deals_api: {str(e)}")
         return Response(
@@ -341,6 +429,18 @@ def active_deals_api(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def deal_cache_stats_api(request):
+    """Hit/miss counters of the active deals cache"""
+    return Response(deal_cache.stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def db_pool_stats_api(request):
+    """Size and wait times of this worker's database connection pool"""
+    return Response(pool_stats())
+
 @login_required
 @user_passes_test(is_admin)
 def deal_list(request):
@@ -440,20 +540,37 @@ def delete_deal(request, deal_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def order_list_api(request):
+    """
+    List the authenticated user's orders, newest first.
+
+    Optional query parameters:
+      limit  - page size; enables keyset pagination and returns
+               {'orders': [...], 'next_cursor': ...}
+      cursor - next_cursor value from a previous page
+    """
     try:
         # Add debug logging
         print(f"Fetching orders for user: {request.user.id}")
         print(f"Authentication header: {request.META.get('HTTP_AUTHORIZATION', 'None')}")
         
         # Only return orders for the authenticated user
-        orders = Order.objects.filter(user=request.user).order_by('-date_time')
-        
-        # Add debug logging
-        print(f"Found {orders.count()} orders")
-        
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        orders = order_history(Order.objects.filter(user=request.user))
+
+        cursor = request.GET.get('cursor')
+        if cursor or 'limit' in request.GET:
+            try:
+                page, next_cursor = keyset_paginate(orders, cursor, get_page_size(request), time_field='date_time')
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'orders': [serialize_order(order, request) for order in page],
+                'next_cursor': next_cursor,
+            })
+
+        orders = orders.order_by('-date_time')
+        return Response([serialize_order(order, request) for order in orders])
     except Exception as e:
         print(f"Error in order_list_api: {str(e)}")  # Add logging
         return Response(
@@ -463,16 +580,15 @@ def order_list_api(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@replica_reads
 def order_detail_api(request, order_id):
-    try:
-        order = Order.objects.get(id=order_id)
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
-    except Order.DoesNotExist:
+    order = order_history(Order.objects.filter(id=order_id)).first()
+    if order is None:
         return Response(
             {'error': 'Order not found'}, 
             status=status.HTTP_404_NOT_FOUND
         )
+    return Response(serialize_order(order))
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -488,38 +604,37 @@ def create_order(request):
 def create_user_order(request):
     try:
         data = request.data
-        order = Order.objects.create(
-            user=request.user,  # Always use the authenticated user
-            amount=data['total_amount'],
-            delivery_info={
-                'phone_number': data['phone_number'],
-                'wilaya': data['wilaya'],
-                'address': data['address'],
-                'name': data['name']
-            },
-            items_data=data['items']
-        )
+        quantities = quantities_by_product(data['items'])
         
-        # Create OrderItem instances and update stock quantities
-        for item in data['items']:
-            OrderItem.objects.create(
-                order=order,
-                product_id=item['product_id'],
-                title=item['title'],
-                quantity=item['quantity'],
-                price=item['price'],
-                image_url=item['image_url']
+        # Stock reservation, the order and its items commit or fail together
+        with transaction.atomic():
+            reserve_stock(quantities)
+            
+            order = Order.objects.create(
+                user=request.user,  # Always use the authenticated user
+                amount=data['total_amount'],
+                delivery_info={
+                    'phone_number': data['phone_number'],
+                    'wilaya': data['wilaya'],
+                    'address': data['address'],
+                    'name': data['name']
+                },
+                items_data=data['items']
             )
             
-            # Update product stock quantity
-            try:
-                product = Product.objects.get(id=item['product_id'])
-                # Ensure stock doesn't go below zero
-                product.stock_quantity = max(0, product.stock_quantity - item['quantity'])
-                product.save()
-            except Product.DoesNotExist:
-                # Log error but continue processing the order
-                print(f"Product with ID {item['product_id']} not found when updating stock")
+            order_items = [
+                OrderItem(
+                    order=order,
+                    product_id=item['product_id'],
+                    title=item['title'],
+                    quantity=item['quantity'],
+                    price=item['price'],
+                    image_url=item['image_url']
+                )
+                for item in data['items']
+            ]
+            link_products(order_items)
+            OrderItem.objects.bulk_create(order_items)
         
         return Response({
             'id': order.id,
@@ -529,38 +644,86 @@ def create_user_order(request):
             'delivery_info': order.delivery_info,
             'items': order.items_data
         }, status=status.HTTP_201_CREATED)
+    except InsufficientStock as e:
+        return Response(
+            {'error': str(e), 'product_ids': e.product_ids},
+            status=status.HTTP_409_CONFLICT
+        )
     except Exception as e:
         print(f"Error in create_user_order: {str(e)}")  # Add logging
         return Response(
             {'error': str(e)},
             status=status.HTTP_400_BAD_REQUEST
         )
+ADMIN_ORDERS_PER_PAGE = 50
+
+def parse_admin_date(value):
+    """Parse a YYYY-MM-DD filter value as the start of that day, or None"""
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
+    return timezone.make_aware(day)
+
 # Create your views here.
 @login_required
 @user_passes_test(is_admin)
 def order_list(request):
+    """Admin order list, newest first, with keyset pagination and filters"""
     search_query = request.GET.get('search', '').strip()
+    status_filter = request.GET.get('status', '').strip()
+    date_from = request.GET.get('date_from', '').strip()
+    date_to = request.GET.get('date_to', '').strip()
     
     # Base queryset
-    orders = Order.objects.all().order_by('id')
+    orders = Order.objects.select_related('user').prefetch_related('items')
     
-    # Apply search filter if search_query exists
+    # Search delivery name and phone; both expressions are covered by
+    # trigram indexes on PostgreSQL (migration 0029)
     if search_query:
-        orders = orders.filter(delivery_info__name__icontains=search_query)
+        orders = orders.annotate(
+            delivery_name=KeyTextTransform('name', 'delivery_info'),
+            delivery_phone=KeyTextTransform('phone_number', 'delivery_info'),
+        ).filter(Q(delivery_name__icontains=search_query) | Q(delivery_phone__icontains=search_query))
+    
+    # Status and date range use the (status, date_time, id) and
+    # (date_time, id) indexes
+    if status_filter in dict(Order.STATUS_CHOICES):
+        orders = orders.filter(status=status_filter)
+    start = parse_admin_date(date_from)
+    if start:
+        orders = orders.filter(date_time__gte=start)
+    end = parse_admin_date(date_to)
+    if end:
+        orders = orders.filter(date_time__lt=end + timedelta(days=1))
+    
+    try:
+        orders, next_cursor = keyset_paginate(
+            orders, request.GET.get('cursor'), ADMIN_ORDERS_PER_PAGE, time_field='date_time'
+        )
+    except InvalidCursor:
+        messages.error(request, 'Invalid page link, showing the first page.')
+        orders, next_cursor = keyset_paginate(orders, None, ADMIN_ORDERS_PER_PAGE, time_field='date_time')
+    
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
     
     # Calculate statistics
-    total_orders = Order.objects.count()
-    completed_orders = Order.objects.filter(status='delivered').count()
-    pending_orders = Order.objects.filter(status='pending').count()
-    total_revenue = sum(order.amount for order in Order.objects.all())
+    stats = get_stats()
     
     context = {
         'orders': orders,
-        'total_orders': total_orders,
-        'completed_orders': completed_orders,
-        'pending_orders': pending_orders,
-        'total_revenue': total_revenue,
+        'total_orders': stats['total_orders'],
+        'completed_orders': stats['orders_by_status']['delivered'],
+        'pending_orders': stats['orders_by_status']['pending'],
+        'total_revenue': stats['total_revenue'],
         'search_query': search_query,  # Pass the search query back to the template
+        'status_filter': status_filter,
+        'date_from': date_from,
+        'date_to': date_to,
+        'next_cursor': next_cursor,
+        'is_first_page': not request.GET.get('cursor'),
+        'filter_query': filters.urlencode(),
         'status_choices': Order.STATUS_CHOICES,
     }
     
@@ -580,21 +743,21 @@ def update_order_status(request, order_id):
             
             old_status = order.status
             if old_status != new_status:
-                order.status = new_status
-                order.save()
-                
-                # Create notification in database
-                notification = Notification.objects.create(
-                    user=order.user,
-                    title='Order Status Updated',
-                    message=f'Your order #{order.id} status has been updated to {new_status}',
-                    order_id=order.id,
-                    is_read=False,
-                    notification_type='ORDER_STATUS'
-                )
-                
-                # Send FCM notification
-                send_fcm_notification(order.user, notification)
+                # The push itself is queued by the Order and Notification
+                # post_save handlers and sent after this transaction commits
+                with transaction.atomic():
+                    order.status = new_status
+                    order.save()
+                    
+                    # Create notification in database
+                    Notification.objects.create(
+                        user=order.user,
+                        title='Order Status Updated',
+                        message=f'Your order #{order.id} status has been updated to {new_status}',
+                        order_id=order.id,
+                        is_read=False,
+                        notification_type='ORDER_STATUS'
+                    )
                 
                 messages.success(request, f'Order #{order.id} status updated successfully')
             
@@ -611,21 +774,11 @@ def delete_order(request, order_id):
         order = get_object_or_404(Order, id=order_id)
         order_id = order.id  # Store the ID before deletion
         
-        # Get all order items
-        order_items = OrderItem.objects.filter(order=order)
-        
         # Restore stock quantities for each item, regardless of order status
-        for item in order_items:
-            try:
-                product = Product.objects.get(id=item.product_id)
-                # Increase the stock quantity by the ordered quantity
-                product.stock_quantity += item.quantity
-                product.save()
-                print(f"Admin restored {item.quantity} items to product {product.title} (ID: {product.id}) from {order.status} order")
-            except Product.DoesNotExist:
-                print(f"Product with ID {item.product_id} not found when restoring stock")
-        
-        order.delete()
+        with transaction.atomic():
+            order_items = OrderItem.objects.filter(order=order).values('product_id', 'quantity')
+            release_stock(quantities_by_product(order_items))
+            order.delete()
         messages.success(request, f'Order #{order_id} has been deleted and stock quantities have been restored.')
     return redirect('admin_dashboard:order_list')
 
@@ -633,21 +786,21 @@ def delete_order(request, order_id):
 def order_status(request, order_id):
     try:
         order = Order.objects.get(id=order_id)
-        return JsonResponse({
+        return ORJSONResponse({
             'status': order.status,
             'order_id': order_id,
-            'updated_at': order.updated_at.isoformat() if hasattr(order, 'updated_at') else None
+            'updated_at': getattr(order, 'updated_at', None)
         })
     except Order.DoesNotExist:
         # Add logging to track which orders are being requested but don't exist
         print(f"Status check for non-existent order ID: {order_id}")
-        return JsonResponse({
+        return ORJSONResponse({
             'error': f'Order not found with id: {order_id}',
             'code': 'order_not_found'
         }, status=404)
     except Exception as e:
         print(f"Error checking status for order {order_id}: {str(e)}")
-        return JsonResponse({
+        return ORJSONResponse({
             'error': str(e),
             'code': 'server_error'
         }, status=500)
@@ -666,10 +819,21 @@ def create_notification(user, title, message, order_id=None):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_notifications(request):
-    """Get user notifications"""
+    """Get user notifications, or with ?since= only those changed since (see sync.py)"""
     try:
-        notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-        return Response({
+        since = parse_since(request.GET.get('since'))
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        window = sync_window(Notification.objects.filter(user=request.user), since)
+        not_modified = window.not_modified(request)
+        if not_modified:
+            return not_modified
+
+        notifications = window.rows.select_related('user').order_by('-created_at')
+        response = Response({
+            'full': window.full,
+            'next_since': window.next_since,
             'notifications': [{
                 'id': notif.id,
                 'title': notif.title,
@@ -680,6 +844,8 @@ def get_notifications(request):
                 'user_id': notif.user.id
             } for notif in notifications]
         })
+        response['ETag'] = window.etag
+        return response
     except Exception as e:
         print(f"Error in get_notifications: {str(e)}")
         return Response(
@@ -780,9 +946,10 @@ def review_list(request):
 @user_passes_test(is_admin)
 def toggle_review_approval(request, review_id):
     """Toggle the approval status of a review"""
-    review = get_object_or_404(Review, id=review_id)
-    review.is_approved = not review.is_approved
-    review.save()
+    with transaction.atomic():
+        review = get_object_or_404(Review.objects.select_for_update(), id=review_id)
+        review.is_approved = not review.is_approved
+        review.save()
     
     status_text = "approved" if review.is_approved else "unapproved"
     messages.success(request, f"Review has been {status_text}.")
@@ -793,24 +960,52 @@ def toggle_review_approval(request, review_id):
 @user_passes_test(is_admin)
 def delete_review(request, review_id):
     """Delete a review"""
-    review = get_object_or_404(Review, id=review_id)
-    product_title = review.product.title
-    review.delete()
+    with transaction.atomic():
+        # Locked so a concurrent delete waits and then 404s instead of
+        # adjusting the product's rating aggregates a second time
+        review = get_object_or_404(Review.objects.select_for_update(), id=review_id)
+        product_title = review.product.title
+        review.delete()
     
     messages.success(request, f"Review for '{product_title}' has been deleted.")
     return redirect('admin_dashboard:review_list')
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@replica_reads
 def product_reviews(request, product_id):
-    """Get all approved reviews for a product"""
-    # Update to only return approved reviews
-    reviews = Review.objects.filter(
-        product_id=product_id, 
-        is_approved=True
-    ).order_by('-created_at')
-    serializer = ReviewSerializer(reviews, many=True)
-    return Response(serializer.data)
+    """
+    Get approved reviews for a product.
+
+    Without query parameters all reviews are returned as a list, newest
+    first. With any of these a page is returned instead, as
+    {'reviews': [...], 'next_cursor': ...}:
+      sort      - newest (default), highest or lowest
+      limit     - page size
+      cursor    - next_cursor from the previous page
+      histogram - if 1, also return the 1-5 star counts as 'histogram'
+    """
+    # Users are joined in; the serializer reads them for every review
+    reviews = approved_reviews(product_id)
+    
+    if not any(param in request.GET for param in ['sort', 'limit', 'cursor', 'histogram']):
+        serializer = ReviewSerializer(reviews.order_by('-created_at'), many=True)
+        return Response(serializer.data)
+    
+    try:
+        page, next_cursor = paginate_reviews(
+            reviews, request.GET.get('sort', 'newest'), request.GET.get('cursor'), get_page_size(request)
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = {
+        'reviews': ReviewSerializer(page, many=True).data,
+        'next_cursor': next_cursor,
+    }
+    if request.GET.get('histogram') in ['1', 'true']:
+        data['histogram'] = rating_histogram(product_id)
+    return Response(data)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -818,24 +1013,28 @@ def create_review(request, product_id):
     """Create or update a review for a product"""
     try:
         product = get_object_or_404(Product, id=product_id)
+        rating = int(request.data.get('rating'))
         
-        # Check if user already reviewed this product
-        review, created = Review.objects.get_or_create(
-            product=product,
-            user=request.user,
-            defaults={
-                'rating': request.data.get('rating'),
-                'comment': request.data.get('comment'),
-                'is_approved': True  # Reviews are approved by default
-            }
-        )
-        
-        # If review exists, update it
-        if not created:
-            review.rating = request.data.get('rating')
-            review.comment = request.data.get('comment')
-            # Keep existing approval status when updating
-            review.save()
+        # The review write and the Product rating aggregate update made by
+        # the Review post_save handler commit together
+        with transaction.atomic():
+            # Check if user already reviewed this product
+            review, created = Review.objects.select_for_update().get_or_create(
+                product=product,
+                user=request.user,
+                defaults={
+                    'rating': rating,
+                    'comment': request.data.get('comment'),
+                    'is_approved': True  # Reviews are approved by default
+                }
+            )
+            
+            # If review exists, update it
+            if not created:
+                review.rating = rating
+                review.comment = request.data.get('comment')
+                # Keep existing approval status when updating
+                review.save()
             
         return Response(ReviewSerializer(review).data, status=status.HTTP_201_CREATED)
     except Exception as e:
@@ -865,7 +1064,7 @@ def get_csrf_token(request):
     Returns a CSRF token for use in frontend forms
     """
     csrf_token = get_token(request)
-    return JsonResponse({'csrf_token': csrf_token})
+    return ORJSONResponse({'csrf_token': csrf_token})
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
@@ -886,25 +1085,14 @@ def delete_user_order(request, order_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Store the order items before deletion to restore stock
-        order_items = OrderItem.objects.filter(order=order)
-        
-        # Restore stock quantities for each item
-        for item in order_items:
-            try:
-                product = Product.objects.get(id=item.product_id)
-                # Increase the stock quantity by the ordered quantity
-                product.stock_quantity += item.quantity
-                product.save()
-                print(f"Restored {item.quantity} items to product {product.title} (ID: {product.id})")
-            except Product.DoesNotExist:
-                print(f"Product with ID {item.product_id} not found when restoring stock")
-        
         # Store the order ID before deletion
         order_id_str = str(order.id)
         
-        # Delete the order
-        order.delete()
+        # Restore stock quantities and delete the order in one transaction
+        with transaction.atomic():
+            order_items = OrderItem.objects.filter(order=order).values('product_id', 'quantity')
+            release_stock(quantities_by_product(order_items))
+            order.delete()
         
         # Return success response
         return Response(
@@ -928,7 +1116,8 @@ def delete_user_order(request, order_id):
 @permission_classes([IsAuthenticated])
 def get_wishlist(request):
     """Get user's wishlist items"""
-    wishlist_items = Wishlist.objects.filter(user=request.user)
+    # Products and their categories come from the same query
+    wishlist_items = Wishlist.objects.filter(user=request.user).select_related('product__category').order_by('id')
     products = [item.product for item in wishlist_items]
     
     data = [{
@@ -977,13 +1166,45 @@ def toggle_wishlist(request, product_id):
 def check_wishlist(request, product_id):
     """Check if product is in user's wishlist"""
     try:
-        product = get_object_or_404(Product, id=product_id)
-        is_in_wishlist = Wishlist.objects.filter(user=request.user, product=product).exists()
+        # One query that also tells a missing product apart
+        in_wishlist = Wishlist.objects.filter(user=request.user, product=OuterRef('pk'))
+        is_in_wishlist = (
+            Product.objects.filter(id=product_id)
+            .values_list(Exists(in_wishlist), flat=True)
+            .first()
+        )
+        if is_in_wishlist is None:
+            return Response({'error': 'No Product matches the given query.'}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({'in_wishlist': is_in_wishlist})
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+WISHLIST_CONTAINS_MAX_IDS = 200
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def wishlist_contains(request):
+    """Check many products at once: ?ids=1,2,3 -> {'in_wishlist': {'1': true, ...}}"""
+    try:
+        ids = [value for param in request.query_params.getlist('ids') for value in param.split(',') if value.strip()]
+        try:
+            product_ids = {int(value) for value in ids}
+        except ValueError:
+            return Response({'error': 'ids must be a comma-separated list of product IDs'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(product_ids) > WISHLIST_CONTAINS_MAX_IDS:
+            return Response({'error': f'At most {WISHLIST_CONTAINS_MAX_IDS} ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Answered from the (user, product) unique index
+        found = set(
+            Wishlist.objects.filter(user=request.user, product_id__in=product_ids)
+            .values_list('product_id', flat=True)
+        ) if product_ids else set()
+        
+        return Response({'in_wishlist': {str(product_id): product_id in found for product_id in sorted(product_ids)}})
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_user_cart(request):
@@ -992,29 +1213,31 @@ def get_user_cart(request):
         # Get or create the user's cart
         cart, created = Cart.objects.get_or_create(user=request.user)
         
-        # Get cart items with product details
+        # Get cart items with product details (one join, see cart.py)
+        items = list(cart.items.select_related('product_ref'))
+        products = load_cart_products(items)
         cart_items = []
-        for item in cart.items.all():
-            try:
-                product = Product.objects.get(id=item.product_id)
-                
-                # Ensure image URL is absolute
-                image_url = ''
-                if product.image:
-                    image_url = request.build_absolute_uri(product.image.url)
-                
-                cart_items.append({
-                    'product_id': str(item.product_id),
-                    'quantity': item.quantity,  # Make sure we're returning the correct quantity
-                    'price': float(product.price),
-                    'title': product.title,
-                    'image_url': image_url,
-                    'stock_quantity': product.stock_quantity
-                })
-                print(f"Added item to cart response: {item.product_id}, quantity: {item.quantity}")
-            except Product.DoesNotExist:
+        for item in items:
+            product = products.get(item.product_id)
+            if product is None:
                 print(f"Product with ID {item.product_id} not found")
                 # Skip this item or handle as needed
+                continue
+            
+            # Ensure image URL is absolute
+            image_url = ''
+            if product.image:
+                image_url = request.build_absolute_uri(product.image.url)
+            
+            cart_items.append({
+                'product_id': str(item.product_id),
+                'quantity': item.quantity,  # Make sure we're returning the correct quantity
+                'price': product.price,
+                'title': product.title,
+                'image_url': image_url,
+                'thumbnails': thumbnail_urls(product.image, product.image_derivatives, request),
+                'stock_quantity': product.stock_quantity
+            })
         
         return Response({
             'items': cart_items
@@ -1031,21 +1254,15 @@ def sync_user_cart(request):
         data = request.data
         cart_items = data.get('items', [])
         
-        # Get or create user's cart
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        
-        # Clear existing items
-        cart.items.all().delete()
+        # Only the lines that changed are written (see cart.py)
+        diff = sync_cart(request.user, cart_items)
         
-        # Add new items
-        for item in cart_items:
-            CartItem.objects.create(
-                cart=cart,
-                product_id=item['product_id'],
-                quantity=item['quantity']
-            )
-        
-        return Response({'status': 'success'}, status=status.HTTP_200_OK)
+        return Response({
+            'status': 'success',
+            'inserted': len(diff.inserted),
+            'updated': len(diff.updated),
+            'removed': len(diff.removed),
+        }, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1053,17 +1270,11 @@ def sync_user_cart(request):
 @permission_classes([AllowAny])
 def product_detail_api(request, product_id):
     """API endpoint to get detailed product information"""
-    try:
-        product = Product.objects.get(id=product_id)
-    except Product.DoesNotExist:
+    # Product with its images, cached per product (see product_cache.py)
+    data = get_product_detail(product_id, request)
+    if data is None:
         return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-    
-    # Get product images
-    product_images = ProductImage.objects.filter(product=product)
-    
-    # Serialize the product with its images
-    serializer = ProductSerializer(product, context={'request': request})
-    return Response(serializer.data)
+    return Response(data)
 
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
@@ -1106,6 +1317,16 @@ def delete_product_image(request, image_id):
     except ProductImage.DoesNotExist:
         return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
 
+def serve_content_media(request, path):
+    """
+    Serve a content-addressed product image (see storage.py). Its name
+    changes whenever its bytes do, so it can be cached forever. Only routed
+    with DEBUG, like the rest of MEDIA_URL.
+    """
+    response = serve(request, f'{CONTENT_PREFIX}/{path}', document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
 def add_test_images(request, product_id):
@@ -1324,11 +1545,13 @@ def delete_user_review(request, review_id):
     """
     try:
         # Get the review and ensure it belongs to the requesting user
-        review = get_object_or_404(Review, id=review_id, user=request.user)
-        
-        # Delete the review
-        product_title = review.product.title
-        review.delete()
+        with transaction.atomic():
+            # Locked like in delete_review, so the rating aggregates are only adjusted once
+            review = Review.objects.select_for_update().get(id=review_id, user=request.user)
+            
+            # Delete the review
+            product_title = review.product.title
+            review.delete()
         
         return Response(
             {'message': f'Your review for "{product_title}" has been deleted.'},
@@ -1344,70 +1567,28 @@ def delete_user_review(request, review_id):
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 def send_fcm_notification(user, notification):
-    """Send FCM notification to a user"""
-    try:
-        print(f"Attempting to send FCM notification to user {user.email} for notification ID {notification.id}")
-        
-        # Get user's FCM tokens
-        fcm_tokens = FCMToken.objects.filter(user=user).values_list('token', flat=True)
-        
-        if not fcm_tokens:
-            print(f"No FCM tokens found for user {user.email}")
-            return
-        
-        print(f"Found {len(fcm_tokens)} FCM tokens for user {user.email}")
-        
-        # Create message
-        message = messaging.MulticastMessage(
-            tokens=list(fcm_tokens),
-            notification=messaging.Notification(
-                title=notification.title,
-                body=notification.message,
-            ),
-            data={
-                'orderId': str(notification.order_id),
-                'notificationId': str(notification.id),
-                'type': 'order_status_update',
-                'userId': str(user.id),
-                'userOrderNumber': str(notification.order_id),
-            },
-            android=messaging.AndroidConfig(
-                priority='high',
-                notification=messaging.AndroidNotification(
-                    icon='ic_notification',
-                    color='#2196F3',
-                    channel_id='order_updates',
-                ),
-            ),
-            apns=messaging.APNSConfig(
-                payload=messaging.APNSPayload(
-                    aps=messaging.Aps(
-                        badge=1,
-                        sound='default',
-                    ),
-                ),
-            ),
-        )
-        
-        print(f"Sending FCM message: {message}")
-        
-        # Send message
-        response = messaging.send_multicast(message)
-        print(f"Successfully sent message: {response.success_count} successful, {response.failure_count} failed")
-        
-        # Log failures if any
-        if response.failure_count > 0:
-            for idx, resp in enumerate(response.responses):
-                if not resp.success:
-                    print(f"Failed to send message to token {fcm_tokens[idx]}: {resp.exception}")
-                    
-        return response.success_count > 0
-    except Exception as e:
-        print(f"Error sending FCM notification: {str(e)}")
-        print(f"Error details: {type(e).__name__}")
-        import traceback
-        traceback.print_exc()
-        return False
+    """Queue an FCM notification for a Notification row"""
+    dedupe_key = f'notification:{notification.id}'
+    if notification.notification_type == 'ORDER_STATUS' and notification.order_id:
+        # Share the key used by send_order_status_notification so a status
+        # change only produces one push
+        order_status = Order.objects.filter(id=notification.order_id).values_list('status', flat=True).first()
+        if order_status:
+            dedupe_key = f'order:{notification.order_id}:status:{order_status}'
+
+    return enqueue_push(
+        user,
+        notification.title,
+        notification.message,
+        data={
+            'orderId': str(notification.order_id),
+            'notificationId': str(notification.id),
+            'type': 'order_status_update',
+            'userId': str(user.id),
+            'userOrderNumber': str(notification.order_id),
+        },
+        dedupe_key=dedupe_key,
+    ) is not None
 
 # Connect the send_fcm_notification function to the post_save signal of the Notification model
 @receiver(post_save, sender=Notification)
@@ -1418,66 +1599,114 @@ def handle_notification(sender, instance, created, **kwargs):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def order_status_updates(request):
-    """Get status updates for user's orders"""
+    """Get status updates for user's orders, or with ?since= only those changed since (see sync.py)"""
     try:
-        # Get all orders for the current user
-        orders = Order.objects.filter(user=request.user).order_by('-date_time')
-        
-        # Serialize orders
-        orders_data = []
-        for order in orders:
-            orders_data.append({
-                'id': str(order.id),
-                'user_order_number': order.user_order_number,
-                'amount': float(order.amount),
-                'date_time': order.date_time.isoformat(),
-                'status': order.status,
-                'delivery_info': order.delivery_info,
-                # Add other fields as needed
-            })
-        
-        return JsonResponse({'orders': orders_data}, status=200)
+        since = parse_since(request.GET.get('since'))
+    except InvalidCursor as e:
+        return ORJSONResponse({'error': str(e)}, status=400)
+    try:
+        # Only valid if the stream is served by this process; the app takes
+        # its cursor from order_status_stream itself
+        cursor = order_events.cursor()
+
+        window = sync_window(
+            Order.objects.filter(user=request.user),
+            since,
+            tombstones=OrderTombstone.objects.filter(user=request.user),
+        )
+        not_modified = window.not_modified(request)
+        if not_modified:
+            return not_modified
+
+        orders = window.rows.order_by('-date_time')
+        orders_data = [serialize_order_status(order) for order in orders]
+        deleted = []
+        if window.deleted is not None:
+            deleted = [str(order_id) for order_id in window.deleted.values_list('order_id', flat=True)]
+        
+        response = ORJSONResponse({
+            'orders': orders_data,
+            'deleted': deleted,
+            'full': window.full,
+            'next_since': window.next_since,
+            'cursor': cursor,
+        }, status=200)
+        response['ETag'] = window.etag
+        return response
     except Exception as e:
         print(f"Error getting order status updates: {str(e)}")
-        return JsonResponse(
+        return ORJSONResponse(
             {'error': 'Failed to get order status updates'},
             status=500
         )
 
-def send_order_status_notification(order):
-    """Send FCM notification for order status update"""
+# Long polls are capped below common proxy idle timeouts
+STREAM_DEFAULT_TIMEOUT = 25
+STREAM_MAX_TIMEOUT = 55
+
+def authenticate_stream_request(request):
+    """The user a status stream request is authenticated as, or None"""
     try:
-        # Get user's FCM tokens
-        fcm_tokens = FCMToken.objects.filter(user=order.user).values_list('token', flat=True)
-        
-        if not fcm_tokens:
-            print(f"No FCM tokens found for user {order.user.email}")
-            return
-        
-        # Create message
-        status_message = get_status_message(order.status)
-        
-        message = messaging.MulticastMessage(
-            tokens=list(fcm_tokens),
-            notification=messaging.Notification(
-                title="Order Status Update",
-                body=f"Your order #{order.user_order_number} has been {status_message}"
-            ),
-            data={
-                'orderId': str(order.id),
-                'userOrderNumber': str(order.user_order_number),
-                'userId': str(order.user.id),
-                'status': order.status,
-                'type': 'order_update'
-            }
-        )
-        
-        # Send message
-        response = messaging.send_multicast(message)
-        print(f"Successfully sent message: {response.success_count} success, {response.failure_count} failure")
-        
-    except Exception as e:
-        print(f"Error sending FCM notification: {str(e)}")
+        auth = CachedJWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        auth = None
+    finally:
+        # On a user cache miss this used a (pooled) connection; don't hold it while parked
+        connection.close()
+    if auth is None or not auth[0].is_active:
+        return None
+    return auth[0]
+
+async def order_status_stream(request):
+    """
+    Long-poll for the current user's order status changes.
+
+    GET ?since=<cursor>&timeout=<seconds> returns as soon as an order of the
+    user changes status, or with no events once the timeout expires:
+    {'cursor', 'events': [{'seq', 'order'}], 'resync'}. Pass the returned
+    cursor as `since` on the next call; 'resync' means events may have been
+    missed and the client should refetch /api/orders/status-updates/.
+    Without `since` it answers at once with a cursor and 'resync'.
+
+    This is a plain async view, and every middleware supports async, so
+    served by the ASGI app a parked request holds no worker thread or
+    database connection.
+    """
+    if request.method != 'GET':
+        return ORJSONResponse({'error': 'Method not allowed'}, status=405)
+    user = await sync_to_async(authenticate_stream_request)(request)
+    if user is None:
+        return ORJSONResponse({'error': 'Authentication credentials were not provided or are invalid'}, status=401)
+
+    try:
+        timeout = float(request.GET.get('timeout', STREAM_DEFAULT_TIMEOUT))
+    except ValueError:
+        return ORJSONResponse({'error': 'timeout must be a number'}, status=400)
+    timeout = min(max(timeout, 0), STREAM_MAX_TIMEOUT)
+
+    # Relays status changes saved by other processes (see realtime.py)
+    await sync_to_async(start_order_status_listener)()
+    batch = await order_events.wait(user.id, request.GET.get('since'), timeout)
+    return ORJSONResponse({'cursor': batch.cursor, 'events': batch.events, 'resync': batch.resync})
+
+def send_order_status_notification(order):
+    """Queue an FCM notification for an order status update"""
+    if not order.user:
+        return
+    status_message = get_status_message(order.status)
+    enqueue_push(
+        order.user,
+        "Order Status Update",
+        f"Your order #{order.user_order_number} has been {status_message}",
+        data={
+            'orderId': str(order.id),
+            'userOrderNumber': str(order.user_order_number),
+            'userId': str(order.user.id),
+            'status': order.status,
+            'type': 'order_update'
+        },
+        dedupe_key=f'order:{order.id}:status:{order.status}',
+    )
 
 def get_status_message(status):
     """Get human-readable status message"""
@@ -1504,7 +1733,7 @@ def test_fcm_notification(request):
         print(f"Attempting to send test FCM notification to user {user.email}")
         
         # Get user's FCM tokens
-        fcm_tokens = FCMToken.objects.filter(user=user).values_list('token', flat=True)
+        fcm_tokens = list(FCMToken.objects.filter(user=user, is_active=True).values_list('token', flat=True))
         
         if not fcm_tokens:
             print(f"No FCM tokens found for user {user.email}")
@@ -1559,6 +1788,7 @@ def test_fcm_notification(request):
         # Send message
         response = messaging.send_multicast(message)
         print(f"FCM response: {response.success_count} successful, {response.failure_count} failed")
+        record_token_results(fcm_tokens, [None if resp.success else resp.exception for resp in response.responses])
         
         # Log failures if any
         if response.failure_count > 0:
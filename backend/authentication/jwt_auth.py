@@ -0,0 +1,111 @@
+"""
+JWT authentication without a user query per request.
+
+JWTAuthentication validates the access token without touching the
+database, then loads the user row to check that it still exists and is
+active. CachedJWTAuthentication keeps the loaded users in an in-process
+cache for AUTH_USER_CACHE_TIMEOUT seconds, so a client polling the API
+(order status updates, the cart) authenticates with zero queries.
+
+Saving or deleting a user drops it from the cache of the process that
+did it, so toggle_user_status and delete_user take effect at once there.
+Other processes notice within AUTH_USER_CACHE_TIMEOUT seconds. Views get
+a copy of the cached user and may change and save it.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+
+
+class UserCache:
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        # str(user id) -> (expires at, user); token claims may carry the id as a string
+        self._users = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(str(user_id))
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id, user):
+        expires_at = time.monotonic() + getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 30)
+        with self._lock:
+            self._users.pop(str(user_id), None)
+            self._users[str(user_id)] = (expires_at, user)
+            # Entries are kept in insertion order, so the oldest goes first
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'users': len(self._users),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+            }
+
+
+user_cache = UserCache(getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        user = user_cache.get(user_id)
+        if user is None:
+            # Loads the user and raises for missing or inactive users and revoked tokens
+            user = super().get_user(validated_token)
+            user_cache.put(user_id, user)
+            return copy.copy(user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return copy.copy(user)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_id = instance.pk  # cleared once a delete completes
+    user_cache.invalidate(user_id)
+    # A request that read the old row before the commit may have cached it again
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_fcmtoken_health'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_image_derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
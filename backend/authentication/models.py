@@ -6,6 +6,8 @@ class User(AbstractUser):
     wilaya = models.CharField(max_length=100, null=True, blank=True)
     phone = models.CharField(max_length=20, null=True, blank=True)
     profile_image = models.ImageField(upload_to='profile_images/', null=True, blank=True)
+    # Resized copies of profile_image, see admin_dashboard/images.py
+    profile_image_derivatives = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -16,9 +18,19 @@ class FCMToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fcm_tokens')
     token = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the app registers the token again
+    updated_at = models.DateTimeField(auto_now=True)
+    # Consecutive transient delivery failures; reset on success or re-registration
+    failure_count = models.PositiveIntegerField(default=0)
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+    # Quarantined tokens are skipped when sending until re-registered or compacted away
+    is_active = models.BooleanField(default=True)
     
     class Meta:
         unique_together = ('user', 'token')
+        indexes = [
+            models.Index(fields=['user', 'is_active'], name='fcmtoken_user_active_idx'),
+        ]
         
     def __str__(self):
         return f"{self.user.email} - {self.token[:10]}..."
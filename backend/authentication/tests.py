@@ -1,3 +1,71 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .jwt_auth import CachedJWTAuthentication, user_cache
+from .models import User
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='secret-pass-1')
+        self.header = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.request = RequestFactory().get('/api/orders/status-updates/', **self.header)
+        self.authenticator = CachedJWTAuthentication()
+
+    def rejection(self):
+        """The error code authenticating self.request fails with, or None"""
+        try:
+            self.authenticator.authenticate(self.request)
+        except AuthenticationFailed as e:
+            return str(e.detail['code'])
+        return None
+
+    def test_cached_user_costs_no_queries(self):
+        first, _ = self.authenticator.authenticate(self.request)
+        with CaptureQueriesContext(connection) as queries:
+            second, _ = self.authenticator.authenticate(self.request)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(second.id, self.user.id)
+        # Views get their own copy and may change it
+        self.assertIsNot(second, first)
+
+    def test_admin_deactivation_and_deletion_take_effect(self):
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='secret-pass-1')
+        admin_client = Client()
+        admin_client.force_login(admin)
+
+        # Each successful authentication caches the user as it was before the next change
+        self.assertIsNone(self.rejection())
+        for url, expected in [
+            (f'/dashboard/users/{self.user.id}/toggle/', 'user_inactive'),
+            (f'/dashboard/users/{self.user.id}/toggle/', None),
+            (f'/dashboard/users/{self.user.id}/delete/', 'user_not_found'),
+        ]:
+            admin_client.post(url)
+            self.assertEqual(self.rejection(), expected, url)
+
+    def test_stale_cached_user_does_not_undo_other_changes(self):
+        stale, _ = self.authenticator.authenticate(self.request)
+        # Another process deactivates the user; this process's cache still has the active copy
+        User.objects.filter(id=self.user.id).update(is_active=False, first_name='Changed elsewhere')
+
+        client = Client()
+        for url, data in [
+            ('/auth/shipping-address/update/', {'address': '1 Main Street', 'wilaya': 'Algiers', 'phone': '0555000000'}),
+            ('/auth/profile/update/', {'last_name': 'Buyer'}),
+        ]:
+            # Saving drops the user from this process's cache, so put the stale copy back
+            user_cache.put(self.user.id, stale)
+            response = client.put(url, data, content_type='application/json', **self.header)
+            self.assertEqual(response.status_code, 200, url)
+
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.first_name, 'Changed elsewhere')
+        self.assertEqual((self.user.address, self.user.last_name), ('1 Main Street', 'Buyer'))
@@ -8,7 +8,8 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import logging
-from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.parsers import MultiPartParser, FormParser
+from admin_dashboard.renderers import ORJSONParser
 from rest_framework.decorators import api_view, permission_classes
 from .models import FCMToken
 
@@ -86,7 +87,7 @@ def login_view(request):
 @method_decorator(csrf_exempt, name='dispatch')
 class UpdateProfileView(APIView):
     permission_classes = [IsAuthenticated]
-    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    parser_classes = [MultiPartParser, FormParser, ORJSONParser]
 
     def put(self, request):
         logger.info(f"Received profile update request. Data: {request.data}")
@@ -102,17 +103,24 @@ class UpdateProfileView(APIView):
             phone = request.data.get('phone')
             profile_image = request.FILES.get('profile_image')
 
+            # request.user may come from the authentication cache and be a few
+            # seconds old, so only the fields changed here are written back
+            update_fields = ['updated_at']
             if first_name is not None:
                 user.first_name = first_name
+                update_fields.append('first_name')
             if last_name is not None:
                 user.last_name = last_name
+                update_fields.append('last_name')
             if phone is not None:
                 user.phone = phone
+                update_fields.append('phone')
             if profile_image is not None:
                 # Save the profile image
                 user.profile_image = profile_image
+                update_fields.append('profile_image')
 
-            user.save()
+            user.save(update_fields=update_fields)
 
             # Get the profile image URL
             profile_image_url = None
@@ -165,7 +173,8 @@ class UpdateShippingAddressView(APIView):
             user.address = address
             user.wilaya = wilaya
             user.phone = phone
-            user.save()
+            # Only these fields: request.user may be a cached copy (see jwt_auth.py)
+            user.save(update_fields=['address', 'wilaya', 'phone', 'updated_at'])
 
             response_data = {
                 'user': {
@@ -225,9 +234,10 @@ def update_fcm_token(request):
             return Response({'error': 'Token is required'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Update or create FCM token
+        # Re-registration proves the device is alive, so clear any failure history
         FCMToken.objects.update_or_create(
             token=token,
-            defaults={'user': user}
+            defaults={'user': user, 'failure_count': 0, 'last_failure_at': None, 'is_active': True}
         )
         
         return Response({'success': True}, status=status.HTTP_200_OK)
@@ -255,7 +265,11 @@ def register_fcm_token(request):
         # Check if token already exists for this user
         existing_token = FCMToken.objects.filter(user=user, token=token).first()
         if existing_token:
-            # Token already registered
+            # Token already registered; refresh it and clear any failure history
+            existing_token.failure_count = 0
+            existing_token.last_failure_at = None
+            existing_token.is_active = True
+            existing_token.save()
             return Response({'message': 'Token already registered'}, status=status.HTTP_200_OK)
         
         # Create new token
@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Serve /api/orders/status-stream/ through this application (e.g. with
+uvicorn or daphne): the view and every middleware are async, so parked
+long polls hold neither a worker thread nor a database connection. Each
+process relays status changes saved by any process into its pub/sub hub
+(see admin_dashboard/realtime.py).
 """
 
 import os
@@ -14,3 +20,14 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_backend.settings')
 
 application = get_asgi_application()
+
+# Flip deal prices at their start/end times (admin_dashboard/tasks.py)
+# and deliver queued push notifications (admin_dashboard/push.py)
+from admin_dashboard.push import start_push_dispatcher  # noqa: E402
+from admin_dashboard.realtime import start_order_status_listener  # noqa: E402
+from admin_dashboard.tasks import start_deal_scheduler  # noqa: E402
+
+start_deal_scheduler()
+start_push_dispatcher()
+# Feed the order status stream with changes saved by other processes
+start_order_status_listener()
@@ -1,12 +1,14 @@
-class CsrfExemptMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+from django.utils.deprecation import MiddlewareMixin
 
-    def __call__(self, request):
+
+class CsrfExemptMiddleware(MiddlewareMixin):
+    # MiddlewareMixin supports sync and async requests, so async views
+    # (the order status stream) don't need a thread for the whole request
+
+    def process_request(self, request):
         # Check if the request path starts with any of these prefixes
         exempt_prefixes = ['/api/', '/auth/', '/login/', '/register/', '/mobile/']
         for prefix in exempt_prefixes:
             if request.path.startswith(prefix):
                 setattr(request, '_dont_enforce_csrf_checks', True)
                 break
-        return self.get_response(request)
\ No newline at end of file
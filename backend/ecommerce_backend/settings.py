@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'ecommerce_backend.middleware.CsrfExemptMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'admin_dashboard.middleware.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -89,9 +91,71 @@ DATABASES = {
         'PASSWORD': 'mouad123',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Check reused connections before handing them out (see admin_dashboard/dbpool.py)
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Each worker process keeps its own pool: max_size should cover the worker's
+# threads, and workers x max_size must stay below Postgres' max_connections.
+# Requests that find every connection busy wait up to 'timeout' seconds.
+DATABASE_POOL = {
+    'min_size': 2,
+    'max_size': 10,
+    'timeout': 10,
+    'max_idle': 300,
+    'max_lifetime': 1800,
+}
+# Without psycopg 3 and psycopg_pool, keep each thread's connection instead
+DATABASE_CONN_MAX_AGE = 60
+
+if DATABASE_POOL and find_spec('psycopg') and find_spec('psycopg_pool'):
+    DATABASES['default']['OPTIONS'] = {'pool': DATABASE_POOL}
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+
+# A streaming replica of 'default': point HOST at it and list it in
+# DATABASE_REPLICAS to use it. Tests run it as a mirror of 'default'.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'TEST': {'MIRROR': 'default'},
+}
+
+# Read replicas of 'default' (aliases in DATABASES) used by views marked
+# @replica_reads (see admin_dashboard/replicas.py). Pinning users to the
+# primary after a write needs a cache shared by all web processes.
+DATABASE_ROUTERS = ['admin_dashboard.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+# Reads of a user who sent a write request stay on the primary this long
+REPLICA_STICKY_SECONDS = 10
+# Replicas further behind than this (in seconds) are skipped; lag is re-measured every interval
+REPLICA_MAX_LAG = 5
+REPLICA_LAG_CHECK_INTERVAL = 1
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/ref/settings/#caches
+
+# Cached product details, stats and replica pins are dropped on write, so
+# every web process must share one cache: with a per-process cache, the
+# other workers keep serving an entry until it expires. Without redis-py
+# (or with CACHE_REDIS_URL = None) a per-process cache is used, which is
+# only correct with a single worker process, e.g. runserver.
+CACHE_REDIS_URL = 'redis://127.0.0.1:6379/1'
+
+if CACHE_REDIS_URL and find_spec('redis'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -144,12 +208,23 @@ AUTH_USER_MODEL = 'authentication.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with an in-process user cache (see authentication/jwt_auth.py)
+        'authentication.jwt_auth.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson in place of the json module (see admin_dashboard/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'admin_dashboard.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'admin_dashboard.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # JWT settings
@@ -169,6 +244,62 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Users authenticated by JWT are cached per process for this many seconds;
+# deactivating a user reaches other processes within that time
+AUTH_USER_CACHE_TIMEOUT = 30
+AUTH_USER_CACHE_SIZE = 10000
+
+# Push notifications (see admin_dashboard/push.py)
+# 'thread' drains the outbox from a background thread in each web process;
+# 'command' leaves it to `python manage.py run_push_worker`
+PUSH_WORKER = 'thread'
+PUSH_TRANSPORT = 'admin_dashboard.push.FirebaseTransport'
+PUSH_BATCH_SIZE = 500  # FCM's multicast limit
+PUSH_MAX_ATTEMPTS = 5
+PUSH_RETRY_BASE_SECONDS = 30
+PUSH_POLL_INTERVAL = 30
+PUSH_TOKEN_COMPACT_INTERVAL = 6 * 60 * 60
+# Transient failures in a row before a token is quarantined
+FCM_TOKEN_MAX_FAILURES = 5
+# Quarantined tokens not re-registered within this many days are deleted
+FCM_TOKEN_QUARANTINE_DAYS = 7
+# Delete tokens not re-registered for this many days (None: never)
+FCM_TOKEN_STALE_DAYS = None
+
+# `?since=` delta sync (see admin_dashboard/sync.py): rows changed this long
+# before the newest change a client has seen are sent again, to cover late commits
+SYNC_OVERLAP_SECONDS = 60
+# How long deleted orders are remembered; older `since` values get a full sync
+SYNC_TOMBSTONE_DAYS = 30
+
+# Dashboard statistics are cached for at most this many seconds (see admin_dashboard/stats.py)
+STATS_CACHE_TIMEOUT = 300
+
+# Deal scheduler (see admin_dashboard/tasks.py): 'thread' runs it inside each
+# web process, 'command' leaves it to `python manage.py run_deal_scheduler`
+DEAL_SCHEDULER = 'thread'
+# Longest sleep between runs; bounds how late deals edited in another process are applied
+DEAL_SCHEDULER_MAX_SLEEP = 300
+# Longest a cached /api/deals/active/ response is served (stock counts can change without signals)
+DEAL_CACHE_MAX_AGE = 60
+# Base URL for image URLs in cached /api/deals/active/ responses, e.g. 'https://shop.example.com/';
+# None builds them from each request's host, caching a response for at most DEAL_CACHE_MAX_HOSTS hosts
+DEAL_CACHE_BASE_URL = None
+DEAL_CACHE_MAX_HOSTS = 8
+# Cached /api/products/<id>/details/ payloads expire after this many seconds (see admin_dashboard/product_cache.py)
+PRODUCT_CACHE_TIMEOUT = 300
+# Cached review star histograms expire after this many seconds (see admin_dashboard/reviews.py)
+REVIEW_HISTOGRAM_CACHE_TIMEOUT = 3600
+
+# Resized WebP/JPEG copies of uploaded images (see admin_dashboard/images.py).
+# Widths bound the longer side; 0 workers generates them inline on upload.
+IMAGE_DERIVATIVE_WIDTHS = (160, 480, 1080)
+IMAGE_DERIVATIVE_WORKERS = 2
+# Product images are stored by content hash under MEDIA_URL + 'products/content/'
+# (see admin_dashboard/storage.py). Those URLs never change content, so the web
+# server in front of MEDIA_ROOT should send them with
+# "Cache-Control: public, max-age=31536000, immutable".
+
 # For production, specify allowed origins:
 # CORS_ALLOWED_ORIGINS = [
 #     "http://localhost:3000",
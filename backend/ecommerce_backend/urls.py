@@ -1,6 +1,8 @@
 
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.auth import views as auth_views
 from django.shortcuts import redirect
 from admin_dashboard.admin_views import AdminLoginView
@@ -9,6 +11,7 @@ from admin_dashboard.views import category_list_api, product_list_api, active_de
 from django.conf import settings
 from django.conf.urls.static import static
 from admin_dashboard import views as admin_views
+from admin_dashboard.storage import CONTENT_PREFIX
 
 # Initialize the custom admin site
 admin.site = CustomAdminSite()
@@ -21,7 +24,10 @@ urlpatterns = [
     # Add api prefix to match frontend expectations
     path('api/categories/', category_list_api, name='categories'),
     path('api/products/', product_list_api, name='product-list'),
+    path('api/products/search/', admin_views.product_search_api, name='product-search'),
     path('api/deals/active/', active_deals_api, name='active-deals'),
+    path('api/deals/active/stats/', admin_views.deal_cache_stats_api, name='active-deals-stats'),
+    path('api/db/pool/stats/', admin_views.db_pool_stats_api, name='db-pool-stats'),
     path('api/orders/list/', admin_views.order_list_api, name='order-list'),
     path('api/orders/create/', admin_views.create_user_order, name='create-user-order'),
     path('admin/dashboard/orders/<int:order_id>/update-status/', admin_views.update_order_status, name='update_order_status'),
@@ -41,6 +47,7 @@ urlpatterns = [
     path('api/wishlist/', admin_views.get_wishlist, name='get-wishlist'),
     path('api/wishlist/toggle/<int:product_id>/', admin_views.toggle_wishlist, name='toggle-wishlist'),
     path('api/wishlist/check/<int:product_id>/', admin_views.check_wishlist, name='check-wishlist'),
+    path('api/wishlist/contains/', admin_views.wishlist_contains, name='wishlist-contains'),
     path('api/cart/', admin_views.get_user_cart, name='get-user-cart'),
     path('api/cart/sync/', admin_views.sync_user_cart, name='sync-user-cart'),
     path('api/cart/add-item/', admin_views.add_cart_item, name='add-cart-item'),
@@ -53,7 +60,12 @@ urlpatterns = [
     path('api/products/<int:product_id>/add-test-images/', admin_views.add_test_images, name='add-test-images'),
     path('api/products/<int:product_id>/check-images/', admin_views.check_product_images, name='check-product-images'),
     path('api/orders/status-updates/', admin_views.order_status_updates, name='order_status_updates'),
+    path('api/orders/status-stream/', admin_views.order_status_stream, name='order_status_stream'),
 ]
 
 if settings.DEBUG:
+    # Content-addressed images are immutable and get far-future cache headers
+    urlpatterns += [
+        re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}{CONTENT_PREFIX}/(?P<path>.*)$', admin_views.serve_content_media),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
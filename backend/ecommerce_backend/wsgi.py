@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce_backend.settings')
 
 application = get_wsgi_application()
+
+# Flip deal prices at their start/end times (admin_dashboard/tasks.py)
+# and deliver queued push notifications (admin_dashboard/push.py)
+from admin_dashboard.push import start_push_dispatcher  # noqa: E402
+from admin_dashboard.tasks import start_deal_scheduler  # noqa: E402
+
+start_deal_scheduler()
+start_push_dispatcher()
@@ -1,6 +1,5 @@
 import 'package:flutter/material.dart';
 import 'dart:convert';
-import 'dart:async';
 import '../services/api_service.dart';
 import '../models/order.dart';
 import 'notifications_provider.dart';
@@ -10,8 +9,14 @@ class OrdersProvider with ChangeNotifier {
   List<Order> _orders = [];
   bool _isLoading = false;
   String? _error;
-  Timer? _pollingTimer;
-  final Duration _pollingInterval = const Duration(seconds: 30);
+  // Long-poll loop state: bumping the generation stops a running loop
+  int _streamGeneration = 0;
+  bool _isStreaming = false;
+  String? _statusCursor;
+  // next_since of the last /api/orders/status-updates/ response, for
+  // catching up with ?since= after a resync
+  String? _statusSince;
+  final Duration _retryDelay = const Duration(seconds: 5);
   BuildContext? _context;
   
   List<Order> get orders => [..._orders];
@@ -91,30 +96,82 @@ class OrdersProvider with ChangeNotifier {
   }
   
   void startOrderStatusPolling() {
-    print('Starting order status polling...');
-    
-    // Cancel existing timer if any
-    _pollingTimer?.cancel();
-    
-    // Start new polling timer
-    _pollingTimer = Timer.periodic(_pollingInterval, (_) {
-      print('Polling for order status updates...');
-      _checkOrderStatusUpdates();
-    });
+    if (_isStreaming) return;
+    print('Starting order status stream...');
+    _isStreaming = true;
+    _listenForStatusChanges(++_streamGeneration);
   }
   
   void stopOrderStatusPolling() {
-    print('Stopping order status polling...');
-    _pollingTimer?.cancel();
-    _pollingTimer = null;
+    print('Stopping order status stream...');
+    _isStreaming = false;
+    _streamGeneration++;
   }
   
-  Future<void> _checkOrderStatusUpdates() async {
+  // Long-polls /api/orders/status-stream/, which only answers once one of
+  // the user's orders changes status (or after ~25s with no events)
+  Future<void> _listenForStatusChanges(int generation) async {
+    while (generation == _streamGeneration) {
+      try {
+        if (_statusCursor == null) {
+          // Take a stream cursor before catching up, so changes made while
+          // the orders are fetched are still reported by the stream
+          final cursorResponse = await ApiService.get('/api/orders/status-stream/');
+          if (generation != _streamGeneration) return;
+          if (cursorResponse.statusCode != 200) {
+            await Future.delayed(_retryDelay);
+            continue;
+          }
+          final cursor = json.decode(cursorResponse.body)['cursor'];
+          final caughtUp = _statusSince == null
+              ? await _checkOrderStatusUpdates()
+              : await _fetchStatusChangesSince();
+          if (!caughtUp) {
+            await Future.delayed(_retryDelay);
+            continue;
+          }
+          _statusCursor = cursor;
+        }
+        
+        final response = await ApiService.get(
+          '/api/orders/status-stream/?since=${Uri.encodeQueryComponent(_statusCursor!)}',
+        );
+        if (generation != _streamGeneration) return;
+        
+        if (response.statusCode != 200) {
+          await Future.delayed(_retryDelay);
+          continue;
+        }
+        
+        final data = json.decode(response.body);
+        if (data['resync'] == true) {
+          // Events may have been missed (e.g. the server restarted)
+          _statusCursor = null;
+          await Future.delayed(_retryDelay);
+          continue;
+        }
+        
+        _statusCursor = data['cursor'];
+        final List<dynamic> events = data['events'] ?? [];
+        if (events.isNotEmpty) {
+          for (var event in events) {
+            _applyOrderUpdate(Order.fromJson(event['order']));
+          }
+          _orders.sort((a, b) => b.orderDate.compareTo(a.orderDate));
+          notifyListeners();
+        }
+      } catch (e) {
+        print('Error waiting for order status updates: $e');
+        await Future.delayed(_retryDelay);
+      }
+    }
+  }
+  
+  // Full fetch of the user's order statuses; returns whether it succeeded
+  Future<bool> _checkOrderStatusUpdates() async {
     try {
-      // Only check for updates if we have orders
       if (_orders.isEmpty) {
         await fetchOrders();
-        return;
       }
       
       final response = await ApiService.get('/api/orders/status-updates/');
@@ -125,47 +182,92 @@ class OrdersProvider with ChangeNotifier {
         
         // Check for status changes
         for (var updatedOrderData in updatedOrdersData) {
-          final updatedOrder = Order.fromJson(updatedOrderData);
-          final existingOrderIndex = _orders.indexWhere((o) => o.id == updatedOrder.id);
-          
-          if (existingOrderIndex != -1) {
-            final existingOrder = _orders[existingOrderIndex];
-            
-            // Check if status has changed
-            if (existingOrder.status != updatedOrder.status) {
-              print('Order ${updatedOrder.id} status changed from ${existingOrder.status} to ${updatedOrder.status}');
-              
-              // Update the order in our list
-              _orders[existingOrderIndex] = updatedOrder;
-              
-              // Create a notification for the status change
-              if (_context != null) {
-                final notificationsProvider = Provider.of<NotificationsProvider>(
-                  _context!,
-                  listen: false,
-                );
-                
-                notificationsProvider.addLocalNotification(
-                  title: 'Order Status Update',
-                  message: 'Your order #${updatedOrder.orderNumber} has been ${_getStatusMessage(updatedOrder.status)}',
-                  orderId: updatedOrder.id,
-                );
-              }
-            }
-          } else {
-            // New order, add it to the list
-            _orders.add(updatedOrder);
-          }
+          _applyOrderUpdate(Order.fromJson(updatedOrderData));
         }
+        _statusSince = data['next_since'];
         
         // Sort orders by date (newest first)
         _orders.sort((a, b) => b.orderDate.compareTo(a.orderDate));
         
         notifyListeners();
+        return true;
       }
     } catch (e) {
       print('Error checking order status updates: $e');
     }
+    return false;
+  }
+  
+  // Fetches only the orders changed since the last fetch (see next_since);
+  // returns whether it succeeded
+  Future<bool> _fetchStatusChangesSince() async {
+    try {
+      final response = await ApiService.get(
+        '/api/orders/status-updates/?since=${Uri.encodeQueryComponent(_statusSince!)}',
+      );
+      if (response.statusCode == 400) {
+        // The server no longer accepts this cursor; start over with a full fetch
+        _statusSince = null;
+        return false;
+      }
+      if (response.statusCode != 200) return false;
+      
+      final data = json.decode(response.body);
+      final List<dynamic> updatedOrdersData = data['orders'] ?? [];
+      final List<dynamic> deleted = data['deleted'] ?? [];
+      for (var updatedOrderData in updatedOrdersData) {
+        _applyOrderUpdate(Order.fromJson(updatedOrderData));
+      }
+      if (data['full'] == true) {
+        // The cursor was too old for a delta; this is every order the user has
+        final ids = updatedOrdersData.map((o) => o['id'].toString()).toSet();
+        _orders.removeWhere((o) => !ids.contains(o.id));
+      }
+      _orders.removeWhere((o) => deleted.contains(o.id));
+      _statusSince = data['next_since'];
+      
+      if (updatedOrdersData.isNotEmpty || deleted.isNotEmpty) {
+        _orders.sort((a, b) => b.orderDate.compareTo(a.orderDate));
+        notifyListeners();
+      }
+      return true;
+    } catch (e) {
+      print('Error fetching order status changes: $e');
+      return false;
+    }
+  }
+  
+  void _applyOrderUpdate(Order updatedOrder) {
+    final existingOrderIndex = _orders.indexWhere((o) => o.id == updatedOrder.id);
+    
+    if (existingOrderIndex != -1) {
+      final existingOrder = _orders[existingOrderIndex];
+      
+      // Check if status has changed
+      if (existingOrder.status != updatedOrder.status) {
+        print('Order ${updatedOrder.id} status changed from ${existingOrder.status} to ${updatedOrder.status}');
+        
+        // Update the order in our list
+        _orders[existingOrderIndex] = updatedOrder;
+        
+        // Create a notification for the status change
+        if (_context != null) {
+          final notificationsProvider = Provider.of<NotificationsProvider>(
+            _context!,
+            listen: false,
+          );
+          
+          notificationsProvider.addLocalNotification(
+            title: 'Order Status Update',
+            message: 'Your order #${updatedOrder.orderNumber} has been ${_getStatusMessage(updatedOrder.status)}',
+            orderId: updatedOrder.id,
+          );
+        }
+      }
+    } else {
+      // New order, add it to the list
+      _orders.add(updatedOrder);
+    }
   }
   
   String _getStatusMessage(String status) {
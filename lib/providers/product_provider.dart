@@ -137,22 +137,21 @@ class ProductProvider with ChangeNotifier {
     notifyListeners();
 
     try {
-      // If we already have products loaded, we can filter them locally
-      if (_products.isNotEmpty) {
-        _searchResults = _products.where((product) {
-          final titleMatch = product.title.toLowerCase().contains(query.toLowerCase());
-          final categoryMatch = product.category.name.toLowerCase().contains(query.toLowerCase());
-          final descriptionMatch = product.description.toLowerCase().contains(query.toLowerCase());
-          return titleMatch || categoryMatch || descriptionMatch;
-        }).toList();
-        _isSearching = false;
-        notifyListeners();
+      // Search runs on the server so the full catalog is never downloaded;
+      // like the old local filter it matches title, description and category
+      final response = await ApiService.get(
+          '/api/products/search/?q=${Uri.encodeQueryComponent(query.trim())}');
+
+      if (response.statusCode == 200) {
+        final data = json.decode(response.body);
+        _searchResults = (data['products'] as List)
+            .map((item) => Product.fromJson(item))
+            .toList();
       } else {
-        // If products aren't loaded yet, fetch them first
-        await fetchProducts();
-        // Then perform the search
-        searchProducts(query);
+        throw Exception('Search failed. Status: ${response.statusCode}');
       }
+      _isSearching = false;
+      notifyListeners();
     } catch (error) {
       _error = 'Search failed: ${error.toString()}';
       _isSearching = false;
@@ -4,6 +4,8 @@ import '../models/product.dart';
 
 class WishlistProvider with ChangeNotifier {
   List<Product> _items = [];
+  // Ids of wishlisted products, also for products not loaded into _items
+  final Set<String> _ids = {};
   bool _isLoading = false;
   String? _error;
 
@@ -22,6 +24,9 @@ class WishlistProvider with ChangeNotifier {
     try {
       final wishlistItems = await ApiService.getWishlist();
       _items = wishlistItems;
+      _ids
+        ..clear()
+        ..addAll(wishlistItems.map((item) => item.id));
       _error = null;
     } catch (e) {
       _error = 'Error fetching wishlist: $e';
@@ -40,8 +45,10 @@ class WishlistProvider with ChangeNotifier {
         if (!_items.any((item) => item.id == productId)) {
           _items.add(product);
         }
+        _ids.add(productId);
       } else {
         _items.removeWhere((item) => item.id == productId);
+        _ids.remove(productId);
       }
       
       notifyListeners();
@@ -50,8 +57,23 @@ class WishlistProvider with ChangeNotifier {
     }
   }
 
+  // Refresh the wishlist status of just these products, in one request
+  Future<void> checkWishlistStatus(List<String> productIds) async {
+    final inWishlist = await ApiService.checkWishlistIds(productIds);
+    if (inWishlist == null) return;
+
+    for (final productId in productIds) {
+      if (inWishlist.contains(productId)) {
+        _ids.add(productId);
+      } else {
+        _ids.remove(productId);
+      }
+    }
+    notifyListeners();
+  }
+
   bool isInWishlist(String productId) {
-    return _items.any((item) => item.id == productId);
+    return _ids.contains(productId);
   }
 
   // clearWishlist method removed
@@ -489,7 +489,8 @@ class _ProductDetailScreenState extends State<ProductDetailScreen> {
     
     try {
       final wishlistProvider = Provider.of<WishlistProvider>(context, listen: false);
-      await wishlistProvider.fetchWishlist();
+      // Only this product's status, rather than loading the whole wishlist
+      await wishlistProvider.checkWishlistStatus([widget.product.id]);
       
       if (mounted) {
         setState(() {
@@ -779,6 +779,32 @@ class ApiService {
     }
   }
 
+  // Wishlist membership for a whole page of products in one request;
+  // null if it could not be checked
+  static Future<Set<String>?> checkWishlistIds(List<String> productIds) async {
+    if (productIds.isEmpty) return {};
+    try {
+      final headers = await getAuthHeaders();
+      final response = await http.get(
+        Uri.parse('$baseUrl/api/wishlist/contains/?ids=${productIds.join(',')}'),
+        headers: headers,
+      );
+
+      if (response.statusCode == 200) {
+        final Map<String, dynamic> inWishlist = json.decode(response.body)['in_wishlist'];
+        return inWishlist.entries
+            .where((entry) => entry.value == true)
+            .map((entry) => entry.key)
+            .toSet();
+      } else {
+        return null;
+      }
+    } catch (e) {
+      print('Error checking wishlist: $e');
+      return null;
+    }
+  }
+
   // clearWishlist method removed
 
   static Future<bool> updateFCMToken(String token) async {